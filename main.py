@@ -1,31 +1,83 @@
+import functools
 import json
 
+import src.dedupe as dedupe
+import src.handle_drain_outbox as handle_drain
 import src.handle_email_queue as handle_email
 import src.handle_flush_gradescope as handle_flush
 import src.handle_form_submit as handle_form
 from src.errors import KnownError
 from src.slack import SlackManager
+from src.sqlite_backend import is_local_spreadsheet_url
 from src.utils import Environment, truncate
 
 
+def request_scoped(handler):
+    """
+    Runs each request in its own context (see Environment.run), so one instance can serve several requests at once.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(request):
+        # Local SQLite spreadsheets are for tools running in-process (tests, benchmarks), never for HTTP callers.
+        request_json = request.get_json()
+        if isinstance(request_json, dict) and is_local_spreadsheet_url(request_json.get("spreadsheet_url")):
+            print(f"Rejected request for a local spreadsheet: {request_json['spreadsheet_url']}")
+            return {"success": False, "error": "spreadsheet_url must be a Google Sheets URL."}
+        return Environment.run(handler, request)
+
+    return wrapper
+
+
+def send_error(error: str):
+    # Errors can only be reported to Slack once the course's configuration has been loaded.
+    config = Environment.get_config()
+    if config is None:
+        print("Could not report error to Slack (configuration not loaded): " + error)
+        return
+    SlackManager(config=config).send_error(error)
+
+
+@request_scoped
 def handle_email_queue(request):
     request_json = request.get_json()
     print("handle_email_queue called on payload: " + json.dumps(request_json))
     try:
-        handle_email.handle_email_queue(request_json=request_json)
-        return {"success": True}
+        # If the queue couldn't be drained in time, the result's remaining count is nonzero; call again to carry on.
+        result = handle_email.handle_email_queue(request_json=request_json)
+        return {"success": True, **result}
     except KnownError as e:
         print("Known Error Occurred: " + str(e) + f" (Request: {request_json})")
-        SlackManager().send_error(str(e) + f" (Request: {truncate(request_json)})")
+        send_error(str(e) + f" (Request: {truncate(request_json)})")
         return {"success": False, "error": str(e)}
     except Exception as e:
         print("Internal Error Occurred: " + str(e) + f" (Request: {request_json})")
-        SlackManager().send_error("Internal error: " + str(e) + f" (Request: {truncate(request_json)})")
+        send_error("Internal error: " + str(e) + f" (Request: {truncate(request_json)})")
         raise
     finally:
         Environment.clear()
 
 
+@request_scoped
+def handle_drain_outbox(request):
+    request_json = request.get_json()
+    print("handle_drain_outbox called on payload: " + json.dumps(request_json))
+    try:
+        result = handle_drain.handle_drain_outbox(request_json=request_json)
+        return {"success": True, **result}
+    except KnownError as e:
+        print("Known Error Occurred: " + str(e) + f" (Request: {request_json})")
+        send_error(str(e) + f" (Request: {truncate(request_json)})")
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        print("Internal Error Occurred: " + str(e) + f" (Request: {request_json})")
+        send_error("Internal error: " + str(e) + f" (Request: {truncate(request_json)})")
+        raise
+    finally:
+        Environment.clear()
+
+
+@request_scoped
 def handle_flush_gradescope(request):
     request_json = request.get_json()
     print("handle_flush_gradescope called on payload: " + json.dumps(request_json))
@@ -34,29 +86,67 @@ def handle_flush_gradescope(request):
         return {"success": True}
     except KnownError as e:
         print("Known Error Occurred: " + str(e) + f" (Request: {request_json})")
-        SlackManager().send_error(str(e) + f" (Request: {truncate(request_json)})")
+        send_error(str(e) + f" (Request: {truncate(request_json)})")
         return {"success": False, "error": str(e)}
     except Exception as e:
         print("Internal Error Occurred: " + str(e) + f" (Request: {request_json})")
-        SlackManager().send_error("Internal error: " + str(e) + f" (Request: {truncate(request_json)})")
+        send_error("Internal error: " + str(e) + f" (Request: {truncate(request_json)})")
         raise
     finally:
         Environment.clear()
 
 
+@request_scoped
 def handle_form_submit(request):
     request_json = request.get_json()
     print("handle_form_submit called on payload: " + json.dumps(request_json))
+
+    # Apps Script retries submissions that time out; don't process (and email/Slack about) the same one twice.
+    key = dedupe.get_submission_key(request_json)
+    result = dedupe.DEDUPE_STORE.claim(key)
+    if result is dedupe.PENDING_RESULT:
+        print("Duplicate submission, still being processed; asking the caller to retry.")
+        return result, dedupe.PENDING_STATUS_CODE
+    if result is not None:
+        print(f"Duplicate submission; returning the original result: {result}")
+        return result
+
     try:
         handle_form.handle_form_submit(request_json=request_json)
+        dedupe.DEDUPE_STORE.complete(key, {"success": True})
         return {"success": True}
+    except KnownError as e:
+        # Most known errors (e.g. a malformed submission) would fail the same way again, so retries get this result.
+        if isinstance(e, dedupe.TRANSIENT_ERRORS):
+            dedupe.DEDUPE_STORE.release(key)
+        else:
+            dedupe.DEDUPE_STORE.complete(key, {"success": False, "error": str(e)})
+        print("Known Error Occurred: " + str(e) + f" (Request: {request_json})")
+        send_error(str(e) + f" (Request: {truncate(request_json)})")
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        dedupe.DEDUPE_STORE.release(key)
+        print("Internal Error Occurred: " + str(e) + f" (Request: {request_json})")
+        send_error("Internal error: " + str(e) + f" (Request: {truncate(request_json)})")
+        raise
+    finally:
+        Environment.clear()
+
+
+@request_scoped
+def handle_form_submit_batch(request):
+    request_json = request.get_json()
+    print("handle_form_submit_batch called on payload: " + json.dumps(request_json))
+    try:
+        results = handle_form.handle_form_submit_batch(request_json=request_json)
+        return {"success": True, "results": results}
     except KnownError as e:
         print("Known Error Occurred: " + str(e) + f" (Request: {request_json})")
-        SlackManager().send_error(str(e) + f" (Request: {truncate(request_json)})")
+        send_error(str(e) + f" (Request: {truncate(request_json)})")
         return {"success": False, "error": str(e)}
     except Exception as e:
         print("Internal Error Occurred: " + str(e) + f" (Request: {request_json})")
-        SlackManager().send_error("Internal error: " + str(e) + f" (Request: {truncate(request_json)})")
+        send_error("Internal error: " + str(e) + f" (Request: {truncate(request_json)})")
         raise
     finally:
         Environment.clear()
@@ -1,12 +1,13 @@
+from __future__ import annotations
+
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple, Union
 
-from dateutil import parser
 from pytz import timezone
 
 from src.errors import ConfigurationError
 from src.sheets import Sheet
-from src.utils import cast_bool, cast_date, cast_list_str
+from src.utils import cast_bool, cast_date, cast_list_str, parse_timestamp
 
 PST = timezone("US/Pacific")
 
@@ -32,7 +33,7 @@ class Assignment:
         self.partner = partner
         self.gradescope = gradescope
 
-    def is_past_due(self, request_time: str):
+    def is_past_due(self, request_time: Union[str, datetime]):
         """
         Return true if this extension request was submitted after an assignment was due.
         """
@@ -41,7 +42,8 @@ class Assignment:
         if not self.due_date:
             return False
 
-        request_time: datetime = parser.parse(request_time)
+        if not isinstance(request_time, datetime):
+            request_time = parse_timestamp(request_time)
         if request_time.tzinfo is None:
             request_time = PST.localize(request_time)
         if request_time > self.due_date:
@@ -91,21 +93,49 @@ class AssignmentList:
 
         self.assignments = assignments
 
+        # Lookups by id and name; like a top-to-bottom scan, the first assignment with a given id or name wins.
+        self.ids = [assignment.id for assignment in assignments]
+        self.by_id: Dict[str, Assignment] = {}
+        self.by_name: Dict[str, Assignment] = {}
+        for assignment in assignments:
+            self.by_id.setdefault(assignment.id, assignment)
+            self.by_name.setdefault(assignment.name, assignment)
+
+        # The roster column of each assignment, for the last roster header map we were asked about.
+        self.roster_columns: Optional[Tuple[Dict[str, int], List[Optional[int]]]] = None
+
+    @staticmethod
+    def from_sheet(sheet: Sheet) -> AssignmentList:
+        """
+        Parses the "Assignments" sheet once per loaded sheet; cached sheets reuse the parsed list across invocations.
+        """
+        return sheet.memoize("assignments", lambda: AssignmentList(sheet=sheet))
+
     def __iter__(self):
         for a in self.assignments:
             yield a
 
     def get_all_ids(self) -> List[str]:
-        return [a.id for a in self.assignments]
+        return self.ids
 
     def from_id(self, id: str) -> Assignment:
-        for assignment in self.assignments:
-            if assignment.id == id:
-                return assignment
-        raise ConfigurationError(f"Assignment with ID {id} not found.")
+        if id not in self.by_id:
+            raise ConfigurationError(f"Assignment with ID {id} not found.")
+        return self.by_id[id]
 
     def from_name(self, name: str) -> Assignment:
-        for assignment in self.assignments:
-            if assignment.name == name:
-                return assignment
-        raise ConfigurationError(f"Assignment with name {name} not found.")
+        if name not in self.by_name:
+            raise ConfigurationError(f"Assignment with name {name} not found.")
+        return self.by_name[name]
+
+    def get_roster_columns(self, columns: Dict[str, int]) -> List[Optional[int]]:
+        """
+        Returns the column index of each assignment in a roster, given the roster's header -> column map (None for
+        assignments without a column). This is computed once per loaded roster, so records can read every assignment
+        by position.
+        """
+        cached = self.roster_columns
+        if cached is None or cached[0] is not columns:
+            cached = (columns, [columns.get(assignment.id) for assignment in self.assignments])
+            self.roster_columns = cached
+        return cached[1]
@@ -0,0 +1,242 @@
+import os
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+import gspread
+from cachetools import TTLCache
+from google.auth.transport.requests import Request
+from gspread.exceptions import APIError
+from gspread.spreadsheet import Spreadsheet
+from gspread.urls import DRIVE_FILES_API_V3_URL
+from gspread.utils import a1_to_rowcol, absolute_range_name, extract_id_from_url, fill_gaps, rowcol_to_a1
+from gspread.worksheet import Worksheet
+
+from src.errors import SheetError
+from src.quota import QUOTA_REGISTRY, QuotaLimiter
+
+SERVICE_ACCOUNT_PATH = "service-account.json"
+
+# Opened spreadsheet handles are reused for a while, then re-opened to pick up renamed/added tabs.
+SPREADSHEET_HANDLE_TTL_SECONDS = 3600
+SPREADSHEET_HANDLE_MAX_ENTRIES = 32
+
+
+def format_cell_value(value: Any) -> str:
+    """
+    Formats a value the way Sheets displays it, so we can tell whether a write would change a cell.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    return str(value)
+
+
+class SheetBackend:
+    """
+    Storage for one tab. Rows and columns are one-indexed grid coordinates (the header is row 1), like gspread.
+    """
+
+    title: str
+
+    def get_all_values(self) -> List[List[Any]]:
+        raise NotImplementedError
+
+    def get_column(self, col: int) -> List[Any]:
+        """
+        Returns one column, including the header, without trailing blank cells.
+        """
+        raise NotImplementedError
+
+    def get_row_ranges(self, spans: List[Tuple[int, int]]) -> List[List[List[Any]]]:
+        """
+        Returns the values of each span of rows, given as (first row, last row).
+        """
+        raise NotImplementedError
+
+    def update_ranges(self, blocks: List[Tuple[int, int, List[List[Any]]]]) -> None:
+        """
+        Writes rectangular blocks of values, given as (top row, left col, values).
+        """
+        raise NotImplementedError
+
+    def append_rows(self, rows: List[List[Any]], value_input_option: str) -> int:
+        """
+        Appends rows after the last row with data, and returns the row number of the first appended row.
+        """
+        raise NotImplementedError
+
+    def delete_row(self, row: int) -> None:
+        raise NotImplementedError
+
+
+class SpreadsheetBackend:
+    """
+    Storage for a whole spreadsheet (e.g. a course's Google Sheet).
+    """
+
+    def get_revision(self) -> Optional[str]:
+        """
+        Returns a version that changes whenever the spreadsheet does, or None if it's unavailable.
+        """
+        raise NotImplementedError
+
+    def get_titles(self) -> List[str]:
+        """
+        Lists the names of the spreadsheet's tabs.
+        """
+        raise NotImplementedError
+
+    def get_sheet_backends(self, sheet_names: List[str]) -> Dict[str, SheetBackend]:
+        raise NotImplementedError
+
+    def batch_get_values(self, sheet_names: List[str]) -> Dict[str, List[List[Any]]]:
+        raise NotImplementedError
+
+    def get_quota_headroom(self) -> Dict[str, float]:
+        return {}
+
+
+class ClientPool:
+    """
+    Holds one authorized gspread client per process, plus opened spreadsheet handles, so warm invocations reuse the
+    service account credentials, OAuth token and keep-alive HTTP session instead of setting them up per request.
+    """
+
+    def __init__(self, service_account_path: str = SERVICE_ACCOUNT_PATH) -> None:
+        self.service_account_path = service_account_path
+        self.client: Optional[gspread.Client] = None
+        self.spreadsheets = TTLCache(maxsize=SPREADSHEET_HANDLE_MAX_ENTRIES, ttl=SPREADSHEET_HANDLE_TTL_SECONDS)
+        self.lock = Lock()
+
+    def get_client(self) -> gspread.Client:
+        with self.lock:
+            if self.client is None:
+                if not os.path.exists(self.service_account_path):
+                    raise SheetError(f"Could not find Google Service Account at {self.service_account_path}.")
+                self.client = gspread.service_account(self.service_account_path)
+
+            # Refresh ahead of time, rather than paying for a rejected request once the token expires.
+            if not self.client.auth.valid:
+                self.client.auth.refresh(Request())
+            return self.client
+
+    def open(self, spreadsheet_url: str) -> Spreadsheet:
+        client = self.get_client()
+        with self.lock:
+            spreadsheet = self.spreadsheets.get(spreadsheet_url)
+        if spreadsheet is None:
+            limiter = QUOTA_REGISTRY.get(extract_id_from_url(spreadsheet_url))
+            spreadsheet = limiter.call(client.open_by_url, spreadsheet_url)
+            with self.lock:
+                self.spreadsheets[spreadsheet_url] = spreadsheet
+        return spreadsheet
+
+    def forget(self, spreadsheet_url: str) -> None:
+        with self.lock:
+            self.spreadsheets.pop(spreadsheet_url, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.client = None
+            self.spreadsheets.clear()
+
+
+CLIENT_POOL = ClientPool()
+
+
+class GspreadSheetBackend(SheetBackend):
+    """
+    A tab of a Google Sheet. All calls go through the spreadsheet's quota limiter.
+    """
+
+    def __init__(self, worksheet: Worksheet) -> None:
+        self.worksheet = worksheet
+        self.title = worksheet.title if worksheet is not None else ""
+
+    def call(self, fn, *args, **kwargs) -> Any:
+        return QUOTA_REGISTRY.get(self.worksheet.spreadsheet.id).call(fn, *args, **kwargs)
+
+    def call_write(self, fn, *args, **kwargs) -> Any:
+        return QUOTA_REGISTRY.get(self.worksheet.spreadsheet.id).call_write(fn, *args, **kwargs)
+
+    def get_all_values(self) -> List[List[Any]]:
+        return self.call(self.worksheet.get_all_values)
+
+    def get_column(self, col: int) -> List[Any]:
+        return self.call(self.worksheet.col_values, col)
+
+    def get_row_ranges(self, spans: List[Tuple[int, int]]) -> List[List[List[Any]]]:
+        ranges = [absolute_range_name(self.title, f"{first}:{last}") for first, last in spans]
+        response = self.call(self.worksheet.spreadsheet.values_batch_get, ranges=ranges)
+        return [fill_gaps(value_range.get("values", [])) for value_range in response.get("valueRanges", [])]
+
+    def update_ranges(self, blocks: List[Tuple[int, int, List[List[Any]]]]) -> None:
+        data = []
+        for row, col, values in blocks:
+            start = rowcol_to_a1(row, col)
+            end = rowcol_to_a1(row + len(values) - 1, col + len(values[0]) - 1)
+            data.append({"range": absolute_range_name(self.title, f"{start}:{end}"), "values": values})
+        self.call(
+            self.worksheet.spreadsheet.values_batch_update, body={"valueInputOption": "USER_ENTERED", "data": data}
+        )
+
+    def append_rows(self, rows: List[List[Any]], value_input_option: str) -> int:
+        response = self.call_write(self.worksheet.append_rows, values=rows, value_input_option=value_input_option)
+
+        # Other processes may have appended rows since we loaded; the response tells us where ours actually went.
+        updated_range = response["updates"]["updatedRange"]
+        first_row, _ = a1_to_rowcol(updated_range.split("!")[-1].split(":")[0])
+        return first_row
+
+    def delete_row(self, row: int) -> None:
+        self.call_write(self.worksheet.delete_rows, row)
+
+
+class GspreadSpreadsheetBackend(SpreadsheetBackend):
+    """
+    A Google Sheet, opened through the shared client pool.
+    """
+
+    def __init__(self, spreadsheet_url: str) -> None:
+        self.spreadsheet = CLIENT_POOL.open(spreadsheet_url)
+        self.limiter: QuotaLimiter = QUOTA_REGISTRY.get(self.spreadsheet.id)
+
+    def get_revision(self) -> Optional[str]:
+        """
+        Fetches the spreadsheet's Drive version (a number that increases on every change). This is a cheap metadata
+        call, and doesn't count against the Sheets read quota.
+        """
+        try:
+            response = self.limiter.call(
+                self.spreadsheet.client.request,
+                "get",
+                f"{DRIVE_FILES_API_V3_URL}/{self.spreadsheet.id}",
+                params={"fields": "version", "supportsAllDrives": True},
+            )
+            return str(response.json()["version"])
+        except (APIError, SheetError, KeyError) as err:
+            print(f"Could not fetch spreadsheet revision: {err}")
+            return None
+
+    def get_titles(self) -> List[str]:
+        return [worksheet.title for worksheet in self.limiter.call(self.spreadsheet.worksheets)]
+
+    def get_sheet_backends(self, sheet_names: List[str]) -> Dict[str, SheetBackend]:
+        worksheets = {worksheet.title: worksheet for worksheet in self.limiter.call(self.spreadsheet.worksheets)}
+        for sheet_name in sheet_names:
+            if sheet_name not in worksheets:
+                raise SheetError(f"Could not find a sheet named {sheet_name} in the spreadsheet.")
+        return {sheet_name: GspreadSheetBackend(worksheets[sheet_name]) for sheet_name in sheet_names}
+
+    def batch_get_values(self, sheet_names: List[str]) -> Dict[str, List[List[Any]]]:
+        ranges = [absolute_range_name(sheet_name) for sheet_name in sheet_names]
+        response = self.limiter.call(self.spreadsheet.values_batch_get, ranges=ranges)
+        value_ranges = response.get("valueRanges", [])
+        return {
+            sheet_name: fill_gaps(value_range.get("values", []))
+            for sheet_name, value_range in zip(sheet_names, value_ranges)
+        }
+
+    def get_quota_headroom(self) -> Dict[str, float]:
+        return self.limiter.get_headroom()
@@ -0,0 +1,132 @@
+"""
+Measures how many emails per second the email queue handler sends with each email transport, against a local
+SQLite spreadsheet with a roster of queued students.
+
+Usage:
+    python -m src.benchmark_email [--students 200] [--transport smtp --transport spool]
+
+The smtp transport sends to an in-process SMTP server (see LocalSmtpServer), so it measures our side (pooled
+connections, rendering and MIME encoding), not a real mailserver's latency. The spool transport writes to a temporary
+directory. The rpc transport sends real emails through the CS 162 mailserver, so it's only run if asked for, and
+needs APP_MASTER_SECRET and --recipient (students are emailed at plus-addresses of it, e.g. you+1@berkeley.edu).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from src.config import EMAIL_TRANSPORT_RPC, EMAIL_TRANSPORT_SMTP, EMAIL_TRANSPORT_SPOOL, EMAIL_TRANSPORTS, PolicyConfig
+from src.handle_email_queue import handle_email_queue
+from src.record import EMAIL_STATUS_IN_QUEUE
+from src.sheets import SHEET_ASSIGNMENTS, SHEET_ENVIRONMENT_VARIABLES, SHEET_STUDENT_RECORDS
+from src.smtp_server import LocalSmtpServer
+from src.sqlite_backend import SQLITE_REGISTRY, SqliteSpreadsheetBackend
+from src.transport import get_transport
+from src.utils import Environment
+
+BENCHMARK_ENVIRONMENT = {
+    "SLACK_ENDPOINT": "https://hooks.slack.com/services/benchmark",
+    "AUTO_APPROVE_THRESHOLD": "3",
+    "AUTO_APPROVE_THRESHOLD_DSP": "7",
+    "AUTO_APPROVE_ASSIGNMENT_THRESHOLD": "3",
+    "EMAIL_FROM": "CS 161 Staff",
+    "EMAIL_REPLY_TO": "cs161@berkeley.edu",
+    "EMAIL_SUBJECT": "Extension Request",
+    "EMAIL_SIGNATURE": "CS 161 Staff",
+}
+BENCHMARK_ASSIGNMENTS = [
+    ["name", "id", "due_date", "partner", "gradescope"],
+    ["Homework 1", "hw1", "2030-01-01", "No", ""],
+    ["Project 1", "proj1", "2030-02-01", "Yes", ""],
+]
+BENCHMARK_ROSTER_HEADERS = ["email", "approval_status", "email_status", "email_comments", "hw1", "proj1"]
+
+
+def get_student_email(index: int, recipient: Optional[str] = None) -> str:
+    if recipient is None:
+        return f"student{index}@example.com"
+    local, _, domain = recipient.partition("@")
+    return f"{local}+{index}@{domain}"
+
+
+def build_spreadsheet(spreadsheet_url: str, environment: Dict[str, str], students: int, recipient: Optional[str]):
+    """
+    Registers a SQLite spreadsheet with `students` queued students under spreadsheet_url.
+    """
+    backend = SqliteSpreadsheetBackend()
+    values = {"SPREADSHEET_URL": spreadsheet_url, **environment}
+    backend.import_tab(
+        SHEET_ENVIRONMENT_VARIABLES, [["key", "value"]] + [[key, value] for key, value in values.items()]
+    )
+    backend.import_tab(SHEET_ASSIGNMENTS, BENCHMARK_ASSIGNMENTS)
+    rows = [
+        [get_student_email(i, recipient), "Approved", EMAIL_STATUS_IN_QUEUE, "", 2, 1 if i % 2 == 0 else ""]
+        for i in range(students)
+    ]
+    backend.import_tab(SHEET_STUDENT_RECORDS, [BENCHMARK_ROSTER_HEADERS] + rows)
+    SQLITE_REGISTRY.register(spreadsheet_url, backend)
+
+
+def run(transport: str, students: int, recipient: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Drains a queue of `students` emails through handle_email_queue with the given transport, and reports the
+    throughput.
+    """
+    with contextlib.ExitStack() as stack:
+        environment = {**BENCHMARK_ENVIRONMENT, "EMAIL_TRANSPORT": transport}
+        if transport == EMAIL_TRANSPORT_SMTP:
+            server = stack.enter_context(LocalSmtpServer())
+            environment.update({"SMTP_HOST": server.host, "SMTP_PORT": str(server.port), "SMTP_SSL": "No"})
+        elif transport == EMAIL_TRANSPORT_SPOOL:
+            environment["EMAIL_SPOOL_DIR"] = stack.enter_context(tempfile.TemporaryDirectory())
+
+        spreadsheet_url = f"sqlite://benchmark-{transport}-{time.time_ns()}"
+        build_spreadsheet(spreadsheet_url, environment, students, recipient)
+        request = {"spreadsheet_url": spreadsheet_url, "time_budget_seconds": 24 * 3600, "silent": True}
+
+        # Handlers print as they go; keep the report readable. Like main.py, run the handler in its own context, so
+        # its config doesn't outlive the call.
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            result = Environment.run(handle_email_queue, request)
+            elapsed = time.perf_counter() - started
+
+        get_transport(PolicyConfig.from_values({**environment, "SPREADSHEET_URL": spreadsheet_url})).close()
+        return {
+            "transport": transport,
+            "students": students,
+            "sent": result["sent"],
+            "elapsed_seconds": round(elapsed, 4),
+            "messages_per_second": round(result["sent"] / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the email queue handler with each email transport.")
+    parser.add_argument("--students", type=int, default=200, help="how many queued emails to send")
+    parser.add_argument(
+        "--transport",
+        action="append",
+        choices=EMAIL_TRANSPORTS,
+        help="a transport to benchmark (default: smtp and spool)",
+    )
+    parser.add_argument("--recipient", help="the address to send to with the rpc transport")
+    options = parser.parse_args(args)
+
+    transports = options.transport or [EMAIL_TRANSPORT_SMTP, EMAIL_TRANSPORT_SPOOL]
+    if EMAIL_TRANSPORT_RPC in transports and not options.recipient:
+        parser.error("the rpc transport sends real emails, so it needs --recipient")
+
+    results = []
+    for transport in transports:
+        recipient = options.recipient if transport == EMAIL_TRANSPORT_RPC else None
+        results.append(run(transport, options.students, recipient=recipient))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+from threading import Lock
+from typing import Any, Hashable, Optional
+
+from cachetools import TTLCache
+
+# Configuration tabs rarely change, so entries may live for a while; the revision check below catches edits early.
+CONFIG_CACHE_TTL_SECONDS = 600
+CONFIG_CACHE_MAX_ENTRIES = 128
+
+
+class CacheEntry:
+    """
+    A cached value, tagged with the spreadsheet revision it was loaded at.
+    """
+
+    def __init__(self, revision: str, value: Any) -> None:
+        self.revision = revision
+        self.value = value
+
+
+class ConfigCache:
+    """
+    A process-level cache for course configuration (e.g. the Assignments, Form Questions and Environment Variables
+    tabs), keyed by spreadsheet URL and tab. Each course has its own (see Tenant), and warm Cloud Function instances
+    reuse entries across invocations.
+
+    An entry is only served while the spreadsheet's revision matches the revision it was loaded at. Entries also
+    expire after a TTL, and the least recently used entries are evicted once the cache is full.
+    """
+
+    def __init__(self, maxsize: int = CONFIG_CACHE_MAX_ENTRIES, ttl: int = CONFIG_CACHE_TTL_SECONDS) -> None:
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock = Lock()
+
+    def get(self, spreadsheet_url: str, key: Hashable, revision: str) -> Optional[Any]:
+        with self.lock:
+            entry: Optional[CacheEntry] = self.entries.get((spreadsheet_url, key))
+        if entry is None or entry.revision != revision:
+            return None
+        return entry.value
+
+    def put(self, spreadsheet_url: str, key: Hashable, revision: str, value: Any) -> None:
+        with self.lock:
+            self.entries[(spreadsheet_url, key)] = CacheEntry(revision=revision, value=value)
+
+    def restamp(self, spreadsheet_url: str, old_revision: str, new_revision: str) -> None:
+        """
+        Marks entries loaded at old_revision as still valid at new_revision. Only call this when nothing but our own
+        roster writes (which don't touch configuration) happened in between; see BaseSpreadsheet.refresh_cache_revision.
+        """
+        with self.lock:
+            for (url, _), entry in list(self.entries.items()):
+                if url == spreadsheet_url and entry.revision == old_revision:
+                    entry.revision = new_revision
+
+    def invalidate(self, spreadsheet_url: str) -> None:
+        """
+        Drops every entry for a spreadsheet, e.g. when someone else may have edited it.
+        """
+        with self.lock:
+            for key in [key for key in self.entries.keys() if key[0] == spreadsheet_url]:
+                del self.entries[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,157 @@
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import dotenv_values
+
+from src.errors import ConfigurationError, KnownError
+from src.sheets import Sheet
+from src.utils import cast_bool, cast_list_str
+
+# Local overrides for debugging; these take precedence over the sheet.
+LOCAL_ENV_PATH = ".env-pytest"
+ENV_APP_MASTER_SECRET = "APP_MASTER_SECRET"
+
+# How emails are sent (EMAIL_TRANSPORT): over SMTP, through the CS 162 mailserver's RPC interface, or written to a
+# local spool directory (for testing).
+EMAIL_TRANSPORT_SMTP = "smtp"
+EMAIL_TRANSPORT_RPC = "rpc"
+EMAIL_TRANSPORT_SPOOL = "spool"
+EMAIL_TRANSPORTS = [EMAIL_TRANSPORT_SMTP, EMAIL_TRANSPORT_RPC, EMAIL_TRANSPORT_SPOOL]
+
+
+@dataclass(frozen=True)
+class PolicyConfig:
+    """
+    A course's configuration, parsed and validated once from the "Environment Variables" sheet. Handlers build it up
+    front (so a misconfigured course fails before any roster writes or emails), and pass it explicitly to Policy,
+    SlackManager, Email and Gradescope. It's immutable, so it's safe to cache and share across warm invocations.
+    """
+
+    spreadsheet_url: str
+    slack_endpoint: str
+    slack_endpoint_debug: Optional[str]
+    slack_tags: Tuple[str, ...]
+
+    auto_approve_threshold: int
+    auto_approve_threshold_dsp: int
+    auto_approve_assignment_threshold: int
+
+    # If this number is -1, then assume this flag is disabled.
+    # If this number is 0, then reject all extensions.
+    # If this number is > 0, then reject extensions if the total number of extensions requested exceeds this number.
+    max_total_requested_extensions_threshold: int
+
+    email_from: str
+    email_reply_to: str
+    email_subject: str
+    email_signature: str
+    email_cc: Tuple[str, ...]
+
+    extend_gradescope_assignments: bool
+    gradescope_email: Optional[str]
+    gradescope_password: Optional[str]
+
+    # Email delivery. Without SMTP_HOST, the smtp transport uses the built-in server.
+    email_transport: str = EMAIL_TRANSPORT_SMTP
+    smtp_host: Optional[str] = None
+    smtp_port: int = 465
+    smtp_username: Optional[str] = None
+    smtp_password: Optional[str] = None
+    smtp_ssl: bool = True
+    email_spool_dir: Optional[str] = None
+    email_sender: Optional[str] = None
+
+    @staticmethod
+    def from_sheet(sheet: Sheet) -> "PolicyConfig":
+        """
+        Reads the "Environment Variables" sheet, which has two columns: a "key" column, and a "value" column. The
+        result is memoized on the sheet, so cached sheets don't re-parse it.
+        """
+        return sheet.memoize("policy_config", lambda: PolicyConfig.from_records(sheet.get_all_records()))
+
+    @staticmethod
+    def from_records(records: List[Dict[str, Any]]) -> "PolicyConfig":
+        values: Dict[str, str] = {}
+        for record in records:
+            key = record.get("key")
+            if not key:
+                continue
+            value = record.get("value")
+            values[str(key)] = "" if value is None else str(value).strip()
+
+        # Load local environment variables now from .env, which override remote provided variables for debugging
+        if os.path.exists(LOCAL_ENV_PATH):
+            for key, value in dotenv_values(LOCAL_ENV_PATH).items():
+                if key == ENV_APP_MASTER_SECRET:
+                    os.environ[key] = value
+                else:
+                    values[key] = value
+
+        return PolicyConfig.from_values(values)
+
+    @staticmethod
+    def from_values(values: Dict[str, str]) -> "PolicyConfig":
+        """
+        Builds a config from raw key/value strings, reporting every missing or malformed variable at once.
+        """
+        errors: List[str] = []
+
+        def get(key: str, default: Optional[str] = None) -> Optional[str]:
+            value = str(values.get(key) or "").strip()
+            if value:
+                return value
+            if default is None:
+                errors.append(f"Environment variable not set: {key}")
+            return default
+
+        def get_int(key: str, default: Optional[str] = None) -> int:
+            value = get(key, default)
+            try:
+                return int(value) if value is not None else 0
+            except ValueError:
+                errors.append(f"Environment variable {key} should be an integer, but was: {value}")
+                return 0
+
+        def get_bool(key: str, default: str) -> bool:
+            try:
+                return cast_bool(get(key, default))
+            except KnownError as err:
+                errors.append(f"Environment variable {key} is invalid: {err}")
+                return False
+
+        extend_gradescope_assignments = get_bool("EXTEND_GRADESCOPE_ASSIGNMENTS", "No")
+        email_transport = get("EMAIL_TRANSPORT", EMAIL_TRANSPORT_SMTP).lower()
+        if email_transport not in EMAIL_TRANSPORTS:
+            errors.append(
+                f"Environment variable EMAIL_TRANSPORT should be one of {EMAIL_TRANSPORTS}, but was: {email_transport}"
+            )
+        config = PolicyConfig(
+            spreadsheet_url=get("SPREADSHEET_URL"),
+            slack_endpoint=get("SLACK_ENDPOINT"),
+            slack_endpoint_debug=get("SLACK_ENDPOINT_DEBUG", "") or None,
+            slack_tags=tuple(cast_list_str(get("SLACK_TAG_LIST", ""))),
+            auto_approve_threshold=get_int("AUTO_APPROVE_THRESHOLD"),
+            auto_approve_threshold_dsp=get_int("AUTO_APPROVE_THRESHOLD_DSP"),
+            auto_approve_assignment_threshold=get_int("AUTO_APPROVE_ASSIGNMENT_THRESHOLD"),
+            max_total_requested_extensions_threshold=get_int("MAX_TOTAL_REQUESTED_EXTENSIONS_THRESHOLD", "-1"),
+            email_from=get("EMAIL_FROM"),
+            email_reply_to=get("EMAIL_REPLY_TO"),
+            email_subject=get("EMAIL_SUBJECT"),
+            email_signature=get("EMAIL_SIGNATURE"),
+            email_cc=tuple(cast_list_str(get("EMAIL_CC", ""))),
+            extend_gradescope_assignments=extend_gradescope_assignments,
+            gradescope_email=get("GRADESCOPE_EMAIL", None if extend_gradescope_assignments else "") or None,
+            gradescope_password=get("GRADESCOPE_PASSWORD", None if extend_gradescope_assignments else "") or None,
+            email_transport=email_transport,
+            smtp_host=get("SMTP_HOST", "") or None,
+            smtp_port=get_int("SMTP_PORT", "465"),
+            smtp_username=get("SMTP_USERNAME", "") or None,
+            smtp_password=get("SMTP_PASSWORD", "") or None,
+            smtp_ssl=get_bool("SMTP_SSL", "Yes"),
+            email_spool_dir=get("EMAIL_SPOOL_DIR", "") or None,
+            email_sender=get("EMAIL_SENDER", "") or None,
+        )
+        if len(errors) > 0:
+            raise ConfigurationError("Invalid configuration: " + "; ".join(errors))
+        return config
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import sqlite3
+import time
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from src.errors import SheetError, TenantBusyError
+
+# Apps Script retries a submission within minutes if we time out; remember results for much longer than that.
+DEDUPE_TTL_SECONDS = 6 * 3600
+
+# A claim for a request that's still running. If the instance running it dies, the claim lapses after this long (a
+# bit longer than the function timeout), so a later retry gets processed.
+DEDUPE_PENDING_TTL_SECONDS = 600
+
+# Returned (with PENDING_STATUS_CODE) for a retry that arrives while the original request is still being processed.
+# Nothing has been committed yet, so it isn't a success; the caller should retry later.
+PENDING_RESULT = {"success": False, "pending": True, "error": "This submission is still being processed."}
+PENDING_STATUS_CODE = 409
+
+# Known errors that a retry may not run into (e.g. the course was busy, or a Sheets write failed midway). Requests
+# that fail with these are released, so a retry is processed; other known errors are stored like any result.
+TRANSIENT_ERRORS = (SheetError, TenantBusyError)
+
+
+def get_submission_key(request_json: Dict[str, Any]) -> str:
+    """
+    Identifies a form submission: its spreadsheet, timestamp and a hash of the whole payload (which includes the
+    student's email). Retried deliveries of the same submission have the same key.
+    """
+    form_data = request_json.get("form_data") or {}
+    payload = json.dumps(form_data, sort_keys=True, default=str)
+    timestamp = (form_data.get("Timestamp") or [""])[0]
+    digest = hashlib.sha256(payload.encode()).hexdigest()
+    return f"{request_json.get('spreadsheet_url')}|{timestamp}|{digest}"
+
+
+class DedupeStore:
+    """
+    Remembers the results of handled requests, so retried deliveries of a request can return the original result
+    instead of running it again (re-writing the roster, and re-sending emails and Slack messages).
+    """
+
+    def claim(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the stored result for key (or PENDING_RESULT, if it's still being processed). Otherwise, marks key as
+        being processed, and returns None; the caller should then handle the request, and complete or release it.
+        """
+        raise NotImplementedError
+
+    def complete(self, key: str, result: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def release(self, key: str) -> None:
+        """
+        Forgets a claim (e.g. the request failed unexpectedly), so a retry is processed again.
+        """
+        raise NotImplementedError
+
+
+class MemoryDedupeStore(DedupeStore):
+    """
+    Results held in this process. Retries served by the same warm instance are caught; a retry that reaches another
+    instance (or this one after a cold start) is processed again. Use a store shared by every instance to rule that
+    out.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEDUPE_TTL_SECONDS,
+        pending_ttl: float = DEDUPE_PENDING_TTL_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.clock = clock
+
+        # key -> (expiry, result); the result is None while the request is being processed.
+        self.entries: Dict[str, Tuple[float, Optional[Dict[str, Any]]]] = {}
+        self.lock = Lock()
+
+    def claim(self, key: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            now = self.clock()
+            for expired in [entry for entry, (expires_at, _) in self.entries.items() if expires_at <= now]:
+                del self.entries[expired]
+            if key in self.entries:
+                result = self.entries[key][1]
+                return result if result is not None else PENDING_RESULT
+            self.entries[key] = (now + self.pending_ttl, None)
+            return None
+
+    def complete(self, key: str, result: Dict[str, Any]) -> None:
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, result)
+
+    def release(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class SqliteDedupeStore(DedupeStore):
+    """
+    Results stored in a SQLite database, e.g. a file shared by every worker on a machine.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = DEDUPE_TTL_SECONDS,
+        pending_ttl: float = DEDUPE_PENDING_TTL_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.clock = clock
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = Lock()
+        with self.lock:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS dedupe (key TEXT PRIMARY KEY, result TEXT, expires_at REAL NOT NULL)"
+            )
+
+    def claim(self, key: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            now = self.clock()
+            # An immediate transaction, so two processes can't both claim the same key.
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.execute("DELETE FROM dedupe WHERE expires_at <= ?", (now,))
+                row = self.connection.execute("SELECT result FROM dedupe WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.connection.execute(
+                        "INSERT INTO dedupe (key, result, expires_at) VALUES (?, NULL, ?)",
+                        (key, now + self.pending_ttl),
+                    )
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+        if row is None:
+            return None
+        return json.loads(row[0]) if row[0] is not None else PENDING_RESULT
+
+    def complete(self, key: str, result: Dict[str, Any]) -> None:
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO dedupe (key, result, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(result), self.clock() + self.ttl),
+            )
+
+    def release(self, key: str) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM dedupe WHERE key = ?", (key,))
+
+
+# Only retries that reach the same instance are deduplicated (see MemoryDedupeStore).
+DEDUPE_STORE: DedupeStore = MemoryDedupeStore()
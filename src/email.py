@@ -1,26 +1,60 @@
 from __future__ import annotations
 
-import os
-from datetime import datetime, timedelta
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import formataddr
-from smtplib import SMTP_SSL, SMTPException
-from typing import List
-
-from sicp.common.rpc.mail import send_email
+from typing import List, Optional, Tuple
 
 from src.assignments import AssignmentList
-from src.errors import EmailError, KnownError
+from src.config import EMAIL_TRANSPORT_SMTP, PolicyConfig
 from src.record import StudentRecord
-from src.utils import Environment, cast_list_str
+from src.templates import DEFAULT_EMAIL_TEMPLATES, EmailTemplates
+from src.transport import EmailTransport, get_default_transport, get_transport
+
+SMTP_SENDER_EMAIL = "REDACTED"
+
 
-ENV_EMAIL_FROM = "EMAIL_FROM"
-ENV_EMAIL_REPLY_TO = "EMAIL_REPLY_TO"
-ENV_EMAIL_SUBJECT = "EMAIL_SUBJECT"
-ENV_EMAIL_SIGNATURE = "EMAIL_SIGNATURE"
-ENV_EMAIL_CC = "EMAIL_CC"
-ENV_APP_MASTER_SECRET = "APP_MASTER_SECRET"
+def get_sender_email(config: PolicyConfig) -> str:
+    """
+    The address a course's emails are sent from: EMAIL_SENDER if set, or else the login of the course's own SMTP
+    server (relays reject mail from addresses they don't own), or else the built-in server's address.
+    """
+    if config.email_sender:
+        return config.email_sender
+    if config.email_transport == EMAIL_TRANSPORT_SMTP and config.smtp_host and config.smtp_username:
+        return config.smtp_username
+    return SMTP_SENDER_EMAIL
+
+
+class EmailQueue(EmailTransport):
+    """
+    Collects outgoing messages (pass it to Email.send in place of a transport), so they can be sent later, e.g. once
+    a batch of submissions has been committed.
+    """
+
+    def __init__(self, config: PolicyConfig) -> None:
+        self.config = config
+        self.messages = []
+
+    def sendmail(self, from_addr: str, to_addrs: List[str], msg: str) -> None:
+        self.messages.append((from_addr, to_addrs, msg))
+
+    def deliver(self, transport: Optional[EmailTransport] = None) -> List[str]:
+        """
+        Sends every queued message (through the course's transport, unless a transport is given), and returns an
+        error for each one that failed.
+        """
+        if len(self.messages) == 0:
+            return []
+        messages, self.messages = self.messages, []
+        connection = transport if transport is not None else get_transport(self.config)
+        errors = []
+        for from_addr, to_addrs, msg in messages:
+            try:
+                connection.sendmail(from_addr, to_addrs, msg)
+            except OSError as err:
+                errors.append(f"Email to {', '.join(to_addrs)} failed: {err}")
+        return errors
 
 
 class Email:
@@ -37,6 +71,9 @@ class Email:
         cc_emails: List[str],
         subject: str,
         body: str,
+        html_body: Optional[str] = None,
+        transport: Optional[EmailTransport] = None,
+        sender_email: str = SMTP_SENDER_EMAIL,
     ) -> None:
         self.to_email = to_email
         self.from_email = from_email
@@ -44,110 +81,62 @@ class Email:
         self.cc_emails = cc_emails
         self.subject = subject
         self.body = body
+        self.html_body = html_body
+        self.transport = transport
+        self.sender_email = sender_email
 
     @classmethod
-    def from_student_record(cls, student: StudentRecord, assignments: AssignmentList):
-        body = "Hi,"
-        body += "\n\n"
-        body += (
-            "You recently requested an extension for an assignment. "
-            + "We've processed this extension, and here are your updated due dates:"
-        )
-        body += "\n\n"
-
-        def fmt_date(dt: datetime):
-            return dt.strftime("%A, %B %-d")
-
-        for assignment in assignments:
-            num_days = student.get_request(assignment_id=assignment.get_id())
-            if num_days:
-                name = assignment.get_name()
-
-                if assignment.get_due_date():
-                    original = assignment.get_due_date()
-                    extended = original + timedelta(days=int(num_days))
-
-                    body += f"{name} ({num_days} Day Extension)" + "\n"
-                    body += f"Original Deadline: {fmt_date(original)}" + "\n"
-                    body += f"Extended Deadline: {fmt_date(extended)}" + "\n"
-                    body += "\n"
-                else:
-                    body += f"{name} ({num_days} Day Extension)" + "\n"
-                    body += "Original Deadline: TBD" + "\n"
-                    body += "Extended Deadline: TBD" + "\n"
-                    body += "\n"
-
-        comments = student.get_email_comments()
-        if comments:
-            body += f"Additional comments: {comments}" + "\n\n"
-
-        body += "If something doesn't look right, please reply to this email!"
-        body += "\n\n"
-        body += "Best,"
-        body += "\n\n"
-        body += Environment.get(ENV_EMAIL_SIGNATURE)
-        body += "\n\n"
-        body += (
-            "Disclaimer: This is an auto-generated email. We may follow up with you in"
-            + " this thread, and feel free to reply to this thread if you'd like to follow up with us!"
-        )
-
-        cc_emails = cast_list_str(Environment.safe_get(ENV_EMAIL_CC, ""))
-
+    def from_student_record(
+        cls,
+        student: StudentRecord,
+        assignments: AssignmentList,
+        config: PolicyConfig,
+        templates: Optional[EmailTemplates] = None,
+    ):
+        templates = templates or DEFAULT_EMAIL_TEMPLATES
+        rendered = templates.render(student=student, assignments=assignments, config=config)
         return cls(
             to_email=student.get_email(),
-            from_email=Environment.get(ENV_EMAIL_FROM),
-            cc_emails=cc_emails,
-            reply_to_email=Environment.get(ENV_EMAIL_REPLY_TO),
-            subject=Environment.get(ENV_EMAIL_SUBJECT),
-            body=body,
+            from_email=config.email_from,
+            cc_emails=list(config.email_cc),
+            reply_to_email=config.email_reply_to,
+            subject=rendered.subject,
+            body=rendered.body,
+            html_body=rendered.html,
+            transport=get_transport(config),
+            sender_email=get_sender_email(config),
         )
 
-    def OLDsend(self) -> None:
-        # TODO: When 162 adds HTML support, bring back HTML emails.
-        # html_body = Markdown().convert(self.body)
-        # extra_headers = [("Content-Type", "text/html; charset=UTF-8")]
-        extra_headers = [("Reply-To", self.reply_to_email)]
-        if self.cc_emails:
-            header = ("Cc", ", ".join(self.cc_emails))
-            extra_headers.append(header)
-
-        if not os.environ.get(ENV_APP_MASTER_SECRET):
-            raise KnownError(
-                "Internal error: environment master secret not set, so cannot send emails via the CS 162 mailserver!"
-            )
-        try:
-            send_email(
-                sender=Environment.get(ENV_EMAIL_FROM),
-                target=self.to_email,
-                targets=self.cc_emails,
-                subject=self.subject,
-                body=self.body,
-                _impersonate="mail",
-                extra_headers=extra_headers,
-            )
-
-        except Exception as e:
-            raise EmailError("An error occurred while sending an email:", e)
-
-
-    def send(self) -> None:
-        PORT = 465  # For starttls
-        HOST = "REDACTED"
-        username = "REDACTED"
-        sender_email = "REDACTED"
-        SENDERNAME = Environment.get(ENV_EMAIL_FROM)
+    @classmethod
+    def from_student_records(
+        cls,
+        students: List[StudentRecord],
+        assignments: AssignmentList,
+        config: PolicyConfig,
+        templates: Optional[EmailTemplates] = None,
+    ) -> Tuple[List[Tuple[StudentRecord, Email]], List[Tuple[StudentRecord, Exception]]]:
+        """
+        Renders emails for many students with the same compiled templates, returning (student, email) pairs, and
+        (student, error) pairs for students whose email couldn't be built.
+        """
+        emails, errors = [], []
+        for student in students:
+            try:
+                emails.append((student, cls.from_student_record(student, assignments, config, templates=templates)))
+            except Exception as err:
+                errors.append((student, err))
+        return emails, errors
+
+    def send(self, connection: Optional[EmailTransport] = None) -> None:
+        """
+        Sends this email through `connection` if given (e.g. an EmailQueue), or else the course's transport.
+        """
+        sender_email = self.sender_email
+        SENDERNAME = self.from_email
         receiver_email = self.to_email
         cc_emails = self.cc_emails
         reply_to_email = self.reply_to_email
-        password = "REDACTED"
         SUBJECT = self.subject
-        # message = """\
-        # Subject: Hi there
-
-        # This message is sent from Python."""
-
-        BODY_TEXT = ("BCOP TEST TEST")
 
         msg = MIMEMultipart('alternative')
         msg['Subject'] = SUBJECT
@@ -166,9 +155,10 @@ class Email:
         # According to RFC 2046, the last part of a multipart message, in this case
         # the HTML message, is best and preferred.
         msg.attach(part1)
+        if self.html_body is not None:
+            msg.attach(MIMEText(self.html_body, 'html'))
 
-        with SMTP_SSL(HOST, PORT) as server:
-            server.login(username, password)
-            server.sendmail(sender_email, [receiver_email]+cc_emails, msg.as_string())
-            server.close()
-            print("Email sent!")
\ No newline at end of file
+        if connection is None:
+            connection = self.transport if self.transport is not None else get_default_transport()
+        connection.sendmail(sender_email, [receiver_email]+cc_emails, msg.as_string())
+        print("Email sent!")
@@ -28,3 +28,7 @@ class FormInputError(KnownError):
 
 class EmailError(KnownError):
     pass
+
+
+class TenantBusyError(KnownError):
+    pass
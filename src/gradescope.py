@@ -1,9 +1,12 @@
-from typing import List
+from __future__ import annotations
+
+from typing import List, Tuple
 
 from gradescope_api.client import GradescopeClient
 
+from src.config import PolicyConfig
 from src.errors import GradescopeError
-from src.utils import Environment, cast_bool, truncate
+from src.utils import truncate
 
 
 class Gradescope:
@@ -12,18 +15,15 @@ class Gradescope:
     minimal Gradescope API wrapper designed specifically for extension management.
     """
 
-    def __init__(self) -> None:
-        email = Environment.get("GRADESCOPE_EMAIL")
-        password = Environment.get("GRADESCOPE_PASSWORD")
-
+    def __init__(self, email: str, password: str) -> None:
         try:
             self.client = GradescopeClient(email=email, password=password)
         except Exception as err:
             raise GradescopeError(f"Failed to sign into Gradescope: {err}")
 
     @staticmethod
-    def is_enabled():
-        return cast_bool(Environment.safe_get("EXTEND_GRADESCOPE_ASSIGNMENTS", "No"))
+    def from_config(config: PolicyConfig) -> Gradescope:
+        return Gradescope(email=config.gradescope_email, password=config.gradescope_password)
 
     def apply_extension(self, assignment_urls: List[str], email: str, num_days: int) -> List[str]:
         warnings = []
@@ -41,3 +41,31 @@ class Gradescope:
                     + f"failed to extend assignment in Gradescope: internal Gradescope error occurred ({truncate(err)})"
                 )
         return warnings
+
+
+class GradescopeQueue:
+    """
+    Collects extensions (use it in place of a Gradescope client), so they can be applied later with a single sign-in,
+    e.g. once a batch of submissions has been committed.
+    """
+
+    def __init__(self, config: PolicyConfig) -> None:
+        self.config = config
+        self.extensions: List[Tuple[List[str], str, int]] = []
+
+    def apply_extension(self, assignment_urls: List[str], email: str, num_days: int) -> List[str]:
+        self.extensions.append((assignment_urls, email, num_days))
+        return []
+
+    def flush(self) -> List[str]:
+        """
+        Applies every queued extension, and returns any warnings.
+        """
+        if len(self.extensions) == 0:
+            return []
+        extensions, self.extensions = self.extensions, []
+        client = Gradescope.from_config(self.config)
+        warnings = []
+        for assignment_urls, email, num_days in extensions:
+            warnings.extend(client.apply_extension(assignment_urls=assignment_urls, email=email, num_days=num_days))
+        return warnings
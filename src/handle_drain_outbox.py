@@ -0,0 +1,30 @@
+from src.config import PolicyConfig
+from src.errors import ConfigurationError
+from src.outbox import OUTBOX_PENDING, Outbox, OutboxWorker
+from src.sheets import SHEET_ENVIRONMENT_VARIABLES, SHEET_OUTBOX, BaseSpreadsheet
+from src.tenants import tenant_scoped
+from src.utils import Environment
+
+
+@tenant_scoped
+def handle_drain_outbox(request_json):
+    """
+    Runs a course's due Outbox jobs, including failed ones whose backoff is up. Call it on a schedule (e.g. every
+    minute with Cloud Scheduler) for each course with an Outbox tab; jobs left when its time budget runs out are
+    picked up by the next call.
+    """
+    if "spreadsheet_url" not in request_json:
+        raise ConfigurationError("handle_drain_outbox expects spreadsheet_url parameter")
+
+    base = BaseSpreadsheet(spreadsheet_url=request_json["spreadsheet_url"])
+    sheets = base.get_sheets([SHEET_ENVIRONMENT_VARIABLES, SHEET_OUTBOX])
+
+    # The config is loaded once, and shared by every job in this drain.
+    config = PolicyConfig.from_sheet(sheet=sheets[SHEET_ENVIRONMENT_VARIABLES])
+    Environment.configure(config)
+
+    outbox = Outbox(sheet=sheets[SHEET_OUTBOX])
+    ran = OutboxWorker(config=config).drain_all(outbox)
+
+    base.finish_writes()
+    return {"ran": ran, "pending": outbox.count(OUTBOX_PENDING)}
@@ -1,60 +1,193 @@
-from typing import List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 
 from src.assignments import AssignmentList
+from src.config import PolicyConfig
 from src.email import Email
 from src.errors import ConfigurationError
 from src.gradescope import Gradescope
-from src.record import EMAIL_STATUS_IN_QUEUE, StudentRecord
-from src.sheets import SHEET_ASSIGNMENTS, SHEET_ENVIRONMENT_VARIABLES, SHEET_STUDENT_RECORDS, BaseSpreadsheet
+from src.record import EMAIL_STATUS_IN_QUEUE, EMAIL_STATUS_SENDING, ROSTER_ID_COLUMN, StudentRecord, WriteSession
+from src.sheets import (
+    SHEET_ASSIGNMENTS,
+    SHEET_EMAIL_TEMPLATES,
+    SHEET_ENVIRONMENT_VARIABLES,
+    SHEET_STUDENT_RECORDS,
+    BaseSpreadsheet,
+    normalize_id,
+)
 from src.slack import SlackManager
+from src.templates import EmailTemplates
+from src.tenants import tenant_scoped
+from src.transport import SMTP_POOL_SIZE
 from src.utils import Environment
 
+# Emails are sent concurrently, one worker per pooled SMTP connection.
+EMAIL_QUEUE_WORKERS = SMTP_POOL_SIZE
 
-def handle_email_queue(request_json):
+# Queued students are handled in chunks: a chunk's emails are sent, then its statuses are written in one batched
+# update. Before each chunk, we stop if it might not finish within the time budget (Cloud Functions time out after
+# 60 seconds by default); the students left "In Queue" are sent by the next call.
+EMAIL_QUEUE_CHUNK_SIZE = 25
+EMAIL_QUEUE_TIME_BUDGET_SECONDS = 45
+
+
+def send_email(email: Email) -> Optional[Exception]:
+    try:
+        email.send()
+        return None
+    except Exception as err:
+        return err
+
+
+@tenant_scoped
+def handle_email_queue(request_json) -> Dict[str, Any]:
+    """
+    Sends an email to every student whose email_status is "In Queue". If the time budget (`time_budget_seconds`, or
+    EMAIL_QUEUE_TIME_BUDGET_SECONDS) runs out first, the result's `remaining` is nonzero; call again to carry on.
+    If `silent` is set, Slack messages are printed instead of sent.
+    """
+    started = time.monotonic()
     if "spreadsheet_url" not in request_json:
         raise ConfigurationError("handle_email_queue expects spreadsheet_url parameter")
+    budget = float(request_json.get("time_budget_seconds", EMAIL_QUEUE_TIME_BUDGET_SECONDS))
 
     # Get pointers to sheets.
     base = BaseSpreadsheet(spreadsheet_url=request_json["spreadsheet_url"])
-    sheet_assignments = base.get_sheet(SHEET_ASSIGNMENTS)
-    sheet_records = base.get_sheet(SHEET_STUDENT_RECORDS)
-    sheet_env_vars = base.get_sheet(SHEET_ENVIRONMENT_VARIABLES)
+    sheets = base.get_sheets(
+        [SHEET_ASSIGNMENTS, SHEET_STUDENT_RECORDS, SHEET_ENVIRONMENT_VARIABLES], optional=[SHEET_EMAIL_TEMPLATES]
+    )
+    sheet_assignments = sheets[SHEET_ASSIGNMENTS]
+    sheet_records = sheets[SHEET_STUDENT_RECORDS]
+    sheet_env_vars = sheets[SHEET_ENVIRONMENT_VARIABLES]
 
     # Set up environment variables.
-    Environment.configure_env_vars(sheet_env_vars)
+    config = PolicyConfig.from_sheet(sheet=sheet_env_vars)
+    Environment.configure(config)
 
-    # Fetch assignments.
-    assignments = AssignmentList(sheet=sheet_assignments)
+    # Fetch assignments, and the course's email templates (compiled once per revision of the spreadsheet).
+    assignments = AssignmentList.from_sheet(sheet=sheet_assignments)
+    templates = EmailTemplates.from_sheet(sheet=sheets[SHEET_EMAIL_TEMPLATES])
 
     # Fetch all students.
     emails: List[str] = []
 
-    slack = SlackManager()
-
-    for i, table_record in enumerate(sheet_records.get_all_records()):
-        student = StudentRecord(table_index=i, table_record=table_record, sheet=sheet_records)
-        if student.email_status() == EMAIL_STATUS_IN_QUEUE:
-            # Guard around the outbound email, so we can diagnose errors easily and keep state consistent.
-            try:
-                email = Email.from_student_record(student=student, assignments=assignments)
-                email.send()
-                student.set_status_email_approved()
-                student.flush()
-                emails.append(student.get_email())
-            except Exception as err:
-                slack.add_warning(
-                    f"Attempted to send an email to {student.get_email()}, but failed.\n"
-                    + "Please follow up with this student manually and/or check email logs.\n"
-                    + "If this is a spreadsheet error, correct the error, and re-run email queue processor.\n"
-                    + "Error: "
-                    + str(err)
-                )
-
-            if Gradescope.is_enabled():
-                client = Gradescope()
-                warnings = student.apply_extensions(assignments=assignments, gradescope=client)
-                for warning in warnings:
-                    slack.add_warning(warning)
+    slack = SlackManager(config=config)
+    if request_json.get("silent"):
+        slack.suppress()
+    gradescope: Optional[Gradescope] = None
+
+    students = [
+        StudentRecord(table_index=i, table_record=table_record, sheet=sheet_records)
+        for i, table_record in enumerate(sheet_records.get_all_records())
+    ]
+    # Progress is kept on the roster, where every instance can see it: a student is marked "Sending" before their
+    # email goes out, and "Auto Sent" after. A student still marked "Sending" was being emailed by a call that was
+    # cut off (or is still running elsewhere), so their email may or may not have been sent.
+    unknown = [student for student in students if student.email_status() == EMAIL_STATUS_SENDING]
+    pending = [student for student in students if student.email_status() == EMAIL_STATUS_IN_QUEUE]
+
+    def report_failure(student: StudentRecord, err: Exception):
+        slack.add_warning(
+            f"Attempted to send an email to {student.get_email()}, but failed.\n"
+            + "Please follow up with this student manually and/or check email logs.\n"
+            + "If this is a spreadsheet error, correct the error, and re-run email queue processor.\n"
+            + "Error: "
+            + str(err)
+        )
+
+    def extend_assignments(students: List[StudentRecord]):
+        nonlocal gradescope
+        if not config.extend_gradescope_assignments or len(students) == 0:
+            return
+        if gradescope is None:
+            gradescope = Gradescope.from_config(config)
+        for student in students:
+            warnings = student.apply_extensions(assignments=assignments, gradescope=gradescope)
+            for warning in warnings:
+                slack.add_warning(warning)
+
+    def still_queued(chunk: List[StudentRecord]) -> List[StudentRecord]:
+        # Another call may have claimed (or sent) some of these students since we loaded the roster, so their rows are
+        # re-read right before claiming. Students who are no longer "In Queue" (or whose rows moved) are skipped.
+        ids = sheet_records.fetch_column(ROSTER_ID_COLUMN)
+        statuses = sheet_records.fetch_column("email_status")
+        return [
+            student
+            for student in chunk
+            if student.table_index < min(len(ids), len(statuses))
+            and normalize_id(ids[student.table_index]) == normalize_id(student.get_email())
+            and statuses[student.table_index] == EMAIL_STATUS_IN_QUEUE
+        ]
+
+    def send_chunk(chunk: List[StudentRecord]):
+        chunk = still_queued(chunk)
+        if len(chunk) == 0:
+            return
+
+        # Mark the chunk as sending first (in one batched update), so if we're cut off mid-send, these emails are
+        # never sent again.
+        session = WriteSession()
+        for student in chunk:
+            student.set_status_email_sending()
+            session.add(student)
+        session.commit()
+
+        outgoing, failures = Email.from_student_records(
+            students=chunk, assignments=assignments, config=config, templates=templates
+        )
+        with ThreadPoolExecutor(max_workers=EMAIL_QUEUE_WORKERS) as pool:
+            results = list(pool.map(send_email, [email for _, email in outgoing]))
+
+        sent: List[StudentRecord] = []
+        for (student, _), err in zip(outgoing, results):
+            if err is not None:
+                failures.append((student, err))
+            else:
+                sent.append(student)
+        for student in sent:
+            student.set_status_email_approved()
+            session.add(student)
+        # Emails that failed weren't sent, so they go back in the queue for the next run.
+        for student, err in failures:
+            report_failure(student, err)
+            student.set_status_email_queued()
+            session.add(student)
+
+        # Statuses are written with one batched update per chunk.
+        session.commit()
+        emails.extend(student.get_email() for student in sent)
+        extend_assignments(chunk)
+
+    for student in unknown:
+        slack.add_warning(
+            f"The email queue processor stopped while sending an email to {student.get_email()}, so it may or may "
+            + "not have been sent.\nPlease check email logs, and update this student's email_status manually."
+        )
+
+    # Send the rest, chunk by chunk, while there's time to finish another chunk (always sending at least one).
+    chunks, slowest_chunk = 0, 0.0
+    while len(pending) > 0:
+        if chunks > 0 and time.monotonic() - started + slowest_chunk >= budget:
+            break
+        chunk_started = time.monotonic()
+        send_chunk(pending[:EMAIL_QUEUE_CHUNK_SIZE])
+        pending = pending[EMAIL_QUEUE_CHUNK_SIZE:]
+        chunks, slowest_chunk = chunks + 1, max(slowest_chunk, time.monotonic() - chunk_started)
+
+    base.finish_writes()
+
+    if len(pending) > 0:
+        slack.send_message(
+            f"Sent {len(emails)} emails from the queue; {len(pending)} are still queued, and will be sent when the "
+            + "queue processor continues. Emails: "
+            + "\n"
+            + "```"
+            + "\n".join(emails)
+            + "\n"
+            + "```"
+        )
+        return {"sent": len(emails), "remaining": len(pending)}
 
     if len(emails) == 0:
         slack.send_message("Sent zero emails from the queue...was it empty?")
@@ -62,3 +195,4 @@ def handle_email_queue(request_json):
         slack.send_message(
             f"Sent {len(emails)} emails from the queue. Emails: " + "\n" + "```" + "\n".join(emails) + "\n" + "```"
         )
+    return {"sent": len(emails), "remaining": 0}
@@ -1,34 +1,39 @@
 from src.assignments import AssignmentList
+from src.config import PolicyConfig
 from src.errors import ConfigurationError
 from src.gradescope import Gradescope
 from src.record import StudentRecord
 from src.sheets import SHEET_ASSIGNMENTS, SHEET_ENVIRONMENT_VARIABLES, SHEET_STUDENT_RECORDS, BaseSpreadsheet
 from src.slack import SlackManager
+from src.tenants import tenant_scoped
 from src.utils import Environment
 
 
+@tenant_scoped
 def handle_flush_gradescope(request_json):
     if "spreadsheet_url" not in request_json:
         raise ConfigurationError("handle_flush_gradescope expects spreadsheet_url parameter")
 
     # Get pointers to sheets.
     base = BaseSpreadsheet(spreadsheet_url=request_json["spreadsheet_url"])
-    sheet_assignments = base.get_sheet(SHEET_ASSIGNMENTS)
-    sheet_records = base.get_sheet(SHEET_STUDENT_RECORDS)
-    sheet_env_vars = base.get_sheet(SHEET_ENVIRONMENT_VARIABLES)
+    sheets = base.get_sheets([SHEET_ASSIGNMENTS, SHEET_STUDENT_RECORDS, SHEET_ENVIRONMENT_VARIABLES])
+    sheet_assignments = sheets[SHEET_ASSIGNMENTS]
+    sheet_records = sheets[SHEET_STUDENT_RECORDS]
+    sheet_env_vars = sheets[SHEET_ENVIRONMENT_VARIABLES]
 
     # Set up environment variables.
-    Environment.configure_env_vars(sheet_env_vars)
+    config = PolicyConfig.from_sheet(sheet=sheet_env_vars)
+    Environment.configure(config)
 
     # Fetch assignments.
-    assignments = AssignmentList(sheet=sheet_assignments)
+    assignments = AssignmentList.from_sheet(sheet=sheet_assignments)
 
     # Fetch records.
     records = sheet_records.get_all_records()
 
-    slack = SlackManager()
+    slack = SlackManager(config=config)
 
-    gradescope = Gradescope()
+    gradescope = Gradescope.from_config(config)
 
     all_warnings = []
     successes = []
@@ -46,6 +51,8 @@ def handle_flush_gradescope(request_json):
 
         student.flush()
 
+    base.finish_writes()
+
     for warning in all_warnings:
         slack.add_warning(warning)
 
@@ -1,34 +1,167 @@
-from src.errors import ConfigurationError
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from src.config import PolicyConfig
+from src.email import EmailQueue
+from src.errors import ConfigurationError, FormInputError, KnownError
+from src.gradescope import GradescopeQueue
+from src.outbox import OutboxWorker
 from src.policy import Policy
+from src.record import PST, ROSTER_ID_COLUMN, WriteSession
 from src.sheets import (
     SHEET_ASSIGNMENTS,
+    SHEET_EMAIL_TEMPLATES,
     SHEET_ENVIRONMENT_VARIABLES,
     SHEET_FORM_QUESTIONS,
     SHEET_STUDENT_RECORDS,
     BaseSpreadsheet,
+    Sheet,
 )
 from src.slack import SlackManager
-from src.utils import Environment
+from src.sqlite_backend import SqliteSpreadsheetBackend
+from src.templates import EmailTemplates
+from src.tenants import tenant_scoped
+from src.utils import Environment, parse_timestamp
 
 
+@tenant_scoped
 def handle_form_submit(request_json):
     if "spreadsheet_url" not in request_json or "form_data" not in request_json:
         raise ConfigurationError("handle_form_submit expects spreadsheet_url/form_data parameters")
 
     # Get a pointer to the spreadsheet in the request.
     base = BaseSpreadsheet(spreadsheet_url=request_json["spreadsheet_url"])
+    sheets = base.get_sheets(
+        [SHEET_ENVIRONMENT_VARIABLES, SHEET_ASSIGNMENTS, SHEET_FORM_QUESTIONS], optional=[SHEET_EMAIL_TEMPLATES]
+    )
 
     # Validate/configure environment variables
-    Environment.configure_env_vars(sheet=base.get_sheet(SHEET_ENVIRONMENT_VARIABLES))
+    config = PolicyConfig.from_sheet(sheet=sheets[SHEET_ENVIRONMENT_VARIABLES])
+    Environment.configure(config)
 
-    # Get a pointer to Slack.
-    slack = SlackManager()
+    # Emails, Gradescope extensions and Slack messages are queued up, and only recorded in the Outbox once the
+    # roster writes succeed; handle_drain_outbox sends them, so we can respond as soon as the roster is written.
+    slack_messages: List[Dict[str, Any]] = []
+    email_queue = EmailQueue(config=config)
+    gradescope_queue = GradescopeQueue(config=config)
 
     policy = Policy(
-        sheet_assignments=base.get_sheet(SHEET_ASSIGNMENTS),
-        sheet_form_questions=base.get_sheet(SHEET_FORM_QUESTIONS),
+        sheet_assignments=sheets[SHEET_ASSIGNMENTS],
+        sheet_form_questions=sheets[SHEET_FORM_QUESTIONS],
         form_payload=request_json["form_data"],
-        slack=slack,
+        slack=SlackManager(config=config, outbox=slack_messages),
+        config=config,
+        email_connection=email_queue,
+        gradescope=gradescope_queue,
+        email_templates=EmailTemplates.from_sheet(sheet=sheets[SHEET_EMAIL_TEMPLATES]),
+    )
+
+    # Only fetch the roster rows for the students in this submission, rather than the whole roster.
+    sheet_records = base.get_sheet_rows(
+        SHEET_STUDENT_RECORDS, id_column=ROSTER_ID_COLUMN, id_values=policy.get_student_emails()
     )
-    policy.fetch_student_records(sheet_records=base.get_sheet(SHEET_STUDENT_RECORDS))
+    policy.fetch_student_records(sheet_records=sheet_records)
     policy.apply()
+
+    OutboxWorker(config=config).record(
+        base=base, emails=email_queue, gradescope=gradescope_queue, slack_messages=slack_messages
+    )
+
+    base.finish_writes()
+
+
+def get_submission_time(form_data: Dict[str, Any]) -> datetime:
+    try:
+        timestamp = parse_timestamp(form_data["Timestamp"][0])
+        return timestamp if timestamp.tzinfo else PST.localize(timestamp)
+    except (KeyError, IndexError, TypeError, ValueError, OverflowError) as err:
+        raise FormInputError(f"Could not read the timestamp of a form submission: {err}")
+
+
+@tenant_scoped
+def handle_form_submit_batch(request_json) -> List[Dict[str, Any]]:
+    """
+    Processes several form submissions (e.g. when backfilling after an outage) with one load of the spreadsheet.
+    Submissions are applied in timestamp order against a local copy of the roster, so later submissions see earlier
+    ones, and the roster changes are then committed together. Emails, Gradescope extensions and Slack messages are
+    queued while processing, and recorded in the Outbox once everything is committed (see OutboxWorker.record).
+
+    Returns a result per submission, in the order they were processed: {"timestamp", "email", "success": True}, or
+    {"timestamp", "success": False, "error"} for a submission that failed. Submissions without a readable timestamp
+    fail first, with a timestamp of None. A failed submission doesn't stop the batch: the roster changes and side
+    effects of the others are still committed, along with any roster writes the failed one made before its error (as
+    when it's submitted on its own). If the commit itself fails, the handler raises, and nothing is recorded in the
+    Outbox.
+    """
+    if "spreadsheet_url" not in request_json or "form_data_list" not in request_json:
+        raise ConfigurationError("handle_form_submit_batch expects spreadsheet_url/form_data_list parameters")
+
+    base = BaseSpreadsheet(spreadsheet_url=request_json["spreadsheet_url"])
+    sheets = base.get_sheets(
+        [SHEET_ENVIRONMENT_VARIABLES, SHEET_ASSIGNMENTS, SHEET_FORM_QUESTIONS], optional=[SHEET_EMAIL_TEMPLATES]
+    )
+    config = PolicyConfig.from_sheet(sheet=sheets[SHEET_ENVIRONMENT_VARIABLES])
+    Environment.configure(config)
+    templates = EmailTemplates.from_sheet(sheet=sheets[SHEET_EMAIL_TEMPLATES])
+
+    slack_messages: List[Dict[str, Any]] = []
+    email_queue = EmailQueue(config=config)
+    gradescope_queue = GradescopeQueue(config=config)
+
+    results: List[Dict[str, Any]] = []
+    runs: List[Tuple[Policy, Dict[str, Any]]] = []
+
+    # A submission whose timestamp can't be read fails on its own, rather than failing the sort (and the batch).
+    submissions: List[Tuple[datetime, Dict[str, Any]]] = []
+    for form_data in request_json["form_data_list"]:
+        try:
+            submissions.append((get_submission_time(form_data), form_data))
+        except FormInputError as e:
+            SlackManager(config=config, outbox=slack_messages).send_error(str(e))
+            results.append({"timestamp": None, "success": False, "error": str(e)})
+
+    for _, form_data in sorted(submissions, key=lambda submission: submission[0]):
+        slack = SlackManager(config=config, outbox=slack_messages)
+        try:
+            policy = Policy(
+                sheet_assignments=sheets[SHEET_ASSIGNMENTS],
+                sheet_form_questions=sheets[SHEET_FORM_QUESTIONS],
+                form_payload=form_data,
+                slack=slack,
+                config=config,
+                email_connection=email_queue,
+                gradescope=gradescope_queue,
+                email_templates=templates,
+            )
+            result = {"timestamp": form_data["Timestamp"][0], "email": policy.submission.get_email(), "success": True}
+            runs.append((policy, result))
+        except KnownError as e:
+            slack.send_error(str(e))
+            result = {"timestamp": form_data["Timestamp"][0], "success": False, "error": str(e)}
+        results.append(result)
+
+    # Fetch every affected roster row at once, and apply the submissions to a local copy of them.
+    emails = [email for policy, _ in runs for email in policy.get_student_emails()]
+    sheet_records = base.get_sheet_rows(SHEET_STUDENT_RECORDS, id_column=ROSTER_ID_COLUMN, id_values=emails)
+    local = SqliteSpreadsheetBackend()
+    local.import_tab(SHEET_STUDENT_RECORDS, sheet_records.get_all_values())
+    local_records = Sheet(backend=local.get_sheet_backend(SHEET_STUDENT_RECORDS))
+
+    for policy, result in runs:
+        try:
+            policy.fetch_student_records(sheet_records=local_records)
+            policy.apply()
+        except KnownError as e:
+            policy.slack.send_error(str(e))
+            result.update({"success": False, "error": str(e)})
+
+    session = WriteSession()
+    session.add_changes(sheet=sheet_records, edited=local_records)
+    session.commit()
+
+    OutboxWorker(config=config).record(
+        base=base, emails=email_queue, gradescope=gradescope_queue, slack_messages=slack_messages
+    )
+
+    base.finish_writes()
+    return results
@@ -0,0 +1,276 @@
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.config import PolicyConfig
+from src.email import EmailQueue
+from src.errors import ConfigurationError
+from src.gradescope import GradescopeQueue
+from src.sheets import SHEET_OUTBOX, BaseSpreadsheet, Sheet
+from src.slack import SlackManager
+from src.transport import get_transport
+
+JOB_EMAIL = "email"
+JOB_SLACK = "slack"
+JOB_GRADESCOPE = "gradescope"
+
+OUTBOX_HEADERS = ["kind", "payload", "status", "attempts", "due_at", "error"]
+OUTBOX_PENDING = "pending"
+OUTBOX_DONE = "done"
+OUTBOX_FAILED = "failed"
+
+# Failed jobs are retried with exponential backoff, then given up on (and reported to Slack).
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_BACKOFF_BASE_SECONDS = 60
+
+# A claimed job becomes due again after this long, in case the drain running it died.
+OUTBOX_LEASE_SECONDS = 300
+OUTBOX_BATCH_SIZE = 20
+
+# A drain stops claiming jobs after this long, and leaves the rest for the next one (Cloud Functions time out at 60s).
+OUTBOX_DRAIN_SECONDS = 40
+
+# A Sheets cell holds at most 50,000 characters, so larger jobs are run before responding instead.
+OUTBOX_MAX_PAYLOAD_LENGTH = 50000
+
+Job = Tuple[str, Dict[str, Any]]
+
+
+def get_side_effect_jobs(
+    emails: EmailQueue, gradescope: GradescopeQueue, slack_messages: List[Dict[str, Any]]
+) -> List[Job]:
+    """
+    Takes everything a handler queued up: one job per email (so a retry never re-sends the others), one for the
+    Gradescope extensions (which share a sign-in), and one for the Slack messages. Jobs don't carry the config, so its
+    passwords are never written to the Outbox.
+    """
+    jobs: List[Job] = []
+    for from_addr, to_addrs, msg in emails.messages:
+        jobs.append((JOB_EMAIL, {"from_addr": from_addr, "to_addrs": to_addrs, "msg": msg}))
+    if len(gradescope.extensions) > 0:
+        jobs.append((JOB_GRADESCOPE, {"extensions": gradescope.extensions}))
+    if len(slack_messages) > 0:
+        jobs.append((JOB_SLACK, {"messages": slack_messages}))
+    emails.messages = []
+    gradescope.extensions = []
+    return jobs
+
+
+def get_outbox_row(kind: str, payload: str, now: float) -> List[Any]:
+    return [kind, payload, OUTBOX_PENDING, 0, int(now), ""]
+
+
+class Outbox:
+    """
+    A queue of side effects (emails, Slack messages, Gradescope extensions), stored in a course's optional Outbox tab,
+    so whichever instance runs handle_drain_outbox sees every job. Rows are only appended or updated in place (never
+    deleted), so a job's row index stays valid between reads.
+    """
+
+    def __init__(self, sheet: Sheet, clock: Callable[[], float] = time.time) -> None:
+        if sheet.get_headers()[: len(OUTBOX_HEADERS)] != OUTBOX_HEADERS:
+            raise ConfigurationError(f"The {SHEET_OUTBOX} sheet's header row must be: {', '.join(OUTBOX_HEADERS)}")
+        self.sheet = sheet
+        self.clock = clock
+
+        # The tab was just loaded, so the first claim doesn't need to re-read it.
+        self.fresh = True
+
+    def get_value(self, row: int, header: str) -> Any:
+        return self.sheet.table.get_raw(row, OUTBOX_HEADERS.index(header))
+
+    def enqueue(self, jobs: List[Job]) -> None:
+        """
+        Appends (kind, payload) jobs with one write.
+        """
+        now = self.clock()
+        rows = [get_outbox_row(kind, json.dumps(payload), now) for kind, payload in jobs]
+        self.sheet.append_rows(rows=rows, value_input_option="RAW")
+
+    def claim(self, limit: int = OUTBOX_BATCH_SIZE) -> List[Tuple[int, str, Dict[str, Any], int]]:
+        """
+        Takes up to `limit` due jobs, returning (row index, kind, payload, attempt) for each. The tab is re-read just
+        before claiming, so jobs recorded or finished elsewhere since are seen, and the claimed jobs are leased with a
+        single write, so later drains skip them until the lease runs out.
+        """
+        if not self.fresh:
+            self.sheet.reload()
+        self.fresh = False
+
+        now = self.clock()
+        jobs, cells = [], []
+        for row in range(len(self.sheet.table)):
+            if len(jobs) == limit:
+                break
+            if self.get_value(row, "status") != OUTBOX_PENDING or float(self.get_value(row, "due_at") or 0) > now:
+                continue
+            attempt = int(self.get_value(row, "attempts") or 0) + 1
+            try:
+                payload = json.loads(self.get_value(row, "payload"))
+            except ValueError as err:
+                cells.append([row, OUTBOX_HEADERS.index("status"), OUTBOX_FAILED])
+                cells.append([row, OUTBOX_HEADERS.index("error"), f"Could not read the payload: {err}"])
+                continue
+            jobs.append((row, self.get_value(row, "kind"), payload, attempt))
+            cells.append([row, OUTBOX_HEADERS.index("attempts"), attempt])
+            cells.append([row, OUTBOX_HEADERS.index("due_at"), int(now) + OUTBOX_LEASE_SECONDS])
+        self.sheet.update_cells(cells)
+        return jobs
+
+    def finish(self, outcomes: List[Tuple[int, int, Optional[str]]]) -> List[int]:
+        """
+        Records (row index, attempt, error) outcomes with a single write: jobs without an error are done, and failed
+        jobs are retried after a backoff, or given up on once they're out of attempts. Returns the rows given up on.
+        """
+        now = self.clock()
+        cells, given_up = [], []
+        for row, attempt, error in outcomes:
+            if error is None:
+                status, due_at = OUTBOX_DONE, self.get_value(row, "due_at")
+            elif attempt < OUTBOX_MAX_ATTEMPTS:
+                status, due_at = OUTBOX_PENDING, int(now + OUTBOX_BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+            else:
+                status, due_at = OUTBOX_FAILED, self.get_value(row, "due_at")
+                given_up.append(row)
+            cells.append([row, OUTBOX_HEADERS.index("status"), status])
+            cells.append([row, OUTBOX_HEADERS.index("due_at"), due_at])
+            cells.append([row, OUTBOX_HEADERS.index("error"), error or ""])
+        self.sheet.update_cells(cells)
+        return given_up
+
+    def count(self, status: str) -> int:
+        return sum(1 for row in range(len(self.sheet.table)) if self.get_value(row, "status") == status)
+
+
+def run_email_job(config: PolicyConfig, payload: Dict[str, Any]) -> None:
+    get_transport(config).sendmail(payload["from_addr"], payload["to_addrs"], payload["msg"])
+
+
+def run_gradescope_job(config: PolicyConfig, payload: Dict[str, Any]) -> None:
+    queue = GradescopeQueue(config=config)
+    queue.extensions = [tuple(extension) for extension in payload["extensions"]]
+    warnings = queue.flush()
+    if len(warnings) > 0:
+        SlackManager(config=config).send_outbox([{"text": warning} for warning in warnings])
+
+
+def run_slack_job(config: PolicyConfig, payload: Dict[str, Any]) -> None:
+    SlackManager(config=config).send_outbox(payload["messages"])
+
+
+JOB_RUNNERS: Dict[str, Callable[[PolicyConfig, Dict[str, Any]], None]] = {
+    JOB_EMAIL: run_email_job,
+    JOB_GRADESCOPE: run_gradescope_job,
+    JOB_SLACK: run_slack_job,
+}
+
+
+class OutboxWorker:
+    """
+    Runs a course's side-effect jobs, with the config its caller already loaded. Form handlers record jobs in the
+    Outbox tab (see record), and the scheduled handle_drain_outbox endpoint runs them (see drain_all), so responses
+    only wait on the spreadsheet writes.
+    """
+
+    def __init__(
+        self,
+        config: PolicyConfig,
+        runners: Optional[Dict[str, Callable[[PolicyConfig, Dict[str, Any]], None]]] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.config = config
+        self.runners = runners if runners is not None else JOB_RUNNERS
+        self.clock = clock
+
+    def record(
+        self,
+        base: BaseSpreadsheet,
+        emails: EmailQueue,
+        gradescope: GradescopeQueue,
+        slack_messages: List[Dict[str, Any]],
+    ) -> None:
+        """
+        Call once the roster writes are committed. Jobs are appended to the Outbox tab with one write; if the course
+        has no Outbox tab, or a job is too large for a cell, it's run now instead (once, without retries).
+        """
+        now = self.clock()
+        inline, queued = [], []
+        for kind, payload in get_side_effect_jobs(emails=emails, gradescope=gradescope, slack_messages=slack_messages):
+            encoded = json.dumps(payload)
+            if len(encoded) > OUTBOX_MAX_PAYLOAD_LENGTH:
+                inline.append((kind, payload))
+            else:
+                queued.append((kind, payload, encoded))
+        rows = [get_outbox_row(kind, encoded, now) for kind, _, encoded in queued]
+        if len(rows) > 0 and not base.append_to_sheet(SHEET_OUTBOX, rows):
+            inline.extend((kind, payload) for kind, payload, _ in queued)
+        self.run_now(inline)
+
+    def run_now(self, jobs: List[Job]) -> None:
+        """
+        Runs jobs once, reporting any that fail to Slack.
+        """
+        reports = []
+        for kind, payload in jobs:
+            try:
+                self.runners[kind](self.config, payload)
+            except Exception as err:
+                print(f"{kind} job failed: {err}")
+                report = self.get_failure_report(kind, payload, str(err))
+                if report is not None:
+                    reports.append({"text": report})
+        if len(reports) > 0:
+            try:
+                SlackManager(config=self.config).send_outbox(reports)
+            except Exception as err:
+                print(f"Could not report failed jobs to Slack: {err}")
+
+    def drain_all(self, outbox: Outbox, budget: float = OUTBOX_DRAIN_SECONDS) -> int:
+        """
+        Runs jobs until none are due (failed jobs are due again after a backoff) or the time budget is spent, and
+        returns how many were run.
+        """
+        start = self.clock()
+        total = 0
+        while self.clock() - start < budget:
+            ran = self.drain(outbox)
+            if ran == 0:
+                break
+            total += ran
+        return total
+
+    def drain(self, outbox: Outbox) -> int:
+        """
+        Runs the jobs that are due now, and returns how many were run.
+        """
+        jobs = outbox.claim()
+        outcomes = []
+        for row, kind, payload, attempt in jobs:
+            try:
+                self.runners[kind](self.config, payload)
+                outcomes.append((row, attempt, None))
+            except Exception as err:
+                print(f"Outbox job in row {row + 2} ({kind}) failed on attempt {attempt}: {err}")
+                outcomes.append((row, attempt, str(err)))
+        given_up = set(outbox.finish(outcomes))
+
+        reports = []
+        for row, kind, payload, _ in jobs:
+            if row in given_up:
+                report = self.get_failure_report(kind, payload, outbox.get_value(row, "error"))
+                if report is not None:
+                    reports.append({"text": report})
+        if len(reports) > 0:
+            outbox.enqueue([(JOB_SLACK, {"messages": reports})])
+        return len(jobs)
+
+    def get_failure_report(self, kind: str, payload: Dict[str, Any], error: str) -> Optional[str]:
+        """
+        Describes a job we gave up on, for the course's Slack (a Slack job that keeps failing can't be reported).
+        """
+        if kind == JOB_EMAIL:
+            return f"Writes to spreadsheet succeeded, but an email to {', '.join(payload['to_addrs'])} failed: {error}"
+        if kind == JOB_GRADESCOPE:
+            return f"Writes to spreadsheet succeeded, but Gradescope extensions failed: {error}"
+        print(f"Giving up on Slack messages: {payload['messages']}")
+        return None
@@ -1,13 +1,14 @@
 from typing import Any, Dict, List, Optional
 
 from src.assignments import AssignmentList
+from src.config import PolicyConfig
 from src.email import Email
 from src.gradescope import Gradescope
-from src.record import StudentRecord
+from src.record import StudentRecord, WriteSession
 from src.sheets import Sheet
 from src.slack import SlackManager
 from src.submission import FormSubmission
-from src.utils import Environment
+from src.templates import EmailTemplates
 
 
 class Policy:
@@ -17,10 +18,14 @@ class Policy:
         sheet_form_questions: Sheet,
         form_payload: Dict[str, Any],
         slack: SlackManager,
+        config: PolicyConfig,
+        email_connection: Optional[Any] = None,
+        gradescope: Optional[Any] = None,
+        email_templates: Optional[EmailTemplates] = None,
     ):
 
         # Validate/extract assignments into model
-        self.assignments = AssignmentList(sheet=sheet_assignments)
+        self.assignments = AssignmentList.from_sheet(sheet=sheet_assignments)
 
         # Validate/extract form submission into model
         self.submission = FormSubmission(
@@ -28,16 +33,34 @@ class Policy:
         )
 
         self.slack = slack
+        self.config = config
+
+        # Optional shared email connection and Gradescope client; batches pass in queues, so emails and extensions
+        # are sent once every submission has been committed.
+        self.email_connection = email_connection
+        self.gradescope = gradescope
+        self.email_templates = email_templates
+
+        # Roster writes from every record touched by this run are staged here, and committed together.
+        self.session = WriteSession()
+
+    def get_student_emails(self) -> List[str]:
+        """
+        The emails of every student this submission touches (the student, and their partners, if applicable).
+        """
+        emails = [self.submission.get_email()]
+        if self.submission.has_partner():
+            emails.extend(self.submission.get_partner_emails())
+        return emails
 
     def fetch_student_records(self, sheet_records: Sheet):
         # Validate/extract student (and partner, if applicable) records
         self.student = StudentRecord.from_email(email=self.submission.get_email(), sheet_records=sheet_records)
         self.partners: List[StudentRecord] = []
         if self.submission.has_partner():
-            self.partners = [
-                StudentRecord.from_email(email=email, sheet_records=sheet_records)
-                for email in self.submission.get_partner_emails()
-            ]
+            self.partners = StudentRecord.from_emails(
+                emails=self.submission.get_partner_emails(), sheet_records=sheet_records
+            )
 
         # Set up a connection to Slack, so we can stream output there
         self.slack.set_current_student(submission=self.submission, student=self.student, assignments=self.assignments)
@@ -61,13 +84,15 @@ class Policy:
         if not self.submission.knows_assignments():
             self.student.set_log("Requested student support meeting.")
             self.student.set_status_requested_meeting()
+            self.session.add(self.student)
+            self.session.commit()
             self.slack.send_student_update("A student requested a student support meeting.")
-            self.student.flush()
             return False
 
         # Step 2: Inspect the submission, and determine if it requires manual approval.
         # This step also pipes form submission data into the roster spreadsheet.
         needs_human = self.process_submission()
+        self.session.commit()
         if needs_human:
             self.slack.send_student_update(f"An extension request needs review ({needs_human}).")
             return False
@@ -75,6 +100,7 @@ class Policy:
         # Step 3: Check to see if there's any existing "work-in-progress" that might block auto-approval.
         # This makes sure we don't auto-approve rows that are marked as "Pending" already.
         work_in_progress = self.check_work_in_progress()
+        self.session.commit()
         if work_in_progress:
             self.slack.send_student_update(work_in_progress)
             return False
@@ -85,6 +111,7 @@ class Policy:
 
         # Step 5: All checks have passed, so auto-approve the extension request!
         message = self.approve()
+        self.session.commit()
 
         # Step 6: Send the email.
         if not silent:
@@ -110,11 +137,11 @@ class Policy:
         # Case (1): Submission contains partner, and student's status is a "work-in-progress".
         # We can't auto-approve here for either party (we're blocked on the student).
         if self.submission.has_partner() and self.student.has_wip_status():
-            self.student.flush()
+            self.session.add(self.student)
             for partner in self.partners:
                 partner.set_status_pending()
                 partner.set_log(f"Work-in-progress for form submitter [submitter: {self.student.get_email()}].")
-                partner.flush()
+                self.session.add(partner)
             work_in_progress = (
                 "An extension request needs review (there is work-in-progress for this student's record)."
             )
@@ -126,7 +153,7 @@ class Policy:
             # Dirty partners are partners with work-in-progress rows (e.g. we want to leave them as is).
             dirty_partners = [partner for partner in self.partners if partner.has_wip_status()]
             for partner in dirty_partners:
-                partner.flush()
+                self.session.add(partner)
 
             # Construct a log message that describes what happened in this case.
             wip_emails = ", ".join([p.get_email() for p in dirty_partners])
@@ -140,12 +167,12 @@ class Policy:
             for partner in clean_partners:
                 partner.set_status_pending()
                 partner.set_log(msg)
-                partner.flush()
+                self.session.add(partner)
 
             # We want to flip the student's row to yellow.
             self.student.set_status_pending()
             self.student.set_log(msg)
-            self.student.flush()
+            self.session.add(self.student)
             work_in_progress = (
                 "An extension request needs review (there is work-in-progress for this student's partner)."
             )
@@ -154,7 +181,7 @@ class Policy:
         # Here, we don't want to touch the student's status (e.g. if it's "Meeting Requested", we want to leave
         # it as such). But we do want to update the roster with the number of days requested, so we dispatch writes.
         elif self.student.has_wip_status():
-            self.student.flush()
+            self.session.add(self.student)
             work_in_progress = (
                 "An extension request needs review (there is work in progress for this student's record)."
             )
@@ -166,10 +193,10 @@ class Policy:
 
         # Check to see if the student requested a bunch of extensions all within this request.
         num_requests = self.submission.get_num_requests()
-        if not self.submission.claims_dsp() and num_requests > Environment.get_auto_approve_assignment_threshold():
+        if not self.submission.claims_dsp() and num_requests > self.config.auto_approve_assignment_threshold:
             needs_human = (
                 f"this student has requested more assignment extensions ({num_requests}) than the "
-                + f"auto-approve threshold ({Environment.get_auto_approve_assignment_threshold()})"
+                + f"auto-approve threshold ({self.config.auto_approve_assignment_threshold})"
             )
 
         total_num_extensions = self.student.count_requests(assignments=self.assignments) + num_requests
@@ -190,28 +217,28 @@ class Policy:
                 num_days = existing_request
 
             # Flag Case #1: The number of requested days is too large (non-DSP).
-            if not self.submission.claims_dsp() and num_days > Environment.get_auto_approve_threshold():
-                if Environment.get_auto_approve_threshold() <= 0:
+            if not self.submission.claims_dsp() and num_days > self.config.auto_approve_threshold:
+                if self.config.auto_approve_threshold <= 0:
                     needs_human = "auto-approve is disabled"
                 else:
                     needs_human = (
                         f"a request of {num_days} days is greater than auto-approve threshold "
-                        + f"of {Environment.get_auto_approve_threshold()} days"
+                        + f"of {self.config.auto_approve_threshold} days"
                     )
 
             # Flag Case #2: The number of requested days is too large (DSP).
-            elif self.submission.claims_dsp() and num_days > Environment.get_auto_approve_threshold_dsp():
+            elif self.submission.claims_dsp() and num_days > self.config.auto_approve_threshold_dsp:
                 needs_human = f"a DSP request of {num_days} days is greater than DSP auto-approve threshold"
 
             # Flag Case #3: This extension request is retroactive (the due date is in the past).
-            elif assignment.is_past_due(request_time=self.submission.get_timestamp()):
+            elif assignment.is_past_due(request_time=self.submission.get_time()):
                 needs_human = "student requested a retroactive extension on an assignment"
 
             # Flag Case #4: The student has requested an extension on too many assignments (non-DSP).
             elif (
                 not self.submission.claims_dsp()
-                and Environment.get_max_total_requested_extensions_threshold() != -1
-                and total_num_extensions > Environment.get_max_total_requested_extensions_threshold()
+                and self.config.max_total_requested_extensions_threshold != -1
+                and total_num_extensions > self.config.max_total_requested_extensions_threshold
             ):
                 needs_human = (
                     f"a student requested extensions on more assignments ({total_num_extensions} total)"
@@ -219,7 +246,7 @@ class Policy:
                 )
                 print(needs_human)
 
-            print(Environment.get_max_total_requested_extensions_threshold(), total_num_extensions)
+            print(self.config.max_total_requested_extensions_threshold, total_num_extensions)
 
             # Regardless of whether or not this needs a human, we write the number of days requested back onto the
             # roster sheet. Note that this write isn't pushed until we call flush().
@@ -238,12 +265,12 @@ class Policy:
                 if self.partners
                 else needs_human.capitalize()
             )
-            self.student.flush()
+            self.session.add(self.student)
             if self.partners:
                 for partner in self.partners:
                     partner.set_status_pending()
                     partner.set_log(f"{needs_human.capitalize()} [submitter: {self.student.get_email()}]")
-                    partner.flush()
+                    self.session.add(partner)
 
         return needs_human
 
@@ -258,7 +285,7 @@ class Policy:
     def approve(self):
         self.student.set_status_approved()
         self.student.set_log("Auto-approved.")
-        self.student.flush()
+        self.session.add(self.student)
 
         if not self.partners:
             message = "An extension request was automatically approved!"
@@ -266,15 +293,17 @@ class Policy:
             for partner in self.partners:
                 partner.set_status_approved()
                 partner.set_log(f"Auto-approved [request source: {self.student.get_email()}].")
-                partner.flush()
+                self.session.add(partner)
             message = "An extension request was automatically approved (for the submitter's partner(s), too!)"
 
         return message
 
     def send_email(self, target: StudentRecord):
         try:
-            email = Email.from_student_record(student=target, assignments=self.assignments)
-            email.send()
+            email = Email.from_student_record(
+                student=target, assignments=self.assignments, config=self.config, templates=self.email_templates
+            )
+            email.send(connection=self.email_connection)
         except Exception as err:
             print(err)
             self.slack.add_warning(
@@ -285,8 +314,8 @@ class Policy:
             )
 
     def extend_assignments(self, target: StudentRecord):
-        if Gradescope.is_enabled():
-            client = Gradescope()
+        if self.config.extend_gradescope_assignments:
+            client = self.gradescope if self.gradescope is not None else Gradescope.from_config(self.config)
             warnings = target.apply_extensions(assignments=self.assignments, gradescope=client)
             for warning in warnings:
                 self.slack.add_warning(warning)
@@ -0,0 +1,167 @@
+import random
+import time
+from threading import Lock
+from typing import Any, Callable, Dict, List
+
+from gspread.exceptions import APIError
+
+from src.errors import SheetError
+
+# Google Sheets allows 60 read and 60 write requests per minute per user; the service account is one user.
+SHEETS_REQUESTS_PER_MINUTE = 60
+SHEETS_BURST = 20
+
+# Retry throttled (429) and transient server errors with jittered exponential backoff. Writes that aren't
+# idempotent (appending or deleting rows) are only retried when throttled: Sheets rejects those before running them,
+# but a server error doesn't tell us whether the write happened.
+RETRYABLE_STATUS_CODES = [429, 500, 502, 503, 504]
+RETRYABLE_WRITE_STATUS_CODES = [429]
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 32.0
+
+
+class TokenBucket:
+    """
+    A token bucket: holds up to `capacity` tokens, refilled at `rate` tokens per second. Each API call takes a token,
+    waiting for one to become available if the bucket is empty, so bursts are smoothed out instead of rejected.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = capacity
+        self.updated_at = clock()
+        self.lock = Lock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Takes tokens from the bucket, blocking until they're available. Returns the number of seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            self.sleep(delay)
+            waited += delay
+
+    def available(self) -> float:
+        with self.lock:
+            self._refill()
+            return self.tokens
+
+
+class QuotaLimiter:
+    """
+    Wraps Sheets API calls for one spreadsheet: calls are rate-limited by a token bucket, and throttled or transient
+    failures are retried with jittered exponential backoff.
+    """
+
+    def __init__(self, bucket: TokenBucket, max_retries: int = MAX_RETRIES) -> None:
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.calls = 0
+        self.retries = 0
+        self.waited = 0.0
+
+        # Concurrent requests for the same spreadsheet share a limiter, so guard its counters.
+        self.lock = Lock()
+
+    def _record(self, calls: int = 0, retries: int = 0, waited: float = 0.0) -> None:
+        with self.lock:
+            self.calls += calls
+            self.retries += retries
+            self.waited += waited
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Calls a read, or a write that's safe to repeat (e.g. setting cells to values).
+        """
+        return self._call(RETRYABLE_STATUS_CODES, fn, *args, **kwargs)
+
+    def call_write(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Calls a write that isn't safe to repeat (e.g. appending or deleting rows). A server error is raised as a
+        SheetError rather than retried, since the write may have gone through; callers should re-read the sheet
+        before trying again (e.g. a retried submission's WriteSession reconciles against the roster).
+        """
+        try:
+            return self._call(RETRYABLE_WRITE_STATUS_CODES, fn, *args, **kwargs)
+        except APIError as err:
+            if err.response.status_code in RETRYABLE_STATUS_CODES:
+                raise SheetError(f"Google Sheets write may or may not have been applied: {err}")
+            raise
+
+    def _call(self, retryable_status_codes: List[int], fn: Callable[..., Any], *args, **kwargs) -> Any:
+        for attempt in range(self.max_retries + 1):
+            self._record(calls=1, waited=self.bucket.acquire())
+            try:
+                return fn(*args, **kwargs)
+            except APIError as err:
+                status_code = err.response.status_code
+                if status_code not in retryable_status_codes:
+                    raise
+                if attempt == self.max_retries:
+                    if status_code == 429:
+                        raise SheetError(f"Google Sheets quota exceeded after {self.max_retries} retries: {err}")
+                    raise
+
+                # "Full jitter": sleep a random amount up to the exponential bound, so concurrent callers spread out.
+                delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt))
+                self.bucket.sleep(delay)
+                self._record(retries=1, waited=delay)
+
+    def get_headroom(self) -> Dict[str, float]:
+        """
+        Reports how close this process is to the quota: tokens left in the bucket (calls we can make right now without
+        waiting), plus how many calls were made, retried, and how long we waited in total.
+        """
+        with self.lock:
+            return {
+                "available": round(self.bucket.available(), 2),
+                "capacity": self.bucket.capacity,
+                "calls": self.calls,
+                "retries": self.retries,
+                "waited_seconds": round(self.waited, 2),
+            }
+
+
+class QuotaRegistry:
+    """
+    Holds one QuotaLimiter per spreadsheet, shared by every request this process handles.
+    """
+
+    def __init__(self) -> None:
+        self.limiters: Dict[str, QuotaLimiter] = {}
+        self.lock = Lock()
+
+    def get(self, spreadsheet_id: str) -> QuotaLimiter:
+        with self.lock:
+            if spreadsheet_id not in self.limiters:
+                bucket = TokenBucket(rate=SHEETS_REQUESTS_PER_MINUTE / 60, capacity=SHEETS_BURST)
+                self.limiters[spreadsheet_id] = QuotaLimiter(bucket=bucket)
+            return self.limiters[spreadsheet_id]
+
+    def remove(self, spreadsheet_id: str) -> None:
+        with self.lock:
+            self.limiters.pop(spreadsheet_id, None)
+
+
+QUOTA_REGISTRY = QuotaRegistry()
@@ -1,16 +1,17 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-from dateutil.parser import parse
 from pytz import timezone
 
-from src.assignments import AssignmentList
-from src.errors import StudentRecordError
+from src.assignments import Assignment, AssignmentList
+from src.backends import format_cell_value
+from src.errors import SheetError, StudentRecordError
 from src.gradescope import Gradescope
-from src.sheets import Sheet
-from src.utils import cast_bool
+from src.sheets import Sheet, normalize_id
+from src.table import Row
+from src.utils import cast_bool, parse_timestamp
 
 APPROVAL_STATUS_REQUESTED_MEETING = "Requested Meeting"
 APPROVAL_STATUS_PENDING = "Pending"
@@ -19,6 +20,19 @@ APPROVAL_STATUS_AUTO_APPROVED = "Auto Approved"
 EMAIL_STATUS_PENDING = "Pending Approval"
 EMAIL_STATUS_IN_QUEUE = "In Queue"
 EMAIL_STATUS_AUTO_SENT = "Auto Sent"
+# Set by the email queue processor just before it sends a student's email, so a run that's cut off mid-send (on any
+# instance) leaves a record of which emails may have gone out.
+EMAIL_STATUS_SENDING = "Sending"
+
+# Roster rows are keyed by email.
+ROSTER_ID_COLUMN = "email"
+
+# A row appended for a student who (thanks to a concurrent submission) already had one is merged into the earlier row,
+# and left blank apart from its id, which gets this prefix so lookups skip it. Staff can delete these rows.
+DUPLICATE_ROW_MARKER = "DUPLICATE: "
+
+# How many times a commit re-checks the roster for rows created concurrently by another submission.
+MAX_COMMIT_ATTEMPTS = 3
 
 PST = timezone("US/Pacific")
 
@@ -29,7 +43,7 @@ class StudentRecord:
     serve as the source of truth for the student's extensions.
     """
 
-    def __init__(self, table_record: Dict[str, Any], table_index: int, sheet: Sheet) -> None:
+    def __init__(self, table_record: Union[Dict[str, Any], Row], table_index: int, sheet: Sheet) -> None:
         self.table_record = table_record
         self.table_index = table_index
         self.sheet = sheet
@@ -66,11 +80,11 @@ class StudentRecord:
         self.queue_write_back(col_key="email_status", col_value=status)
 
     def set_log(self, log: str):
-        if "last_run_output" in self.sheet.get_headers():
+        if self.sheet.has_column("last_run_output"):
             self.queue_write_back(col_key="last_run_output", col_value=log)
 
     def set_last_run_reason(self, reason: str):
-        if "last_run_reason" in self.sheet.get_headers():
+        if self.sheet.has_column("last_run_reason"):
             self.queue_write_back(col_key="last_run_reason", col_value=str(reason).replace("\n", " "))
 
     def set_status_requested_meeting(self):
@@ -85,79 +99,124 @@ class StudentRecord:
     def set_status_email_approved(self):
         self._queue_email_status(EMAIL_STATUS_AUTO_SENT)
 
+    def set_status_email_sending(self):
+        self._queue_email_status(EMAIL_STATUS_SENDING)
+
+    def set_status_email_queued(self):
+        self._queue_email_status(EMAIL_STATUS_IN_QUEUE)
+
     def set_status_approved(self):
         self._queue_approval_status(APPROVAL_STATUS_AUTO_APPROVED)
         self._queue_email_status(EMAIL_STATUS_AUTO_SENT)
 
     def should_flush_gradescope(self):
-        if "flush_gradescope" in self.sheet.get_headers():
+        if self.sheet.has_column("flush_gradescope"):
             return cast_bool(self.table_record["flush_gradescope"])
         return False
 
     def set_flush_gradescope_status_success(self):
-        if "flush_gradescope" in self.sheet.get_headers():
+        if self.sheet.has_column("flush_gradescope"):
             self.queue_write_back(col_key="flush_gradescope", col_value=False)
 
     def count_requests(self, assignments=AssignmentList):
-        count = 0
-        for assignment_id in assignments.get_all_ids():
-            if self.get_request(assignment_id=assignment_id) is not None:
-                count += 1
-        return count
+        return len([num_days for _, num_days in self.get_requests(assignments=assignments) if num_days is not None])
+
+    def get_requests(self, assignments: AssignmentList) -> List[Tuple[Assignment, Optional[int]]]:
+        """
+        Returns each assignment with the number of days requested for it (or None). Rows of a loaded roster are read
+        by position, using the assignments' precomputed roster columns.
+        """
+        if not isinstance(self.table_record, Row):
+            return [(assignment, self.get_request(assignment_id=assignment.get_id())) for assignment in assignments]
+
+        table, row = self.table_record.locate()
+        requests = []
+        for assignment, col in zip(assignments, assignments.get_roster_columns(table.columns)):
+            if col is None:
+                # Raises the same error as a lookup by name.
+                requests.append((assignment, self.get_request(assignment_id=assignment.get_id())))
+            else:
+                requests.append((assignment, self._parse_request(assignment.get_id(), table.get_raw(row, col))))
+        return requests
 
     def get_request(self, assignment_id: str) -> Optional[int]:
         try:
-            result = str(self.table_record[assignment_id])
-            result = result.strip()
+            value = self.table_record[assignment_id]
+        except Exception as err:
+            raise self._request_error(assignment_id, err)
+        return self._parse_request(assignment_id, value)
+
+    def _parse_request(self, assignment_id: str, value: Any) -> Optional[int]:
+        try:
+            result = str(value).strip()
             if len(result) > 0:
                 return int(result)
             return None
         except Exception as err:
-            raise StudentRecordError(
-                f"An error occurred while fetching assignment with ID {assignment_id}.\n"
-                + f"Table Record: {self.table_record}\n"
-                + f"Table Index: {self.table_index}\n"
-                + f"Error: {err}"
-            )
+            raise self._request_error(assignment_id, err)
+
+    def _request_error(self, assignment_id: str, err: Exception) -> StudentRecordError:
+        return StudentRecordError(
+            f"An error occurred while fetching assignment with ID {assignment_id}.\n"
+            + f"Table Record: {self.table_record}\n"
+            + f"Table Index: {self.table_index}\n"
+            + f"Error: {err}"
+        )
 
     def queue_write_back(self, col_key: str, col_value: Any) -> Optional[str]:
         self.write_queue[col_key] = col_value
 
     def set_last_run_timestamp(self, timestamp: str):
-        if "last_run_timestamp" in self.sheet.get_headers():
-            timestamp: datetime = parse(timestamp)
+        if self.sheet.has_column("last_run_timestamp"):
+            timestamp: datetime = parse_timestamp(timestamp)
             if not timestamp.tzinfo:
                 timestamp = PST.localize(timestamp)
             self.queue_write_back(
                 col_key="last_run_timestamp", col_value=str(timestamp.strftime("%-m/%-d/%Y %H:%M:%S"))
             )
 
-    def flush(self):
-        headers = self.sheet.get_headers()
-
-        if self.table_index == -1:
-            values = [self.write_queue.get(header) for header in headers]
-            self.sheet.append_row(values=values, value_input_option="USER_ENTERED")
-
-            # Update local table_record object for email.
-            for col, value in self.write_queue.items():
-                self.table_record[col] = value
+    def is_new(self) -> bool:
+        return self.table_index == -1
+
+    def get_new_row_values(self) -> List[Any]:
+        return [self.write_queue.get(header) for header in self.sheet.get_headers()]
+
+    def get_pending_cells(self) -> List[List[Any]]:
+        cells = []
+        for col, value in self.write_queue.items():
+            col_index = self.sheet.get_column_index(col)
+            if col_index is None:
+                raise SheetError(f"Could not find a column named {col} in the roster.")
+            cells.append([self.table_index, col_index, value])
+        return cells
+
+    def mark_flushed(self, table_index: int):
+        # Update local table_record object for email.
+        for col, value in self.write_queue.items():
+            self.table_record[col] = value
+        self.table_index = table_index
+        self.write_queue = {}
 
-        else:
-            cells = []
-            for col, value in self.write_queue.items():
-                row_index = self.table_index
-                col_index = headers.index(col)
-                cells.append([row_index, col_index, value])
+    def rebind(self, table_index: int, table_record: Union[Dict[str, Any], Row]):
+        """
+        Points this record at a (possibly different) row, keeping its queued writes. Used when the roster changed
+        underneath us, e.g. a concurrent submission inserted this student's row, or rows shifted.
+        """
+        if table_index == -1:
+            # Our row is gone, so re-create it in full.
+            for col, value in self.table_record.items():
+                self.write_queue.setdefault(col, value)
+        self.table_index = table_index
+        self.table_record = table_record
 
-                # Update local table_record object for email.
-                self.table_record[col] = value
-            self.sheet.update_cells(cells=cells)
+    def flush(self):
+        session = WriteSession()
+        session.add(self)
+        session.commit()
 
     def apply_extensions(self, assignments: AssignmentList, gradescope: Gradescope) -> List[str]:
         warnings = []
-        for assignment in assignments:
-            num_days = self.get_request(assignment_id=assignment.get_id())
+        for assignment, num_days in self.get_requests(assignments=assignments):
             if num_days:
                 if len(assignment.get_gradescope_assignment_urls()) == 0:
                     print(
@@ -181,10 +240,25 @@ class StudentRecord:
                     warnings.extend(warnings)
         return warnings
 
+    @staticmethod
+    def from_emails(emails: List[str], sheet_records: Sheet) -> List[StudentRecord]:
+        emails = [email.lower() for email in emails]
+        query_results = sheet_records.get_records_by_ids(id_column=ROSTER_ID_COLUMN, id_values=emails)
+        return [
+            StudentRecord._from_query_result(
+                email=email, query_result=query_results[email], sheet_records=sheet_records
+            )
+            for email in emails
+        ]
+
     @staticmethod
     def from_email(email: str, sheet_records: Sheet) -> StudentRecord:
         email = email.lower()
-        query_result = sheet_records.get_record_by_id(id_column="email", id_value=email)
+        query_result = sheet_records.get_record_by_id(id_column=ROSTER_ID_COLUMN, id_value=email)
+        return StudentRecord._from_query_result(email=email, query_result=query_result, sheet_records=sheet_records)
+
+    @staticmethod
+    def _from_query_result(email: str, query_result: Optional[Tuple[int, Row]], sheet_records: Sheet) -> StudentRecord:
         if query_result:
             return StudentRecord(table_index=query_result[0], table_record=query_result[1], sheet=sheet_records)
         else:
@@ -197,3 +271,138 @@ class StudentRecord:
             )
             new_record.queue_write_back(col_key="email", col_value=email)
             return new_record
+
+
+class WriteSession:
+    """
+    A unit of work for roster writes. Records touched while handling a request are added to the session, and their
+    queued writes are committed together: one cell update for existing rows, plus at most one multi-row append for
+    new rows (per sheet).
+
+    Several submissions may be processed at once, so commits are optimistic: before writing, we re-read the id
+    column and rebind records whose rows moved or were created by someone else (turning appends into updates). After
+    appending, we re-read it again; if a concurrent submission appended a row for the same student, the earliest row
+    wins and ours is folded into it.
+    """
+
+    def __init__(self) -> None:
+        self.records: List[StudentRecord] = []
+
+    def add(self, record: StudentRecord):
+        if not any(staged is record for staged in self.records):
+            self.records.append(record)
+
+    def add_changes(self, sheet: Sheet, edited: Sheet):
+        """
+        Stages every difference between `edited` (a working copy of `sheet`, e.g. in a local SQLite database) and
+        `sheet`: changed cells of existing rows, and rows appended to the copy.
+        """
+        headers = sheet.get_headers()
+        for row_index, row in enumerate(edited.get_all_records()):
+            if row_index < len(sheet.table):
+                record = StudentRecord(table_index=row_index, table_record=sheet.table.get_row(row_index), sheet=sheet)
+                for col_index, header in enumerate(headers):
+                    value = edited.table.get_raw(row_index, col_index)
+                    if format_cell_value(value) != format_cell_value(sheet.table.get_raw(row_index, col_index)):
+                        record.queue_write_back(col_key=header, col_value=value)
+            else:
+                record = StudentRecord(table_index=-1, table_record=dict(row), sheet=sheet)
+                for col_index, header in enumerate(headers):
+                    value = edited.table.get_raw(row_index, col_index)
+                    if value != "":
+                        record.queue_write_back(col_key=header, col_value=value)
+            if len(record.write_queue) > 0:
+                self.add(record)
+
+    def commit(self):
+        sheets: List[Sheet] = []
+        for record in self.records:
+            if not any(sheet is record.sheet for sheet in sheets):
+                sheets.append(record.sheet)
+
+        for sheet in sheets:
+            records = [record for record in self.records if record.sheet is sheet]
+            if not any(len(record.write_queue) > 0 for record in records):
+                continue
+
+            self._reconcile(sheet=sheet, records=records)
+
+            # Table records are views of the sheet's rows, so only mark them flushed once the sheet has seen the
+            # writes (otherwise, they'd look unchanged and be skipped).
+            existing_records = [record for record in records if not record.is_new()]
+            sheet.update_cells(cells=[cell for record in existing_records for cell in record.get_pending_cells()])
+            for record in existing_records:
+                record.mark_flushed(table_index=record.table_index)
+
+            new_records = [record for record in records if record.is_new()]
+            rows = [record.get_new_row_values() for record in new_records]
+            row_indexes = sheet.append_rows(rows=rows, value_input_option="USER_ENTERED")
+            for record, row_index in zip(new_records, row_indexes):
+                record.mark_flushed(table_index=row_index)
+
+            self._resolve_duplicates(sheet=sheet, records=records, appended=list(zip(new_records, rows)))
+
+        self.records = []
+
+    def _reconcile(self, sheet: Sheet, records: List[StudentRecord]):
+        if not sheet.is_stale(ROSTER_ID_COLUMN):
+            return
+        sheet.reload()
+        for record in records:
+            query_result = sheet.get_record_by_id(id_column=ROSTER_ID_COLUMN, id_value=record.get_email())
+            if query_result:
+                record.rebind(table_index=query_result[0], table_record=query_result[1])
+            elif not record.is_new():
+                record.rebind(table_index=-1, table_record=record.table_record)
+
+    def _resolve_duplicates(
+        self, sheet: Sheet, records: List[StudentRecord], appended: List[Tuple[StudentRecord, List[Any]]]
+    ):
+        # Only appends can create duplicates; updates to existing rows don't need another read.
+        if len(appended) == 0:
+            return
+        for _ in range(MAX_COMMIT_ATTEMPTS):
+            remote = [normalize_id(value) for value in sheet.fetch_column(ROSTER_ID_COLUMN)]
+            conflicts = [
+                (record, values)
+                for record, values in appended
+                if remote.count(normalize_id(record.get_email())) > 1
+                and remote.index(normalize_id(record.get_email())) != record.table_index
+            ]
+            if len(conflicts) == 0:
+                return
+
+            # Reloading replaces the sheet's table, so move the other records' views onto it.
+            sheet.reload()
+            for other in records:
+                if not any(other is record for record, _ in conflicts):
+                    query_result = sheet.get_record_by_id(id_column=ROSTER_ID_COLUMN, id_value=other.get_email())
+                    if query_result:
+                        other.rebind(table_index=query_result[0], table_record=query_result[1])
+            for record, values in conflicts:
+                email = normalize_id(record.get_email())
+                rows = [
+                    i
+                    for i, row in enumerate(sheet.get_all_records())
+                    if normalize_id(row.get(ROSTER_ID_COLUMN)) == email
+                ]
+                if record.table_index not in rows[1:]:
+                    # Either the duplicate is already gone, or rows shifted and we can no longer tell which copy
+                    # is ours; in the latter case, leave it for staff rather than risk clearing the wrong row.
+                    if len(rows) > 1:
+                        print(f"Found duplicate roster rows for {email}, but could not safely merge them.")
+                    record.rebind(table_index=rows[0], table_record=sheet.get_all_records()[rows[0]])
+                    continue
+
+                # Fold what we appended into the earliest row for this student. Deleting our copy would shift rows
+                # under concurrent writers (which write by position), so it's cleared and marked for staff instead.
+                filled = [col for col, value in enumerate(values) if value is not None and value != ""]
+                id_col = sheet.get_column_index(ROSTER_ID_COLUMN)
+                cells = [[rows[0], col, values[col]] for col in filled]
+                cells += [[record.table_index, col, ""] for col in filled if col != id_col]
+                cells.append([record.table_index, id_col, DUPLICATE_ROW_MARKER + record.get_email()])
+                sheet.update_cells(cells=cells)
+                print(f"Merged a duplicate roster row for {email} into row {rows[0] + 2}; its copy can be deleted.")
+                record.rebind(table_index=rows[0], table_record=sheet.get_all_records()[rows[0]])
+
+        raise SheetError("Could not commit roster writes: other submissions kept modifying the same rows.")
@@ -0,0 +1,211 @@
+"""
+Replays historical form submissions through Policy against a local snapshot of a course's spreadsheet, without
+touching the live sheet, Slack, email or Gradescope. Useful for benchmarking ("how long would last semester's
+submissions take?") and for trying out policy changes ("what would a threshold of 5 days have done?").
+
+Usage:
+    python -m src.replay snapshot.json submissions.jsonl [--set AUTO_APPROVE_THRESHOLD=5] [--output report.json]
+
+The snapshot is a JSON object mapping tab names to rows (see SqliteSpreadsheetBackend.export_snapshot), and must
+include the Environment Variables, Assignments, Form Questions and Roster tabs. Each line of the JSONL file is a
+`form_data` payload, or a whole request in the format of the files in test_data/ (with a `form_data` key).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from src.config import PolicyConfig
+from src.errors import KnownError
+from src.handle_form_submit import get_submission_time
+from src.policy import Policy
+from src.record import ROSTER_ID_COLUMN
+from src.sheets import (
+    SHEET_ASSIGNMENTS,
+    SHEET_ENVIRONMENT_VARIABLES,
+    SHEET_FORM_QUESTIONS,
+    SHEET_STUDENT_RECORDS,
+    Sheet,
+    normalize_id,
+)
+from src.slack import SlackManager
+from src.sqlite_backend import SqliteSpreadsheetBackend
+
+REPLAY_STAGES = ["submission", "records", "apply"]
+
+
+def load_submissions(path: str) -> List[Dict[str, Any]]:
+    """
+    Reads form_data payloads from a JSONL file, skipping blank lines.
+    """
+    submissions = []
+    with open(path) as f:
+        for line in f:
+            if line.strip() == "":
+                continue
+            payload = json.loads(line)
+            submissions.append(payload["form_data"] if "form_data" in payload else payload)
+    return submissions
+
+
+def diff_rosters(before: List[List[Any]], after: List[List[Any]]) -> List[Dict[str, Any]]:
+    """
+    Lists the cells that changed between two copies of the roster, matching rows by email. Rows added by the replay
+    are compared against blank cells.
+    """
+    if len(after) == 0:
+        return []
+    headers = after[0]
+    id_col = headers.index(ROSTER_ID_COLUMN)
+    before_headers = before[0] if len(before) > 0 else []
+    before_rows = {normalize_id(row[id_col]): row for row in before[1:] if id_col < len(row)}
+
+    changes = []
+    for row in after[1:]:
+        old_row = before_rows.get(normalize_id(row[id_col]), [])
+        for col, header in enumerate(headers):
+            old_col = before_headers.index(header) if header in before_headers else len(old_row)
+            old_value = old_row[old_col] if old_col < len(old_row) else ""
+            if old_value != row[col]:
+                changes.append({"email": row[id_col], "column": header, "before": old_value, "after": row[col]})
+    return changes
+
+
+class ReplayReport:
+    """
+    The result of a replay: outcome counts, wall-clock timings per stage, and the roster cells that changed.
+    """
+
+    def __init__(self) -> None:
+        self.outcomes: Counter = Counter()
+        self.errors: List[str] = []
+        self.timings: Dict[str, float] = {stage: 0.0 for stage in REPLAY_STAGES}
+        self.submissions = 0
+        self.elapsed = 0.0
+        self.changes: List[Dict[str, Any]] = []
+
+    def get_throughput(self) -> float:
+        """
+        Submissions processed per second, excluding the time spent loading the snapshot.
+        """
+        return self.submissions / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "submissions": self.submissions,
+            "elapsed_seconds": round(self.elapsed, 4),
+            "throughput_per_second": round(self.get_throughput(), 2),
+            "stage_seconds": {stage: round(seconds, 4) for stage, seconds in self.timings.items()},
+            "outcomes": dict(self.outcomes),
+            "errors": self.errors,
+            "changes": self.changes,
+        }
+
+
+class Replay:
+    """
+    Runs submissions through Policy.apply(silent=True) against an in-memory copy of a snapshot. Policy only reads
+    the time from each submission's Timestamp, so replays are deterministic; `clock` is only used to time stages.
+    """
+
+    def __init__(
+        self,
+        snapshot_path: str,
+        overrides: Optional[Dict[str, str]] = None,
+        clock: Callable[[], float] = time.perf_counter,
+    ) -> None:
+        self.clock = clock
+        self.backend = SqliteSpreadsheetBackend()
+        self.backend.load_snapshot(snapshot_path)
+
+        sheets = {
+            sheet_name: Sheet(backend=self.backend.get_sheet_backend(sheet_name))
+            for sheet_name in [SHEET_ENVIRONMENT_VARIABLES, SHEET_ASSIGNMENTS, SHEET_FORM_QUESTIONS]
+        }
+        self.sheet_assignments = sheets[SHEET_ASSIGNMENTS]
+        self.sheet_form_questions = sheets[SHEET_FORM_QUESTIONS]
+        self.sheet_records = Sheet(backend=self.backend.get_sheet_backend(SHEET_STUDENT_RECORDS))
+
+        # Overrides are applied like extra rows at the bottom of the Environment Variables tab.
+        records: List[Dict[str, Any]] = [
+            dict(record) for record in sheets[SHEET_ENVIRONMENT_VARIABLES].get_all_records()
+        ]
+        records.extend({"key": key, "value": value} for key, value in (overrides or {}).items())
+        self.config = PolicyConfig.from_records(records)
+
+    def run(self, submissions: List[Dict[str, Any]], quiet: bool = True) -> ReplayReport:
+        """
+        Applies the submissions in timestamp order, like handle_form_submit_batch. If quiet, the (suppressed) Slack
+        messages Policy prints are discarded.
+        """
+        report = ReplayReport()
+        before = self.backend.export_tab(SHEET_STUDENT_RECORDS)
+
+        with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+            started = self.clock()
+            for form_data in sorted(submissions, key=get_submission_time):
+                report.outcomes[self.apply(form_data, report)] += 1
+                report.submissions += 1
+            report.elapsed = self.clock() - started
+
+        report.changes = diff_rosters(before, self.backend.export_tab(SHEET_STUDENT_RECORDS))
+        return report
+
+    def apply(self, form_data: Dict[str, Any], report: ReplayReport) -> str:
+        """
+        Replays one submission, adding its stage timings to the report, and returns its outcome.
+        """
+        started = self.clock()
+        try:
+            policy = Policy(
+                sheet_assignments=self.sheet_assignments,
+                sheet_form_questions=self.sheet_form_questions,
+                form_payload=form_data,
+                slack=SlackManager(config=self.config),
+                config=self.config,
+            )
+            built = self.clock()
+            report.timings["submission"] += built - started
+
+            policy.fetch_student_records(sheet_records=self.sheet_records)
+            fetched = self.clock()
+            report.timings["records"] += fetched - built
+
+            approved = policy.apply(silent=True)
+            report.timings["apply"] += self.clock() - fetched
+        except KnownError as err:
+            report.errors.append(f"{form_data.get('Timestamp', ['?'])[0]}: {err}")
+            return "error"
+        return "approved" if approved else "manual"
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay form submissions against a local spreadsheet snapshot.")
+    parser.add_argument("snapshot", help="JSON snapshot of the course's spreadsheet")
+    parser.add_argument("submissions", help="JSONL file of form_data payloads")
+    parser.add_argument(
+        "--set", action="append", default=[], metavar="KEY=VALUE", help="override an environment variable"
+    )
+    parser.add_argument("--output", help="write the full report (including the roster diff) to this file")
+    parser.add_argument("--verbose", action="store_true", help="print Policy's output while replaying")
+    options = parser.parse_args(args)
+
+    overrides = dict(item.split("=", 1) for item in options.set)
+    report = Replay(options.snapshot, overrides=overrides).run(
+        load_submissions(options.submissions), quiet=not options.verbose
+    )
+
+    summary = report.to_dict()
+    summary["changes"] = len(report.changes)
+    print(json.dumps(summary, indent=2))
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(report.to_dict(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
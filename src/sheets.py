@@ -1,50 +1,229 @@
-import os
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-import gspread
 from gspread.worksheet import Worksheet
 
+from src.backends import (
+    GspreadSheetBackend,
+    GspreadSpreadsheetBackend,
+    SheetBackend,
+    SpreadsheetBackend,
+    format_cell_value,
+)
 from src.errors import SheetError
+from src.sqlite_backend import SQLITE_REGISTRY, is_local_spreadsheet_url
+from src.table import Row, Table
+from src.tenants import TENANT_REGISTRY
 
 SHEET_STUDENT_RECORDS = "Roster"
 SHEET_ASSIGNMENTS = "Assignments"
 SHEET_FORM_QUESTIONS = "Form Questions"
 SHEET_ENVIRONMENT_VARIABLES = "Environment Variables"
+SHEET_EMAIL_TEMPLATES = "Email Templates"
+SHEET_OUTBOX = "Outbox"
+
+# Tabs that only change when staff edit the course configuration; these are safe to cache across invocations.
+CONFIG_SHEETS = [SHEET_ASSIGNMENTS, SHEET_FORM_QUESTIONS, SHEET_ENVIRONMENT_VARIABLES, SHEET_EMAIL_TEMPLATES]
+
+
+def get_revision_distance(old_revision: str, new_revision: str) -> Optional[int]:
+    """
+    How many edits apart two revisions are, or None if that can't be told (revisions that aren't numbers).
+    """
+    try:
+        return int(new_revision) - int(old_revision)
+    except ValueError:
+        return None
+
+
+def normalize_id(value: Any) -> str:
+    return str(value).lower()
+
+
+def coalesce_rows(rows: List[int]) -> List[Tuple[int, int]]:
+    """
+    Merges row numbers into spans of consecutive rows, given as (first row, last row).
+    """
+    spans: List[Tuple[int, int]] = []
+    for row in sorted(set(rows)):
+        if len(spans) > 0 and spans[-1][1] == row - 1:
+            spans[-1] = (spans[-1][0], row)
+        else:
+            spans.append((row, row))
+    return spans
+
+
+def coalesce_cells(cells: List[Any]) -> List[Tuple[int, int, List[List[Any]]]]:
+    """
+    Merges (row, col, value) cells into rectangular blocks: adjacent columns in a row form a run, and runs spanning
+    the same columns in consecutive rows are stacked. Returns (top row, left col, values) for each block. Later
+    values for the same cell win.
+    """
+    grid: Dict[Tuple[int, int], Any] = {}
+    for row, col, value in cells:
+        grid[(row, col)] = value
+
+    # Split each row into runs of adjacent columns.
+    runs: List[Tuple[int, int, int]] = []
+    for row, col in sorted(grid.keys()):
+        if len(runs) > 0 and runs[-1][0] == row and runs[-1][2] == col - 1:
+            runs[-1] = (row, runs[-1][1], col)
+        else:
+            runs.append((row, col, col))
+
+    # Stack runs covering the same columns in consecutive rows. Blocks are keyed by their column span.
+    blocks: List[List[int]] = []
+    open_blocks: Dict[Tuple[int, int], List[int]] = {}
+    for row, first_col, last_col in runs:
+        block = open_blocks.get((first_col, last_col))
+        if block is not None and block[1] == row - 1:
+            block[1] = row
+        else:
+            block = [row, row, first_col, last_col]
+            open_blocks[(first_col, last_col)] = block
+            blocks.append(block)
+
+    return [
+        (
+            first_row,
+            first_col,
+            [[grid[(row, col)] for col in range(first_col, last_col + 1)] for row in range(first_row, last_row + 1)],
+        )
+        for first_row, last_row, first_col, last_col in blocks
+    ]
 
 
 class Sheet:
     """
-    A wrapper around a Google Sheets "sheet" (e.g. one tab of a spreadsheet).
+    A wrapper around a Google Sheets "sheet" (e.g. one tab of a spreadsheet). Storage is handled by a SheetBackend;
+    by default, the given gspread Worksheet.
     """
 
-    def __init__(self, sheet: Worksheet) -> None:
-        self.sheet: Worksheet = sheet
-        self.all_values = self.sheet.get_all_values()
-        self.all_records = self.sheet.get_all_records()
-        self.headers = self.all_values[0]
+    def __init__(
+        self,
+        sheet: Optional[Worksheet] = None,
+        values: Optional[List[List[Any]]] = None,
+        backend: Optional[SheetBackend] = None,
+    ) -> None:
+        self.backend: SheetBackend = backend if backend is not None else GspreadSheetBackend(sheet)
+        self.load(values if values is not None else self.backend.get_all_values())
+
+        # How many writes we've sent (each bumps the spreadsheet's revision once).
+        self.writes = 0
+
+    @property
+    def sheet(self) -> Optional[Worksheet]:
+        return getattr(self.backend, "worksheet", None)
+
+    def load(self, values: List[List[Any]]) -> None:
+        self.table = Table(values)
+        self.headers = self.table.headers
+        self.memos: Dict[str, Any] = {}
+
+        # Lazily built, case-normalized lookups from an id column's value to a data-relative row index.
+        self.indexes: Dict[str, Dict[str, int]] = {}
+
+    def reload(self) -> None:
+        """
+        Re-reads the whole sheet, e.g. after detecting that another process has changed its rows.
+        """
+        self.load(self.backend.get_all_values())
+
+    def fetch_column(self, header: str) -> List[Any]:
+        """
+        Reads the current (remote) values of one column, without the header. This is much cheaper than a reload, and
+        lets us check whether rows have moved since we loaded the sheet.
+        """
+        return self.backend.get_column(self.headers.index(header) + 1)[1:]
+
+    def is_stale(self, header: str) -> bool:
+        remote = [normalize_id(value) for value in self.fetch_column(header)]
+        local = [normalize_id(value) for value in self.table.get_column(header)]
+
+        # col_values omits trailing blank cells, so compare against the local column the same way.
+        while len(local) > 0 and local[-1] == "":
+            local.pop()
+        return remote != local
 
     def get_headers(self) -> List[str]:
         return self.headers
 
+    def has_column(self, header: str) -> bool:
+        return header in self.table.columns
+
+    def get_column_index(self, header: str) -> Optional[int]:
+        return self.table.columns.get(header)
+
     def get_all_values(self) -> List[List[Any]]:
-        return self.all_values
+        return self.table.get_values()
 
-    def get_all_records(self) -> List[Dict[str, Any]]:
-        return self.all_records
+    def get_all_records(self) -> List[Row]:
+        return self.table.get_rows()
 
-    def get_record_by_id(self, id_column: str, id_value: str) -> Optional[Tuple[int, Dict[str, Any]]]:
-        all_records = self.get_all_records()
-        for i, record in enumerate(all_records):
-            if str(record.get(id_column)).lower() == str(id_value).lower():
-                return (i, record)
-        return None
+    def memoize(self, key: str, factory: Callable[[], Any]) -> Any:
+        """
+        Returns a value derived from this sheet's contents (e.g. a parsed AssignmentList), computing it on first use.
+        Cached sheets are reused across invocations, so their derived values are too.
+        """
+        if key not in self.memos:
+            self.memos[key] = factory()
+        return self.memos[key]
+
+    def get_index(self, id_column: str) -> Dict[str, int]:
+        if id_column not in self.indexes:
+            index: Dict[str, int] = {}
+            for i, value in enumerate(self.table.get_column(id_column)):
+                # Keep the first matching row, like a top-to-bottom scan would.
+                index.setdefault(normalize_id(value), i)
+            self.indexes[id_column] = index
+        return self.indexes[id_column]
+
+    def get_record_by_id(self, id_column: str, id_value: str) -> Optional[Tuple[int, Row]]:
+        row_index = self.get_index(id_column).get(normalize_id(id_value))
+        if row_index is None:
+            return None
+        return (row_index, self.table.get_row(row_index))
+
+    def get_records_by_ids(self, id_column: str, id_values: List[str]) -> Dict[str, Optional[Tuple[int, Row]]]:
+        return {id_value: self.get_record_by_id(id_column=id_column, id_value=id_value) for id_value in id_values}
+
+    def _set_local_value(self, row_index: int, col_index: int, value: Any) -> None:
+        """
+        Mirrors a write into the loaded table, so lookups later in this request see it.
+        """
+        header = self.headers[col_index]
+        if header in self.indexes:
+            index = self.indexes[header]
+            old_key = normalize_id(self.table.get_raw(row_index, col_index))
+            if index.get(old_key) == row_index:
+                del index[old_key]
+            index.setdefault(normalize_id(value), row_index)
+
+        self.table.set_raw(row_index, col_index, value)
+
+    def get_dirty_cells(self, cells: List[Any]) -> List[Any]:
+        """
+        Filters out writes that would leave a cell unchanged, compared to the values we loaded (or last wrote).
+        """
+        dirty = []
+        for row, col, value in cells:
+            if format_cell_value(value) != format_cell_value(self.table.get_raw(row, col)):
+                dirty.append([row, col, value])
+        return dirty
 
     def update_cells(self, cells: List[Any]):
-        gspread_cells: List[gspread.Cell] = []
+        """
+        Writes (row_index, col_index, value) cells, using data-relative indexes (see update_cell). Unchanged cells are
+        dropped, and the rest are merged into rectangular ranges and sent with a single batch update.
+        """
+        cells = self.get_dirty_cells(cells)
+        if len(cells) == 0:
+            return
+
+        self.backend.update_ranges([(row + 2, col + 1, values) for row, col, values in coalesce_cells(cells)])
+        self.writes += 1
+
         for row, col, value in cells:
-            gspread_cells.append(gspread.Cell(row=row + 2, col=col + 1, value=value))
-        if len(gspread_cells) > 0:
-            self.sheet.update_cells(gspread_cells, value_input_option="USER_ENTERED")
+            self._set_local_value(row_index=row, col_index=col, value=value)
 
     def update_cell(self, row_index: int, col_index: int, value: Any) -> Dict[str, Any]:
         """
@@ -54,10 +233,56 @@ class Sheet:
         """
         row = row_index + 2
         col = col_index + 1
-        self.sheet.update_cell(row, col, value)
+        self.backend.update_ranges([(row, col, [[value]])])
+        self.writes += 1
+        self._set_local_value(row_index=row_index, col_index=col_index, value=value)
+
+    def append_row(self, values: List[Any], value_input_option: str) -> int:
+        """
+        Appends a row, and returns its data-relative row index.
+        """
+        return self.append_rows(rows=[values], value_input_option=value_input_option)[0]
+
+    def append_rows(self, rows: List[List[Any]], value_input_option: str) -> List[int]:
+        """
+        Appends several rows with a single API call, and returns their data-relative row indexes.
+        """
+        if len(rows) == 0:
+            return []
+        # Other processes may have appended rows since we loaded, so use the row the backend reports.
+        first_index = self.backend.append_rows(rows=rows, value_input_option=value_input_option) - 2
+        self.writes += 1
+        if first_index != len(self.table):
+            self.reload()
+            return list(range(first_index, first_index + len(rows)))
 
-    def append_row(self, values: List[Any], value_input_option: str):
-        self.sheet.append_row(values=values, value_input_option=value_input_option)
+        row_indexes = []
+        for values in rows:
+            row_index = len(self.table)
+            self.table.append(values)
+            for id_column, index in self.indexes.items():
+                index.setdefault(normalize_id(self.table.get_column(id_column)[row_index]), row_index)
+            row_indexes.append(row_index)
+        return row_indexes
+
+    def delete_row(self, row_index: int) -> None:
+        """
+        Deletes a row, using a data-relative row_index (see update_cell). Rows below it shift up by one.
+        """
+        self.backend.delete_row(row_index + 2)
+        self.writes += 1
+        self.table = self.table.without_row(row_index)
+        self.indexes = {}
+
+
+def open_spreadsheet_backend(spreadsheet_url: str) -> SpreadsheetBackend:
+    """
+    Picks a storage backend for a spreadsheet URL: sqlite:// URLs open a SQLite spreadsheet registered in this
+    process (see SqliteRegistry), and anything else is treated as a Google Sheets URL.
+    """
+    if is_local_spreadsheet_url(spreadsheet_url):
+        return SQLITE_REGISTRY.open(spreadsheet_url)
+    return GspreadSpreadsheetBackend(spreadsheet_url)
 
 
 class BaseSpreadsheet:
@@ -65,12 +290,149 @@ class BaseSpreadsheet:
     A pointer to the master spreadsheet.
     """
 
-    def __init__(self, spreadsheet_url: str) -> None:
-        if not os.path.exists("service-account.json"):
-            raise SheetError("Could not find Google Service Account at service-account.json.")
-
+    def __init__(self, spreadsheet_url: str, backend: Optional[SpreadsheetBackend] = None) -> None:
         self.spreadsheet_url = spreadsheet_url
-        self.spreadsheet = gspread.service_account("service-account.json").open_by_url(spreadsheet_url)
+        self.backend = backend if backend is not None else open_spreadsheet_backend(spreadsheet_url)
+        self.cache = TENANT_REGISTRY.get(spreadsheet_url).cache
+        self.revision: Optional[str] = None
+
+        # Sheets we've loaded (and may write to), writes to tabs we didn't load (see append_to_sheet), and how many
+        # writes the cache has been restamped past.
+        self.sheets: List[Sheet] = []
+        self.writes = 0
+        self.restamped_writes = 0
+
+    def get_revision(self) -> Optional[str]:
+        """
+        Fetches the spreadsheet's revision (a version that changes on every edit). This is a cheap metadata call, used
+        to validate cached configuration tabs. Returns None if the revision is unavailable.
+        """
+        return self.backend.get_revision()
 
     def get_sheet(self, sheet_name: str) -> Sheet:
-        return Sheet(sheet=self.spreadsheet.worksheet(sheet_name))
+        return self.track(Sheet(backend=self.backend.get_sheet_backends([sheet_name])[sheet_name]))
+
+    def track(self, sheet: Sheet) -> Sheet:
+        self.sheets.append(sheet)
+        return sheet
+
+    def get_sheets(self, sheet_names: List[str], optional: Optional[List[str]] = None) -> Dict[str, Sheet]:
+        """
+        Loads several sheets at once. For Google Sheets, all values are fetched with a single `values_batch_get` call
+        (plus one metadata call to resolve the worksheets), instead of two full reads per sheet. Configuration tabs are
+        served from the course's cache when the spreadsheet's revision hasn't changed since they were loaded.
+
+        Tabs listed in `optional` may be missing from the spreadsheet; they're returned as empty sheets.
+        """
+        optional = optional or []
+        sheet_names = sheet_names + [sheet_name for sheet_name in optional if sheet_name not in sheet_names]
+        sheets: Dict[str, Sheet] = {}
+        if any(sheet_name in CONFIG_SHEETS for sheet_name in sheet_names):
+            self.revision = self.get_revision()
+        if self.revision is not None:
+            for sheet_name in sheet_names:
+                if sheet_name in CONFIG_SHEETS:
+                    cached = self.cache.get(self.spreadsheet_url, sheet_name, self.revision)
+                    if cached is not None:
+                        sheets[sheet_name] = cached
+
+        missing = [sheet_name for sheet_name in sheet_names if sheet_name not in sheets]
+        if any(sheet_name in optional for sheet_name in missing):
+            titles = self.backend.get_titles()
+            for sheet_name in [sheet_name for sheet_name in missing if sheet_name in optional]:
+                if sheet_name not in titles:
+                    sheets[sheet_name] = Sheet(values=[])
+                    if sheet_name in CONFIG_SHEETS and self.revision is not None:
+                        self.cache.put(self.spreadsheet_url, sheet_name, self.revision, sheets[sheet_name])
+            missing = [sheet_name for sheet_name in missing if sheet_name not in sheets]
+        if len(missing) == 0:
+            return sheets
+
+        backends = self.backend.get_sheet_backends(missing)
+        for sheet_name, values in self.backend.batch_get_values(missing).items():
+            sheets[sheet_name] = self.track(Sheet(backend=backends[sheet_name], values=values))
+            if sheet_name in CONFIG_SHEETS and self.revision is not None:
+                self.cache.put(self.spreadsheet_url, sheet_name, self.revision, sheets[sheet_name])
+        return sheets
+
+    def get_sheet_rows(self, sheet_name: str, id_column: str, id_values: List[str]) -> Sheet:
+        """
+        Loads only the rows of a sheet whose id_column matches one of id_values (e.g. a student and their partners),
+        so the request size doesn't grow with the roster. The id column is fetched first, then the header row and the
+        matching rows are fetched with a single batch call.
+
+        The returned Sheet has every row's id, but other cells are blank outside the matching rows; use it for
+        lookups and writes by id, not to read the whole sheet.
+        """
+        backend = self.backend.get_sheet_backends([sheet_name])[sheet_name]
+        cache_key = f"{sheet_name}:headers"
+        headers = self.cache.get(self.spreadsheet_url, cache_key, self.revision) if self.revision else None
+        if headers is None:
+            headers = (backend.get_row_ranges([(1, 1)])[0] or [[]])[0]
+        if id_column not in headers:
+            return self.track(Sheet(backend=backend))
+
+        id_col = headers.index(id_column)
+        wanted = set(normalize_id(id_value) for id_value in id_values)
+        ids = backend.get_column(id_col + 1)[1:]
+        spans = coalesce_rows([i + 2 for i, id_value in enumerate(ids) if normalize_id(id_value) in wanted])
+        header_values, *blocks = backend.get_row_ranges([(1, 1)] + spans)
+
+        # The header row is re-read alongside the rows, in case columns moved since we resolved the id column.
+        if (header_values or [[]])[0] != headers:
+            return self.track(Sheet(backend=backend))
+        if self.revision is not None:
+            self.cache.put(self.spreadsheet_url, cache_key, self.revision, headers)
+
+        values = [headers]
+        for id_value in ids:
+            row_values = [""] * len(headers)
+            row_values[id_col] = id_value
+            values.append(row_values)
+        for (first, _), block in zip(spans, blocks):
+            for i, row_values in enumerate(block):
+                values[first - 1 + i] = row_values
+        return self.track(Sheet(backend=backend, values=values))
+
+    def append_to_sheet(self, sheet_name: str, rows: List[List[Any]]) -> bool:
+        """
+        Appends rows to a tab without reading it first (e.g. jobs to the Outbox). Returns False, without writing, if
+        the spreadsheet has no such tab.
+        """
+        try:
+            backend = self.backend.get_sheet_backends([sheet_name])[sheet_name]
+        except SheetError:
+            return False
+        backend.append_rows(rows=rows, value_input_option="RAW")
+        self.writes += 1
+        return True
+
+    def get_quota_headroom(self) -> Dict[str, float]:
+        return self.backend.get_quota_headroom()
+
+    def finish_writes(self) -> None:
+        """
+        Call once a handler's writes are done: keeps the course's cached configuration current (see
+        refresh_cache_revision), and logs how much of the Sheets quota is left.
+        """
+        self.refresh_cache_revision()
+        print(f"Sheets quota headroom: {self.get_quota_headroom()}")
+
+    def refresh_cache_revision(self) -> None:
+        """
+        Call after this request's own writes. Those writes only touch the roster (and the Outbox), so if they account
+        for every revision since we loaded, configuration tabs cached at that revision are still valid at the new one.
+        Otherwise someone else (e.g. staff) edited the spreadsheet meanwhile, and the course's cache is dropped.
+        """
+        if self.revision is None:
+            return
+        revision = self.get_revision()
+        if revision is None:
+            return
+        writes = self.writes + sum(sheet.writes for sheet in self.sheets)
+        if get_revision_distance(self.revision, revision) == writes - self.restamped_writes:
+            self.cache.restamp(self.spreadsheet_url, old_revision=self.revision, new_revision=revision)
+        else:
+            self.cache.invalidate(self.spreadsheet_url)
+        self.revision = revision
+        self.restamped_writes = writes
@@ -1,29 +1,35 @@
-from typing import List
+from typing import Any, Dict, List, Optional
 
 from slack_sdk.webhook import WebhookClient, WebhookResponse
 from tabulate import tabulate
 
 from src.assignments import AssignmentList
+from src.config import PolicyConfig
 from src.errors import SlackError
 from src.record import StudentRecord
 from src.submission import FormSubmission
-from src.utils import Environment, cast_list_str
+
+# Slack truncates long messages, so batched messages are split into chunks of at most this many characters.
+MAX_SLACK_MESSAGE_LENGTH = 3000
 
 
 class SlackManager:
     """
-    A container to hold Slack-related utilities.
+    A container to hold Slack-related utilities. If an outbox is given, messages are collected there (as the arguments
+    of a webhook send) instead of being sent, so a batch of submissions can be reported with a few requests (see
+    send_outbox).
     """
 
-    def __init__(self) -> None:
+    def __init__(self, config: PolicyConfig, outbox: Optional[List[Dict[str, Any]]] = None) -> None:
+        self.config = config
         self.webhooks: List[WebhookClient] = []
-        self.webhooks.append(WebhookClient(Environment.get("SLACK_ENDPOINT")))
+        self.webhooks.append(WebhookClient(config.slack_endpoint))
         self.warnings = []
         self.silent = False
+        self.outbox = outbox
 
-        if Environment.contains("SLACK_ENDPOINT_DEBUG"):
-            if Environment.get("SLACK_ENDPOINT_DEBUG") != Environment.get("SLACK_ENDPOINT"):
-                self.webhooks.append(WebhookClient(Environment.get("SLACK_ENDPOINT_DEBUG")))
+        if config.slack_endpoint_debug and config.slack_endpoint_debug != config.slack_endpoint:
+            self.webhooks.append(WebhookClient(config.slack_endpoint_debug))
 
     def suppress(self):
         self.silent = True
@@ -70,17 +76,39 @@ class SlackManager:
         if len(self.warnings) > 0:
             message += self.get_warnings()
 
+        if self.outbox is not None:
+            self.outbox.append({"text": message})
+            return
+
         for webhook in self.webhooks:
             response = webhook.send(text=message)
             self.check_error(response)
 
-    @staticmethod
-    def get_tags() -> str:
-        slack_tags = Environment.safe_get("SLACK_TAG_LIST")
+    def send_outbox(self, messages: List[Dict[str, Any]]) -> None:
+        """
+        Sends collected messages. Plain text messages are joined into as few Slack messages as possible; messages with
+        blocks (e.g. a "View Spreadsheet" button) are sent on their own.
+        """
+        chunks: List[Dict[str, Any]] = []
+        for message in messages:
+            if (
+                "blocks" not in message
+                and len(chunks) > 0
+                and "blocks" not in chunks[-1]
+                and len(chunks[-1]["text"]) + len(message["text"]) + 2 <= MAX_SLACK_MESSAGE_LENGTH
+            ):
+                chunks[-1] = {"text": chunks[-1]["text"] + "\n\n" + message["text"]}
+            else:
+                chunks.append(message)
+        for chunk in chunks:
+            for webhook in self.webhooks:
+                response = webhook.send(**chunk)
+                self.check_error(response)
+
+    def get_tags(self) -> str:
         prefix = ""
-        if slack_tags:
-            uids = cast_list_str(slack_tags)
-            prefix = " ".join([f"<@{uid}>" for uid in uids]) + " "
+        if self.config.slack_tags:
+            prefix = " ".join([f"<@{uid}>" for uid in self.config.slack_tags]) + " "
         return prefix
 
     def send_student_update(self, message: str, autoapprove: bool = False) -> None:
@@ -92,8 +120,7 @@ class SlackManager:
 
         message += "\n"
         rows = []
-        for assignment in self.assignments:
-            num_days = self.student.get_request(assignment.get_id())
+        for assignment, num_days in self.student.get_requests(assignments=self.assignments):
             if num_days:
                 rows.append([assignment.get_name(), num_days])
         if len(rows) > 0:
@@ -111,35 +138,45 @@ class SlackManager:
             return
 
         if autoapprove:
-            for webhook in self.webhooks:
-                response = webhook.send(text=message)
-                self.check_error(response=response)
+            payload = {"text": message}
         else:
             # This isn't an auto-approval, so attach tags!
-            tags = SlackManager.get_tags()
+            tags = self.get_tags()
             message = tags + message
-            for webhook in self.webhooks:
-                response = webhook.send(
-                    blocks=[
-                        {"type": "section", "text": {"type": "mrkdwn", "text": message}},
-                        {
-                            "type": "actions",
-                            "block_id": "approve_extension",
-                            "elements": [
-                                {
-                                    "type": "button",
-                                    "text": {"type": "plain_text", "text": "View Spreadsheet"},
-                                    "url": Environment.get("SPREADSHEET_URL"),
-                                },
-                            ],
-                        },
-                    ]
-                )
-                self.check_error(response)
+            payload = {
+                "blocks": [
+                    {"type": "section", "text": {"type": "mrkdwn", "text": message}},
+                    {
+                        "type": "actions",
+                        "block_id": "approve_extension",
+                        "elements": [
+                            {
+                                "type": "button",
+                                "text": {"type": "plain_text", "text": "View Spreadsheet"},
+                                "url": self.config.spreadsheet_url,
+                            },
+                        ],
+                    },
+                ]
+            }
+
+        if self.outbox is not None:
+            self.outbox.append(payload)
+            return
+
+        for webhook in self.webhooks:
+            response = webhook.send(**payload)
+            self.check_error(response=response)
 
     def send_error(self, error: str) -> None:
+        if self.outbox is not None:
+            self.outbox.append(
+                {"text": self.get_tags() + "An error occurred: " + "\n" + "```" + "\n" + error + "\n" + "```"}
+            )
+            return
+
         for webhook in self.webhooks:
-            tags = SlackManager.get_tags()
+            tags = self.get_tags()
             response = webhook.send(text=tags + "An error occurred: " + "\n" + "```" + "\n" + error + "\n" + "```")
             self.check_error(response=response)
 
@@ -0,0 +1,124 @@
+import socketserver
+from threading import Lock, Thread
+from typing import Iterable, List, Optional, Tuple
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    """
+    Speaks just enough SMTP for smtplib: HELO/EHLO, MAIL, RCPT, DATA, RSET, NOOP and QUIT.
+    """
+
+    server: "SmtpServer"
+
+    def reply(self, line: str) -> None:
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self) -> None:
+        self.reply("220 localhost ESMTP")
+        mail_from: Optional[str] = None
+        rcpt_tos: List[str] = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command, _, argument = line.decode().rstrip("\r\n").partition(" ")
+            command = command.upper()
+            if command in ["HELO", "EHLO"]:
+                self.reply("250 localhost")
+            elif command == "MAIL":
+                mail_from, rcpt_tos = get_address(argument), []
+                self.reply("250 OK")
+            elif command == "RCPT":
+                address = get_address(argument)
+                if address in self.server.refused:
+                    self.reply("550 No such user")
+                else:
+                    rcpt_tos.append(address)
+                    self.reply("250 OK")
+            elif command == "DATA":
+                if mail_from is None or len(rcpt_tos) == 0:
+                    self.reply("503 Need MAIL and RCPT first")
+                    continue
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                self.server.deliver(mail_from, rcpt_tos, self.read_data())
+                mail_from, rcpt_tos = None, []
+                self.reply("250 OK")
+            elif command == "RSET":
+                mail_from, rcpt_tos = None, []
+                self.reply("250 OK")
+            elif command == "NOOP":
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+    def read_data(self) -> str:
+        lines = []
+        while True:
+            line = self.rfile.readline().decode()
+            if line in ["", ".\r\n", ".\n"]:
+                return "".join(lines)
+            # Undo dot-stuffing.
+            lines.append(line[1:] if line.startswith("..") else line)
+
+
+def get_address(argument: str) -> str:
+    """
+    Extracts the address from a MAIL FROM:<...> or RCPT TO:<...> argument.
+    """
+    address = argument.partition(":")[2].strip()
+    return address.split(" ")[0].strip("<>")
+
+
+class SmtpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int], refused: Iterable[str]) -> None:
+        super().__init__(address, SmtpHandler)
+        self.refused = set(refused)
+        self.messages: List[Tuple[str, List[str], str]] = []
+        self.lock = Lock()
+
+    def deliver(self, mail_from: str, rcpt_tos: List[str], data: str) -> None:
+        with self.lock:
+            self.messages.append((mail_from, rcpt_tos, data))
+
+
+class LocalSmtpServer:
+    """
+    An in-process SMTP server that accepts every email (except to `refused` addresses) and keeps it in memory, as
+    (sender, recipients, message). It stands in for a real mailserver in tests and benchmarks; point a course at it
+    with SMTP_HOST=127.0.0.1, SMTP_PORT=<port> and SMTP_SSL=No.
+
+        with LocalSmtpServer() as server:
+            ...
+            print(server.messages)
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, refused: Iterable[str] = ()) -> None:
+        self.server = SmtpServer((host, port), refused=refused)
+        self.host, self.port = self.server.server_address[:2]
+        self.thread: Optional[Thread] = None
+
+    @property
+    def messages(self) -> List[Tuple[str, List[str], str]]:
+        with self.server.lock:
+            return list(self.server.messages)
+
+    def start(self) -> None:
+        self.thread = Thread(target=self.server.serve_forever, name="local-smtp-server", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "LocalSmtpServer":
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
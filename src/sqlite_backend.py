@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from threading import RLock
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.backends import SheetBackend, SpreadsheetBackend, format_cell_value
+from src.errors import ConfigurationError, SheetError
+
+SQLITE_URL_PREFIX = "sqlite://"
+
+# Columns we look rows up by (see SqliteSheetBackend.find_rows); these get SQL indexes.
+INDEXED_HEADERS = ["email", "approval_status", "email_status"]
+
+
+class SqliteSheetBackend(SheetBackend):
+    """
+    A tab stored as a SQLite table. Each row of the tab is a row of the table, keyed by its grid row number (the
+    header is row 1), with one TEXT column per tab column. Values are stored as Sheets would display them.
+    """
+
+    def __init__(self, spreadsheet: SqliteSpreadsheetBackend, title: str, table: str) -> None:
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.table = table
+
+    def execute(self, sql: str, parameters: Tuple[Any, ...] = ()) -> sqlite3.Cursor:
+        return self.spreadsheet.connection.execute(sql, parameters)
+
+    def get_width(self) -> int:
+        return len(self.execute(f'PRAGMA table_info("{self.table}")').fetchall()) - 1
+
+    def ensure_width(self, width: int) -> None:
+        for col in range(self.get_width() + 1, width + 1):
+            self.execute(f"ALTER TABLE \"{self.table}\" ADD COLUMN c{col} TEXT NOT NULL DEFAULT ''")
+
+    def get_all_values(self) -> List[List[Any]]:
+        with self.spreadsheet.lock:
+            rows = self.execute(f'SELECT * FROM "{self.table}" ORDER BY row').fetchall()
+        return [list(row[1:]) for row in rows]
+
+    def get_column(self, col: int) -> List[Any]:
+        with self.spreadsheet.lock:
+            if col > self.get_width():
+                return []
+            values = [row[0] for row in self.execute(f'SELECT c{col} FROM "{self.table}" ORDER BY row')]
+        while len(values) > 0 and values[-1] == "":
+            values.pop()
+        return values
+
+    def get_row_ranges(self, spans: List[Tuple[int, int]]) -> List[List[List[Any]]]:
+        with self.spreadsheet.lock:
+            return [
+                [
+                    list(row[1:])
+                    for row in self.execute(
+                        f'SELECT * FROM "{self.table}" WHERE row BETWEEN ? AND ? ORDER BY row', (first, last)
+                    )
+                ]
+                for first, last in spans
+            ]
+
+    def find_rows(self, header: str, value: str) -> List[int]:
+        """
+        Returns the grid rows whose `header` column matches value (case-insensitively), using the column's index.
+        """
+        with self.spreadsheet.lock:
+            header_row = self.execute(f'SELECT * FROM "{self.table}" WHERE row = 1').fetchone()
+            headers = list(header_row[1:]) if header_row is not None else []
+            if header not in headers:
+                return []
+            col = headers.index(header) + 1
+            rows = self.execute(
+                f'SELECT row FROM "{self.table}" WHERE c{col} = ? COLLATE NOCASE AND row > 1 ORDER BY row', (value,)
+            )
+            return [row[0] for row in rows]
+
+    def update_ranges(self, blocks: List[Tuple[int, int, List[List[Any]]]]) -> None:
+        with self.spreadsheet.lock, self.spreadsheet.connection:
+            for top, left, values in blocks:
+                self.ensure_width(left + len(values[0]) - 1)
+                # Writing below the last row extends the tab with blank rows, like Sheets does.
+                last_row = self.execute(f'SELECT COALESCE(MAX(row), 0) FROM "{self.table}"').fetchone()[0]
+                for row in range(last_row + 1, top + len(values)):
+                    self.insert_row(row, [])
+                for i, row_values in enumerate(values):
+                    row = top + i
+                    for j, value in enumerate(row_values):
+                        if value is None:
+                            continue
+                        self.execute(
+                            f'UPDATE "{self.table}" SET c{left + j} = ? WHERE row = ?', (format_cell_value(value), row)
+                        )
+            self.spreadsheet.bump_revision()
+
+    def append_rows(self, rows: List[List[Any]], value_input_option: str) -> int:
+        with self.spreadsheet.lock, self.spreadsheet.connection:
+            self.ensure_width(max(len(row) for row in rows))
+            first_row = self.execute(f'SELECT COALESCE(MAX(row), 0) + 1 FROM "{self.table}"').fetchone()[0]
+            for i, values in enumerate(rows):
+                self.insert_row(first_row + i, values)
+            self.spreadsheet.bump_revision()
+        return first_row
+
+    def insert_row(self, row: int, values: List[Any]) -> None:
+        columns = ", ".join(["row"] + [f"c{col + 1}" for col in range(len(values))])
+        placeholders = ", ".join(["?"] * (len(values) + 1))
+        self.execute(
+            f'INSERT INTO "{self.table}" ({columns}) VALUES ({placeholders})',
+            tuple([row] + [format_cell_value(value) for value in values]),
+        )
+
+    def delete_row(self, row: int) -> None:
+        with self.spreadsheet.lock, self.spreadsheet.connection:
+            self.execute(f'DELETE FROM "{self.table}" WHERE row = ?', (row,))
+            self.execute(f'UPDATE "{self.table}" SET row = row - 1 WHERE row > ?', (row,))
+            self.spreadsheet.bump_revision()
+
+
+class SqliteSpreadsheetBackend(SpreadsheetBackend):
+    """
+    A spreadsheet stored in a SQLite database (a file, or ":memory:"). Useful for running the handlers locally, e.g.
+    for benchmarking and replaying submissions, without touching a live Google Sheet. Tabs can be imported from and
+    exported to the same layout as the Google Sheet (lists of rows, starting with the header row).
+    """
+
+    def __init__(self, path: str = ":memory:") -> None:
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = RLock()
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS _meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS _tabs (title TEXT PRIMARY KEY, name TEXT NOT NULL)")
+            self.connection.execute("INSERT OR IGNORE INTO _meta (key, value) VALUES ('revision', '0')")
+
+    def bump_revision(self) -> None:
+        self.connection.execute("UPDATE _meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'revision'")
+
+    def get_revision(self) -> Optional[str]:
+        with self.lock:
+            return self.connection.execute("SELECT value FROM _meta WHERE key = 'revision'").fetchone()[0]
+
+    def get_titles(self) -> List[str]:
+        with self.lock:
+            return [row[0] for row in self.connection.execute("SELECT title FROM _tabs ORDER BY rowid")]
+
+    def get_sheet_backend(self, sheet_name: str) -> SqliteSheetBackend:
+        with self.lock:
+            row = self.connection.execute("SELECT name FROM _tabs WHERE title = ?", (sheet_name,)).fetchone()
+        if row is None:
+            raise SheetError(f"Could not find a sheet named {sheet_name} in the spreadsheet.")
+        return SqliteSheetBackend(spreadsheet=self, title=sheet_name, table=row[0])
+
+    def get_sheet_backends(self, sheet_names: List[str]) -> Dict[str, SheetBackend]:
+        return {sheet_name: self.get_sheet_backend(sheet_name) for sheet_name in sheet_names}
+
+    def batch_get_values(self, sheet_names: List[str]) -> Dict[str, List[List[Any]]]:
+        return {sheet_name: self.get_sheet_backend(sheet_name).get_all_values() for sheet_name in sheet_names}
+
+    def import_tab(self, sheet_name: str, values: List[List[Any]]) -> None:
+        """
+        Creates (or replaces) a tab with the given values, where values[0] is the header row.
+        """
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT name FROM _tabs WHERE title = ?", (sheet_name,)).fetchone()
+            if row is not None:
+                self.connection.execute(f'DROP TABLE "{row[0]}"')
+                table = row[0]
+            else:
+                table = f"tab_{len(self.get_titles())}"
+                self.connection.execute("INSERT INTO _tabs (title, name) VALUES (?, ?)", (sheet_name, table))
+
+            width = max([len(row_values) for row_values in values] + [1])
+            columns = ", ".join([f"c{col + 1} TEXT NOT NULL DEFAULT ''" for col in range(width)])
+            self.connection.execute(f'CREATE TABLE "{table}" (row INTEGER NOT NULL, {columns})')
+            self.connection.execute(f'CREATE INDEX "{table}_row" ON "{table}" (row)')
+
+            backend = SqliteSheetBackend(spreadsheet=self, title=sheet_name, table=table)
+            for i, row_values in enumerate(values):
+                backend.insert_row(i + 1, row_values)
+
+            headers = values[0] if len(values) > 0 else []
+            for header in INDEXED_HEADERS:
+                if header in headers:
+                    col = headers.index(header) + 1
+                    self.connection.execute(f'CREATE INDEX "{table}_{header}" ON "{table}" (c{col} COLLATE NOCASE)')
+            self.bump_revision()
+
+    def export_tab(self, sheet_name: str) -> List[List[Any]]:
+        return self.get_sheet_backend(sheet_name).get_all_values()
+
+    def load_snapshot(self, path: str) -> None:
+        """
+        Imports every tab from a JSON snapshot: an object mapping tab names to lists of rows.
+        """
+        with open(path) as f:
+            snapshot: Dict[str, List[List[Any]]] = json.load(f)
+        for sheet_name, values in snapshot.items():
+            self.import_tab(sheet_name, values)
+
+    def export_snapshot(self, path: str) -> None:
+        snapshot = {sheet_name: self.export_tab(sheet_name) for sheet_name in self.get_titles()}
+        with open(path, "w") as f:
+            json.dump(snapshot, f, indent=2)
+
+    @staticmethod
+    def from_backend(
+        source: SpreadsheetBackend, sheet_names: List[str], path: str = ":memory:"
+    ) -> SqliteSpreadsheetBackend:
+        """
+        Copies tabs from another backend (e.g. a live Google Sheet) into a new SQLite database.
+        """
+        backend = SqliteSpreadsheetBackend(path=path)
+        for sheet_name, values in source.batch_get_values(sheet_names).items():
+            backend.import_tab(sheet_name, values)
+        return backend
+
+
+class SqliteRegistry:
+    """
+    SQLite spreadsheets that local tools (tests, benchmarks) have registered under a sqlite:// URL, so handlers can
+    open them by URL. Only registered URLs can be opened: a URL never picks a file to open (or create), since it may
+    come from an HTTP request.
+    """
+
+    def __init__(self) -> None:
+        self.backends: Dict[str, SqliteSpreadsheetBackend] = {}
+        self.lock = RLock()
+
+    def open(self, spreadsheet_url: str) -> SqliteSpreadsheetBackend:
+        with self.lock:
+            if spreadsheet_url not in self.backends:
+                raise ConfigurationError(f"No local spreadsheet is registered as {spreadsheet_url}.")
+            return self.backends[spreadsheet_url]
+
+    def register(self, spreadsheet_url: str, backend: SqliteSpreadsheetBackend) -> None:
+        with self.lock:
+            self.backends[spreadsheet_url] = backend
+
+
+def is_local_spreadsheet_url(spreadsheet_url: Any) -> bool:
+    return isinstance(spreadsheet_url, str) and spreadsheet_url.startswith(SQLITE_URL_PREFIX)
+
+
+SQLITE_REGISTRY = SqliteRegistry()
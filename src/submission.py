@@ -1,9 +1,10 @@
-from typing import Any, Dict, List, Tuple
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 
 from src.assignments import Assignment, AssignmentList
 from src.errors import ConfigurationError, FormInputError
 from src.sheets import Sheet
-from src.utils import cast_list_int, cast_list_str
+from src.utils import PST, cast_list_int, cast_list_str, parse_timestamp
 
 
 class FormSubmission:
@@ -32,11 +33,21 @@ class FormSubmission:
                 self.responses[key] = str(form_payload[question][0])
 
         self.responses["Timestamp"] = form_payload["Timestamp"][0]
+        self.time: Optional[datetime] = None
         print(self.responses)
 
     def get_timestamp(self) -> str:
         return self.responses["Timestamp"]
 
+    def get_time(self) -> datetime:
+        """
+        The submission's timestamp, parsed once (timestamps without a timezone are in Pacific time).
+        """
+        if self.time is None:
+            timestamp = parse_timestamp(self.get_timestamp())
+            self.time = timestamp if timestamp.tzinfo else PST.localize(timestamp)
+        return self.time
+
     def get_email(self) -> str:
         return str(self.responses["email"]).lower()
 
@@ -0,0 +1,130 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from gspread.utils import numericise
+
+from src.errors import SheetError
+
+
+def numericise_cell(value: Any) -> Any:
+    """
+    Converts a raw cell to a number where possible, like gspread's `get_all_records` (blank cells stay "").
+    """
+    if isinstance(value, str):
+        return numericise(value, default_blank="")
+    return value
+
+
+class Table:
+    """
+    A compact, column-oriented copy of a sheet's values: one list per column, plus a single header -> column map
+    shared by every row. Cells are stored as loaded (or last written), and converted to numbers on read.
+
+    Rows are handed out as lightweight Row views instead of dicts, so a large roster isn't held in memory twice (once
+    as values, and again as one dict per row that repeats every header).
+    """
+
+    def __init__(self, values: List[List[Any]]) -> None:
+        self.headers: List[str] = list(values[0]) if len(values) > 0 else []
+        width = max([len(row) for row in values] + [0])
+
+        # Like dict(zip(headers, row)), a repeated header refers to its last column.
+        self.columns: Dict[str, int] = {header: col for col, header in enumerate(self.headers)}
+        self.data: List[List[Any]] = [[] for _ in range(width)]
+        for row in values[1:]:
+            self.append(row)
+
+        # Set once a row is deleted: (the table without it, the deleted row). See Row.locate.
+        self.successor: Optional[Tuple["Table", int]] = None
+
+    def __len__(self) -> int:
+        return len(self.data[0]) if len(self.data) > 0 else 0
+
+    def append(self, values: List[Any]) -> None:
+        for col, column in enumerate(self.data):
+            column.append(values[col] if col < len(values) and values[col] is not None else "")
+
+    def get_raw(self, row: int, col: int) -> Any:
+        return self.data[col][row] if col < len(self.data) else ""
+
+    def set_raw(self, row: int, col: int, value: Any) -> None:
+        while col >= len(self.data):
+            self.data.append([""] * len(self))
+        self.data[col][row] = value
+
+    def get_column(self, header: str) -> List[Any]:
+        """
+        Returns the raw cells of one column (or blanks, if there's no such header).
+        """
+        if header not in self.columns:
+            return [""] * len(self)
+        return self.data[self.columns[header]]
+
+    def get_values(self) -> List[List[Any]]:
+        """
+        Rebuilds the sheet's values as a list of rows (header first), e.g. for exporting.
+        """
+        return [list(self.headers)] + [list(row) for row in zip(*self.data)]
+
+    def get_row(self, row: int) -> "Row":
+        return Row(self, row)
+
+    def get_rows(self) -> List["Row"]:
+        return [Row(self, row) for row in range(len(self))]
+
+    def without_row(self, row: int) -> "Table":
+        """
+        Returns a copy of this table with one row removed. Existing Row views move over to the copy (and follow their
+        row up if it shifted), so writes through them aren't lost; views of the deleted row raise instead.
+        """
+        table = Table.__new__(Table)
+        table.headers = self.headers
+        table.columns = self.columns
+        table.data = [column[:row] + column[row + 1 :] for column in self.data]
+        table.successor = None
+        self.successor = (table, row)
+        return table
+
+
+class Row(Mapping):
+    """
+    A read/write view of one row of a Table, keyed by header. Behaves like the dicts returned by gspread's
+    `get_all_records`; writes go straight to the table.
+    """
+
+    __slots__ = ("table", "row")
+
+    def __init__(self, table: Table, row: int) -> None:
+        self.table = table
+        self.row = row
+
+    def locate(self) -> Tuple[Table, int]:
+        """
+        Returns the current table and row index of this view, following any rows deleted since it was created.
+        """
+        while self.table.successor is not None:
+            table, deleted = self.table.successor
+            if self.row == deleted:
+                raise SheetError(f"Row {self.row} was deleted from the sheet, so it can no longer be read or written.")
+            self.table, self.row = table, self.row - 1 if self.row > deleted else self.row
+        return self.table, self.row
+
+    def __getitem__(self, header: str) -> Any:
+        table, row = self.locate()
+        return numericise_cell(table.get_raw(row, table.columns[header]))
+
+    def __setitem__(self, header: str, value: Any) -> None:
+        table, row = self.locate()
+        table.set_raw(row, table.columns[header], value)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.table.columns)
+
+    def __len__(self) -> int:
+        return len(self.table.columns)
+
+    def __contains__(self, header: object) -> bool:
+        return header in self.table.columns
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from jinja2 import Environment, StrictUndefined, Template, TemplateError
+
+from src.assignments import AssignmentList
+from src.config import PolicyConfig
+from src.errors import ConfigurationError, EmailError
+from src.record import StudentRecord
+from src.sheets import Sheet
+
+TEMPLATE_SUBJECT = "subject"
+TEMPLATE_BODY = "body"
+TEMPLATE_HTML = "html"
+
+DEFAULT_SUBJECT_TEMPLATE = "{{ subject }}"
+
+# The email we've always sent. Courses can override any part of it from the "Email Templates" tab.
+DEFAULT_BODY_TEMPLATE = """Hi,
+
+You recently requested an extension for an assignment. We've processed this extension, and here are your updated \
+due dates:
+
+{% for request in requests -%}
+{{ request.name }} ({{ request.days }} Day Extension)
+Original Deadline: {{ request.original or "TBD" }}
+Extended Deadline: {{ request.extended or "TBD" }}
+
+{% endfor -%}
+{% if comments -%}
+Additional comments: {{ comments }}
+
+{% endif -%}
+If something doesn't look right, please reply to this email!
+
+Best,
+
+{{ signature }}
+
+Disclaimer: This is an auto-generated email. We may follow up with you in this thread, and feel free to reply to \
+this thread if you'd like to follow up with us!"""
+
+TEXT_ENVIRONMENT = Environment(undefined=StrictUndefined, keep_trailing_newline=True)
+HTML_ENVIRONMENT = Environment(undefined=StrictUndefined, keep_trailing_newline=True, autoescape=True)
+
+
+@lru_cache(maxsize=1024)
+def format_date(date: datetime) -> str:
+    return date.strftime("%A, %B %-d")
+
+
+class RenderedEmail(NamedTuple):
+    subject: str
+    body: str
+    html: Optional[str]
+
+
+class EmailTemplates:
+    """
+    Compiled Jinja2 templates for the emails sent to students: a subject, a plain text body, and an optional HTML
+    body. Templates come from the optional "Email Templates" tab (a "key" and a "value" column, with keys subject,
+    body and html); anything not set there uses the default.
+
+    Each template is rendered with:
+        requests: the student's extensions, each with a name, days, and original and extended deadlines (formatted
+            dates, or None if the assignment has no due date)
+        email, comments: the student's email, and the email_comments cell
+        subject, signature: EMAIL_SUBJECT and EMAIL_SIGNATURE
+        config: the course's PolicyConfig
+    """
+
+    def __init__(self, subject: Template, body: Template, html: Optional[Template] = None) -> None:
+        self.subject = subject
+        self.body = body
+        self.html = html
+
+    @staticmethod
+    def from_sheet(sheet: Sheet) -> "EmailTemplates":
+        """
+        Compiles the templates in an "Email Templates" sheet. The result is memoized on the sheet, so templates are
+        compiled once per revision of the spreadsheet.
+        """
+        return sheet.memoize("email_templates", lambda: EmailTemplates.from_records(sheet.get_all_records()))
+
+    @staticmethod
+    def from_records(records: List[Dict[str, Any]]) -> "EmailTemplates":
+        values: Dict[str, str] = {}
+        for record in records:
+            key = str(record.get("key") or "").strip().lower()
+            value = record.get("value")
+            if key and value is not None and str(value).strip():
+                values[key] = str(value)
+
+        unknown = [key for key in values if key not in [TEMPLATE_SUBJECT, TEMPLATE_BODY, TEMPLATE_HTML]]
+        if len(unknown) > 0:
+            raise ConfigurationError(f"Unknown email templates: {', '.join(unknown)}")
+
+        def build(environment: Environment, key: str, default: Optional[str]) -> Optional[Template]:
+            source = values.get(key, default)
+            if source is None:
+                return None
+            try:
+                return environment.from_string(source)
+            except TemplateError as err:
+                raise ConfigurationError(f"Email template {key} is invalid: {err}")
+
+        return EmailTemplates(
+            subject=build(TEXT_ENVIRONMENT, TEMPLATE_SUBJECT, DEFAULT_SUBJECT_TEMPLATE),
+            body=build(TEXT_ENVIRONMENT, TEMPLATE_BODY, DEFAULT_BODY_TEMPLATE),
+            html=build(HTML_ENVIRONMENT, TEMPLATE_HTML, None),
+        )
+
+    @staticmethod
+    def get_context(student: StudentRecord, assignments: AssignmentList, config: PolicyConfig) -> Dict[str, Any]:
+        requests = []
+        for assignment, num_days in student.get_requests(assignments=assignments):
+            if num_days:
+                original = assignment.get_due_date()
+                requests.append(
+                    {
+                        "name": assignment.get_name(),
+                        "days": num_days,
+                        "original": format_date(original) if original else None,
+                        "extended": format_date(original + timedelta(days=int(num_days))) if original else None,
+                    }
+                )
+        return {
+            "requests": requests,
+            "email": student.get_email(),
+            "comments": student.get_email_comments(),
+            "subject": config.email_subject,
+            "signature": config.email_signature,
+            "config": config,
+        }
+
+    def render(self, student: StudentRecord, assignments: AssignmentList, config: PolicyConfig) -> RenderedEmail:
+        context = EmailTemplates.get_context(student=student, assignments=assignments, config=config)
+        try:
+            return RenderedEmail(
+                subject=" ".join(self.subject.render(context).split()),
+                body=self.body.render(context),
+                html=self.html.render(context) if self.html is not None else None,
+            )
+        except TemplateError as err:
+            raise EmailError(f"Could not render the email to {student.get_email()}: {err}")
+
+
+DEFAULT_EMAIL_TEMPLATES = EmailTemplates.from_records([])
@@ -0,0 +1,145 @@
+import functools
+import time
+from contextlib import contextmanager
+from threading import BoundedSemaphore, Lock
+from typing import Any, Callable, Dict, Iterator, List
+
+from gspread.exceptions import NoValidUrlKeyFound
+from gspread.utils import extract_id_from_url
+
+from src.backends import CLIENT_POOL
+from src.cache import ConfigCache
+from src.errors import TenantBusyError
+from src.quota import QUOTA_REGISTRY
+
+# Each course may run a few requests at once; more than that queue up, so one busy course can't take every worker.
+TENANT_MAX_CONCURRENT_REQUESTS = 4
+TENANT_QUEUE_TIMEOUT_SECONDS = 120
+
+# Courses that haven't sent a request for a while are evicted, along with their caches and spreadsheet handles.
+TENANT_IDLE_SECONDS = 1800
+TENANT_MAX_ENTRIES = 64
+TENANT_CONFIG_CACHE_MAX_ENTRIES = 16
+
+
+class Tenant:
+    """
+    One course (i.e. one spreadsheet) served by this process. Each course has its own configuration cache, so a busy
+    course can't evict another's, and its own limit on concurrent requests. Sheets API calls are rate-limited per
+    spreadsheet by QUOTA_REGISTRY, and the service account credentials are shared by every course.
+    """
+
+    def __init__(self, spreadsheet_url: str, max_concurrent_requests: int, now: float) -> None:
+        self.spreadsheet_url = spreadsheet_url
+        self.cache = ConfigCache(maxsize=TENANT_CONFIG_CACHE_MAX_ENTRIES)
+        self.slots = BoundedSemaphore(max_concurrent_requests)
+        self.active = 0
+        self.last_used = now
+
+    def close(self) -> None:
+        """
+        Drops everything this process holds for the course.
+        """
+        self.cache.clear()
+        CLIENT_POOL.forget(self.spreadsheet_url)
+        try:
+            QUOTA_REGISTRY.remove(extract_id_from_url(self.spreadsheet_url))
+        except NoValidUrlKeyFound:
+            # e.g. a local sqlite:// spreadsheet, which isn't rate-limited.
+            pass
+
+
+class TenantRegistry:
+    """
+    The courses this process is serving, keyed by spreadsheet URL, so one deployment can serve many courses at once.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_requests: int = TENANT_MAX_CONCURRENT_REQUESTS,
+        queue_timeout: float = TENANT_QUEUE_TIMEOUT_SECONDS,
+        idle_seconds: float = TENANT_IDLE_SECONDS,
+        max_entries: int = TENANT_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_concurrent_requests = max_concurrent_requests
+        self.queue_timeout = queue_timeout
+        self.idle_seconds = idle_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self.tenants: Dict[str, Tenant] = {}
+        self.lock = Lock()
+
+    def get(self, spreadsheet_url: str) -> Tenant:
+        with self.lock:
+            now = self.clock()
+            self._evict(now, adding=spreadsheet_url not in self.tenants)
+            tenant = self.tenants.get(spreadsheet_url)
+            if tenant is None:
+                tenant = Tenant(spreadsheet_url, max_concurrent_requests=self.max_concurrent_requests, now=now)
+                self.tenants[spreadsheet_url] = tenant
+            tenant.last_used = now
+            return tenant
+
+    @contextmanager
+    def enter(self, spreadsheet_url: str) -> Iterator[Tenant]:
+        """
+        Holds one of the course's request slots for the duration of a request, waiting for a free slot if needed.
+        """
+        tenant = self.get(spreadsheet_url)
+        with self.lock:
+            # Counted before waiting, so a queued request keeps the course from being evicted.
+            tenant.active += 1
+        try:
+            if not tenant.slots.acquire(timeout=self.queue_timeout):
+                raise TenantBusyError(
+                    f"Timed out after {self.queue_timeout}s waiting for other requests for this spreadsheet to finish."
+                )
+            try:
+                yield tenant
+            finally:
+                tenant.slots.release()
+        finally:
+            with self.lock:
+                tenant.active -= 1
+                tenant.last_used = self.clock()
+
+    def _evict(self, now: float, adding: bool) -> None:
+        idle = [tenant for tenant in self.tenants.values() if tenant.active == 0]
+        evicted: List[Tenant] = [tenant for tenant in idle if now - tenant.last_used > self.idle_seconds]
+
+        # Past the size limit, also evict the least recently used idle courses.
+        overflow = len(self.tenants) - len(evicted) + int(adding) - self.max_entries
+        if overflow > 0:
+            remaining = sorted([tenant for tenant in idle if tenant not in evicted], key=lambda t: t.last_used)
+            evicted.extend(remaining[:overflow])
+
+        for tenant in evicted:
+            del self.tenants[tenant.spreadsheet_url]
+            tenant.close()
+
+    def clear(self) -> None:
+        with self.lock:
+            for tenant in self.tenants.values():
+                tenant.close()
+            self.tenants.clear()
+
+
+TENANT_REGISTRY = TenantRegistry()
+
+
+def tenant_scoped(handler: Callable[[Dict[str, Any]], Any]) -> Callable[[Dict[str, Any]], Any]:
+    """
+    Runs a handler inside its course's request slot (see TenantRegistry.enter). Requests without a spreadsheet_url
+    are passed through, so the handler can reject them.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(request_json):
+        spreadsheet_url = request_json.get("spreadsheet_url") if isinstance(request_json, dict) else None
+        if not spreadsheet_url:
+            return handler(request_json)
+        with TENANT_REGISTRY.enter(spreadsheet_url):
+            return handler(request_json)
+
+    return wrapper
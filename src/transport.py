@@ -0,0 +1,315 @@
+import hashlib
+import os
+import tempfile
+import time
+import uuid
+from email import message_from_string
+from email.utils import getaddresses, parseaddr
+from smtplib import SMTP, SMTP_SSL, SMTPException, SMTPServerDisconnected
+from threading import BoundedSemaphore, Lock
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from sicp.common.rpc.mail import send_email
+
+from src.config import (
+    EMAIL_TRANSPORT_RPC,
+    EMAIL_TRANSPORT_SMTP,
+    EMAIL_TRANSPORT_SPOOL,
+    ENV_APP_MASTER_SECRET,
+    PolicyConfig,
+)
+from src.errors import EmailError
+
+# The built-in SMTP server, used unless a course configures its own (SMTP_HOST).
+SMTP_HOST = "REDACTED"
+SMTP_PORT = 465
+SMTP_USERNAME = "REDACTED"
+SMTP_PASSWORD = "REDACTED"
+
+# Where the spool transport writes emails, unless EMAIL_SPOOL_DIR is set.
+EMAIL_SPOOL_DIR = os.path.join(tempfile.gettempdir(), "extensions-spool")
+
+# Pooled SMTP connections: how many may be open at once, how many messages each sends before we reconnect (servers
+# limit messages per session), and how long one may sit idle before we check it's still alive.
+SMTP_POOL_SIZE = 3
+SMTP_MAX_MESSAGES_PER_CONNECTION = 100
+SMTP_HEALTH_CHECK_SECONDS = 30
+
+
+class EmailTransport:
+    """
+    Delivers fully-formed email messages (see Email.send). Courses choose a transport with EMAIL_TRANSPORT.
+    """
+
+    def sendmail(self, from_addr: str, to_addrs: List[str], msg: str) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+def connect_smtp(host: str, port: int, username: Optional[str], password: Optional[str], use_ssl: bool) -> SMTP:
+    """
+    Opens an SMTP connection, logged in if a username is given. Plain connections are upgraded with STARTTLS when
+    the server offers it. Prefer a pooled transport (see get_transport), which reuses connections across emails.
+    """
+    server = SMTP_SSL(host, port) if use_ssl else SMTP(host, port)
+    if not use_ssl:
+        server.ehlo()
+        if server.has_extn("starttls"):
+            server.starttls()
+    if username:
+        server.login(username, password)
+    return server
+
+
+class SmtpPool(EmailTransport):
+    """
+    Keeps logged-in SMTP connections open, so sending many emails (e.g. draining the email queue) costs a few TLS
+    handshakes and logins instead of one per message. Idle connections are checked with NOOP before reuse, and a
+    message that fails because its connection dropped is retried once on a fresh connection.
+    """
+
+    def __init__(
+        self,
+        size: int = SMTP_POOL_SIZE,
+        max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION,
+        connect: Optional[Callable[[], SMTP]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        host: str = SMTP_HOST,
+        port: int = SMTP_PORT,
+        username: Optional[str] = SMTP_USERNAME,
+        password: Optional[str] = SMTP_PASSWORD,
+        use_ssl: bool = True,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.max_messages = max_messages
+        self.connect = connect
+        self.clock = clock
+        self.slots = BoundedSemaphore(size)
+        self.lock = Lock()
+
+        # Connections not in use, as (connection, messages sent, last used).
+        self.idle: List[Tuple[SMTP, int, float]] = []
+
+    def sendmail(self, from_addr: str, to_addrs: List[str], msg: str) -> None:
+        with self.slots:
+            connection, sent = self._checkout()
+            try:
+                connection.sendmail(from_addr, to_addrs, msg)
+            except Exception as err:
+                # SMTPException is an OSError, so tell rejected messages apart from dropped connections first.
+                if isinstance(err, SMTPException) and not isinstance(err, SMTPServerDisconnected):
+                    # The message was rejected, but the connection is still usable.
+                    self._checkin(connection, sent)
+                    raise
+                self._discard(connection)
+                if not isinstance(err, OSError):
+                    raise
+
+                # The server hung up on us (e.g. an idle timeout); retry once on a new connection.
+                connection, sent = self._open(), 0
+                try:
+                    connection.sendmail(from_addr, to_addrs, msg)
+                except Exception:
+                    self._discard(connection)
+                    raise
+            self._checkin(connection, sent + 1)
+
+    def _open(self) -> SMTP:
+        if self.connect is not None:
+            return self.connect()
+        return connect_smtp(self.host, self.port, self.username, self.password, self.use_ssl)
+
+    def _checkout(self) -> Tuple[SMTP, int]:
+        while True:
+            with self.lock:
+                if len(self.idle) == 0:
+                    break
+                connection, sent, last_used = self.idle.pop()
+            if self.clock() - last_used < SMTP_HEALTH_CHECK_SECONDS or self._is_alive(connection):
+                return connection, sent
+            self._discard(connection)
+        return self._open(), 0
+
+    def _checkin(self, connection: SMTP, sent: int) -> None:
+        if sent >= self.max_messages:
+            self._discard(connection)
+            return
+        with self.lock:
+            self.idle.append((connection, sent, self.clock()))
+
+    def _is_alive(self, connection: SMTP) -> bool:
+        try:
+            return connection.noop()[0] == 250
+        except OSError:
+            return False
+
+    def _discard(self, connection: SMTP) -> None:
+        try:
+            connection.quit()
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection, _, _ in idle:
+            self._discard(connection)
+
+
+class RpcTransport(EmailTransport):
+    """
+    Sends emails through the CS 162 mailserver's RPC interface. It takes plain text emails only, so HTML parts are
+    dropped.
+    """
+
+    def __init__(self, send: Callable[..., Any] = send_email) -> None:
+        self.send = send
+
+    def sendmail(self, from_addr: str, to_addrs: List[str], msg: str) -> None:
+        if not os.environ.get(ENV_APP_MASTER_SECRET):
+            raise EmailError(
+                "Internal error: environment master secret not set, so cannot send emails via the CS 162 mailserver!"
+            )
+
+        message = message_from_string(msg)
+        sender_name, sender_email = parseaddr(message["From"])
+        cc_emails = [email for _, email in getaddresses(message.get_all("CC", []))]
+        extra_headers = [("Reply-To", message["Reply-To"])]
+        if len(cc_emails) > 0:
+            extra_headers.append(("Cc", ", ".join(cc_emails)))
+
+        parts = [part for part in message.walk() if part.get_content_type() == "text/plain"]
+        body = parts[0].get_payload(decode=True).decode(parts[0].get_content_charset() or "utf-8") if parts else ""
+        try:
+            self.send(
+                sender=sender_name or sender_email,
+                target=message["To"],
+                targets=cc_emails,
+                subject=message["Subject"],
+                body=body,
+                _impersonate="mail",
+                extra_headers=extra_headers,
+            )
+        except Exception as err:
+            raise EmailError(f"An error occurred while sending an email: {err}")
+
+
+class SpoolTransport(EmailTransport):
+    """
+    Writes each email to a .eml file in a directory instead of sending it, e.g. to try out a course's templates
+    locally. The envelope is recorded in X-Envelope-From and X-Envelope-To headers.
+    """
+
+    def __init__(self, directory: str = EMAIL_SPOOL_DIR) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def sendmail(self, from_addr: str, to_addrs: List[str], msg: str) -> None:
+        path = os.path.join(self.directory, f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.eml")
+        with open(path + ".tmp", "w") as f:
+            f.write(f"X-Envelope-From: {from_addr}\nX-Envelope-To: {', '.join(to_addrs)}\n{msg}")
+        # Readers only see complete files.
+        os.replace(path + ".tmp", path)
+
+    def get_messages(self) -> List[str]:
+        """
+        The paths of the spooled emails, oldest first.
+        """
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(".eml"))
+        return [os.path.join(self.directory, name) for name in names]
+
+
+class TransportRegistry:
+    """
+    Holds one transport per distinct email configuration, shared by every request this process handles (so SMTP
+    connections are pooled across requests).
+    """
+
+    def __init__(self) -> None:
+        self.transports: Dict[Hashable, EmailTransport] = {}
+        self.lock = Lock()
+
+    def get(self, config: PolicyConfig) -> EmailTransport:
+        if config.email_transport == EMAIL_TRANSPORT_SMTP and config.smtp_host is None:
+            return SMTP_POOL
+
+        key: Hashable
+        if config.email_transport == EMAIL_TRANSPORT_SMTP:
+            # The password is part of the key (hashed, so it isn't kept around in the clear), so a changed password
+            # gets a new pool rather than reusing connections (or logins) made with the old one.
+            password = hashlib.sha256((config.smtp_password or "").encode()).hexdigest()
+            key = (
+                EMAIL_TRANSPORT_SMTP,
+                config.smtp_host,
+                config.smtp_port,
+                config.smtp_username,
+                config.smtp_ssl,
+                password,
+            )
+        elif config.email_transport == EMAIL_TRANSPORT_RPC:
+            key = EMAIL_TRANSPORT_RPC
+        elif config.email_transport == EMAIL_TRANSPORT_SPOOL:
+            key = (EMAIL_TRANSPORT_SPOOL, config.email_spool_dir or EMAIL_SPOOL_DIR)
+        else:
+            raise EmailError(f"Unknown email transport: {config.email_transport}")
+
+        stale: List[EmailTransport] = []
+        with self.lock:
+            if key not in self.transports:
+                # Pools for the same account with an old password won't be used again.
+                if config.email_transport == EMAIL_TRANSPORT_SMTP:
+                    for other in [other for other in self.transports if TransportRegistry.is_stale(other, key)]:
+                        stale.append(self.transports.pop(other))
+                self.transports[key] = TransportRegistry.create(config)
+            transport = self.transports[key]
+        for old in stale:
+            old.close()
+        return transport
+
+    @staticmethod
+    def is_stale(key: Hashable, new_key: Tuple[Any, ...]) -> bool:
+        """
+        Whether an SMTP pool's key is for the same account as new_key, but with a different password.
+        """
+        return isinstance(key, tuple) and len(key) == len(new_key) and key[:-1] == new_key[:-1]
+
+    @staticmethod
+    def create(config: PolicyConfig) -> EmailTransport:
+        if config.email_transport == EMAIL_TRANSPORT_RPC:
+            return RpcTransport()
+        if config.email_transport == EMAIL_TRANSPORT_SPOOL:
+            return SpoolTransport(directory=config.email_spool_dir or EMAIL_SPOOL_DIR)
+        return SmtpPool(
+            host=config.smtp_host,
+            port=config.smtp_port,
+            username=config.smtp_username,
+            password=config.smtp_password,
+            use_ssl=config.smtp_ssl,
+        )
+
+    def close(self) -> None:
+        with self.lock:
+            transports, self.transports = list(self.transports.values()), {}
+        for transport in transports:
+            transport.close()
+
+
+def get_transport(config: PolicyConfig) -> EmailTransport:
+    return TRANSPORT_REGISTRY.get(config)
+
+
+def get_default_transport() -> EmailTransport:
+    """
+    The built-in SMTP server, for emails sent without a course's configuration.
+    """
+    return SMTP_POOL
+
+
+SMTP_POOL = SmtpPool()
+TRANSPORT_REGISTRY = TransportRegistry()
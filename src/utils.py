@@ -1,16 +1,28 @@
-import os
+from __future__ import annotations
+
+import re
+from contextvars import Context, ContextVar
 from datetime import datetime
-from typing import Any, List, Optional
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, List, Optional
 
 from dateutil import parser
-from dotenv import dotenv_values
 from pytz import timezone
 
-from src.errors import ConfigurationError, KnownError
-from src.sheets import Sheet
+from src.errors import KnownError
+
+if TYPE_CHECKING:
+    from src.config import PolicyConfig
 
 PST = timezone("US/Pacific")
 
+# Parsed dates are cached, since the same cells and timestamps are parsed on every load.
+DATE_CACHE_SIZE = 4096
+
+# Date-only cells in the formats Sheets uses, which we parse without dateutil.
+ISO_DATE = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})$")
+US_DATE = re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{4})$")
+
 
 def cast_bool(cell: str) -> bool:
     cell = str(cell).strip()
@@ -24,13 +36,53 @@ def cast_bool(cell: str) -> bool:
     return cell == "Yes" or cell == "TRUE"
 
 
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date_cell(cell: str, deadline: bool) -> datetime:
+    """
+    Parses a date cell as a Pacific time. Deadlines without a time are due at 11:59 PM.
+    """
+    match = ISO_DATE.match(cell)
+    if match:
+        year, month, day = match.groups()
+    else:
+        match = US_DATE.match(cell)
+        if match:
+            month, day, year = match.groups()
+    if match:
+        try:
+            date = (
+                datetime(int(year), int(month), int(day), 23, 59)
+                if deadline
+                else datetime(int(year), int(month), int(day))
+            )
+            return PST.localize(date)
+        except ValueError:
+            # Not a valid month/day in that order (e.g. a day-first "27/01/2022"); dateutil is more forgiving.
+            pass
+
+    suffix = " 11:59 PM" if deadline else ""
+    return PST.localize(parser.parse(cell + suffix))
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_timestamp(value: str) -> datetime:
+    """
+    Parses a timestamp (e.g. a form submission's), trying ISO-8601 before falling back to dateutil. Timestamps without
+    a timezone are returned as is.
+    """
+    value = str(value).strip()
+    try:
+        return datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+    except ValueError:
+        return parser.parse(value)
+
+
 def cast_date(cell: str, deadline: bool = True, optional: bool = False) -> Optional[datetime]:
     try:
         if optional and (cell is None or str(cell).strip() == ""):
             return None
         cell = str(cell).strip()
-        suffix = " 11:59 PM" if deadline else ""
-        return PST.localize(parser.parse(str(cell) + suffix))
+        return parse_date_cell(cell, deadline)
     except Exception as err:
         raise KnownError(f"Could not convert cell to date format. Value = {cell}, Error = {err}.")
 
@@ -51,75 +103,35 @@ def cast_list_int(cell: str) -> List[int]:
     return items
 
 
-PREFIX = "cs161extensions_"
+REQUEST_CONFIG: ContextVar[Optional[PolicyConfig]] = ContextVar("request_config", default=None)
 
 
 class Environment:
-    @staticmethod
-    def clear():
-        keys = os.environ.keys()
-        for key in keys:
-            if key.startswith(PREFIX):
-                del os.environ[key]
-
-    @staticmethod
-    def contains(key: str) -> bool:
-        return os.getenv(PREFIX + key) is not None and str(os.getenv(PREFIX + key)).strip() != ""
+    """
+    Holds the configuration of the course whose request is being handled, so top-level error handlers can still
+    report to that course's Slack. It's stored in a context variable, so requests handled concurrently (e.g. on a
+    thread pool) each see their own course.
+    """
 
     @staticmethod
-    def safe_get(key: str, default: str = None) -> Optional[str]:
-        if os.getenv(PREFIX + key):
-            data = str(os.getenv(PREFIX + key)).strip()
-            if data:
-                return data
-        return default
-
-    @staticmethod
-    def get(key: str) -> Any:
-        if not os.getenv(PREFIX + key):
-            raise ConfigurationError("Environment variable not set: " + key)
-        return os.getenv(PREFIX + key)
-
-    @staticmethod
-    def get_auto_approve_threshold() -> int:
-        return int(Environment.get("AUTO_APPROVE_THRESHOLD"))
-
-    @staticmethod
-    def get_auto_approve_threshold_dsp() -> int:
-        return int(Environment.get("AUTO_APPROVE_THRESHOLD_DSP"))
+    def run(fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Runs fn (e.g. a request handler) in a fresh context, so it starts without a course configured, and doesn't
+        leak its course to whatever runs next on the same thread.
+        """
+        return Context().run(fn, *args, **kwargs)
 
     @staticmethod
-    def get_max_total_requested_extensions_threshold() -> int:
-        # If this number is -1, then assume this flag is disabled.
-        # If this number is 0, then reject all extensions.
-        # If this number is > 0, then reject extensions if the total number of extensions requested exceeds this number.
-        return int(Environment.safe_get("MAX_TOTAL_REQUESTED_EXTENSIONS_THRESHOLD", default=-1))
+    def configure(config: PolicyConfig):
+        REQUEST_CONFIG.set(config)
 
     @staticmethod
-    def get_auto_approve_assignment_threshold() -> int:
-        return int(Environment.get("AUTO_APPROVE_ASSIGNMENT_THRESHOLD"))
+    def get_config() -> Optional[PolicyConfig]:
+        return REQUEST_CONFIG.get()
 
     @staticmethod
-    def configure_env_vars(sheet: Sheet):
-        """
-        Reads environment variables from the "Environment Variables" sheet, and stores them into this process's
-        environment variables for downstream use. Expects two columns: a "key" column, and a "value"
-        """
-        records = sheet.get_all_records()
-        for record in records:
-            key = record.get("key")
-            value = record.get("value")
-            if not key:
-                continue
-            os.environ[PREFIX + key] = str(value)
-
-        # Load local environment variables now from .env, which override remote provided variables for debugging
-        if os.path.exists(".env-pytest"):
-            for key, value in dotenv_values(".env-pytest").items():
-                if key == "APP_MASTER_SECRET":
-                    os.environ[key] = value
-                else:
-                    os.environ[PREFIX + key] = value
+    def clear():
+        REQUEST_CONFIG.set(None)
 
 
 def truncate(s, amount=300):
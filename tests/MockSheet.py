@@ -1,10 +1,11 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-import gspread
 import pandas as pd
+from gspread.utils import absolute_range_name, rowcol_to_a1
 from gspread.worksheet import Worksheet
+from src.sheets import coalesce_cells, format_cell_value
 
 SHEET_STUDENT_RECORDS = "Roster"
 SHEET_ASSIGNMENTS = "Assignments"
@@ -21,7 +22,9 @@ class MockSheet:
         self.df = pd.DataFrame(rows, columns=headers)
         self.df = self.df.fillna("")
         self.sheet = sheet
-        self.modified = False
+        # Cells changed since loading, keyed by data-relative (row, col); only these are written back on flush().
+        self.dirty: Dict[Tuple[int, int], Any] = {}
+        self.memos: Dict[str, Any] = {}
 
     @staticmethod
     def from_live(sheet: Worksheet) -> MockSheet:
@@ -31,6 +34,12 @@ class MockSheet:
     def get_headers(self) -> List[str]:
         return list(self.df.columns)
 
+    def has_column(self, header: str) -> bool:
+        return header in self.df.columns
+
+    def get_column_index(self, header: str) -> Optional[int]:
+        return self.get_headers().index(header) if header in self.df.columns else None
+
     def get_all_values(self) -> List[List[Any]]:
         return [list(self.df.columns)] + self.df.values.tolist()
 
@@ -40,6 +49,18 @@ class MockSheet:
             records.append({header: row[header] for header in self.df.columns})
         return records
 
+    def memoize(self, key: str, factory: Callable[[], Any]) -> Any:
+        if key not in self.memos:
+            self.memos[key] = factory()
+        return self.memos[key]
+
+    def fetch_column(self, header: str) -> List[Any]:
+        return list(self.df[header])
+
+    def is_stale(self, header: str) -> bool:
+        # The mock is the only writer until flush(), so it can't fall behind.
+        return False
+
     def get_record_by_id(self, id_column: str, id_value: str) -> Optional[Tuple[int, Dict[str, Any]]]:
         all_records = self.get_all_records()
         for i, record in enumerate(all_records):
@@ -47,23 +68,37 @@ class MockSheet:
                 return (i, record)
         return None
 
+    def get_records_by_ids(
+        self, id_column: str, id_values: List[str]
+    ) -> Dict[str, Optional[Tuple[int, Dict[str, Any]]]]:
+        return {id_value: self.get_record_by_id(id_column=id_column, id_value=id_value) for id_value in id_values}
+
     def update_cells(self, cells: List[Any]):
         for row, col, value in cells:
-            self.df.loc[row][self.df.columns[col]] = value
+            if format_cell_value(self.df.iat[row, col]) != format_cell_value(value):
+                self.df.iat[row, col] = value
+                self.dirty[(row, col)] = value
         self.df = self.df.fillna("")
-        self.modified = True
 
     def flush(self):
-        if not self.modified:
+        if len(self.dirty) == 0:
             return
-        cells: List[gspread.Cell] = []
-        for i, row in self.df.iterrows():
-            for j, col in enumerate(self.df.columns):
-                cells.append(gspread.Cell(row=i + 2, col=j + 1, value=row[col]))
-        self.sheet.update_cells(cells, value_input_option="USER_ENTERED")
+        data = []
+        for row, col, values in coalesce_cells([[row, col, value] for (row, col), value in self.dirty.items()]):
+            start = rowcol_to_a1(row + 2, col + 1)
+            end = rowcol_to_a1(row + 1 + len(values), col + len(values[0]))
+            data.append({"range": absolute_range_name(self.sheet.title, f"{start}:{end}"), "values": values})
+        self.sheet.spreadsheet.values_batch_update(body={"valueInputOption": "USER_ENTERED", "data": data})
+        self.dirty = {}
         print(self.sheet.get_all_values())
 
-    def append_row(self, values: List[Any], value_input_option: str):
-        self.df.loc[len(self.df)] = values
+    def append_row(self, values: List[Any], value_input_option: str) -> int:
+        row_index = len(self.df)
+        self.df.loc[row_index] = values
         self.df = self.df.fillna("")
-        self.modified = True
+        for col, value in enumerate(values):
+            self.dirty[(row_index, col)] = value
+        return row_index
+
+    def append_rows(self, rows: List[List[Any]], value_input_option: str) -> List[int]:
+        return [self.append_row(values=values, value_input_option=value_input_option) for values in rows]
@@ -0,0 +1,35 @@
+from src.cache import ConfigCache
+
+URL = "https://docs.google.com/spreadsheets/d/example/edit"
+
+
+class TestConfigCache:
+    def test_get_requires_matching_revision(self):
+        cache = ConfigCache()
+        cache.put(URL, "Assignments", "10", "value")
+        assert cache.get(URL, "Assignments", "10") == "value"
+        assert cache.get(URL, "Assignments", "11") is None
+        assert cache.get(URL, "Form Questions", "10") is None
+
+    def test_restamp(self):
+        cache = ConfigCache()
+        cache.put(URL, "Assignments", "10", "value")
+        cache.put("https://other", "Assignments", "10", "other")
+        cache.restamp(URL, old_revision="10", new_revision="12")
+        assert cache.get(URL, "Assignments", "12") == "value"
+        assert cache.get("https://other", "Assignments", "10") == "other"
+
+    def test_invalidate(self):
+        cache = ConfigCache()
+        cache.put(URL, "Assignments", "10", "value")
+        cache.put("https://other", "Assignments", "10", "other")
+        cache.invalidate(URL)
+        assert cache.get(URL, "Assignments", "10") is None
+        assert cache.get("https://other", "Assignments", "10") == "other"
+
+    def test_eviction(self):
+        cache = ConfigCache(maxsize=2)
+        for i in range(3):
+            cache.put(URL, f"tab{i}", "1", i)
+        assert cache.get(URL, "tab0", "1") is None
+        assert cache.get(URL, "tab2", "1") == 2
@@ -0,0 +1,42 @@
+import dataclasses
+
+import pytest
+from src.config import PolicyConfig
+from src.errors import ConfigurationError
+
+VALUES = {
+    "SPREADSHEET_URL": "https://docs.google.com/spreadsheets/d/abc/edit",
+    "SLACK_ENDPOINT": "https://hooks.slack.com/services/abc",
+    "SLACK_TAG_LIST": "U1, U2",
+    "AUTO_APPROVE_THRESHOLD": "3",
+    "AUTO_APPROVE_THRESHOLD_DSP": "7",
+    "AUTO_APPROVE_ASSIGNMENT_THRESHOLD": "2",
+    "EMAIL_FROM": "CS 161 Staff",
+    "EMAIL_REPLY_TO": "cs161@berkeley.edu",
+    "EMAIL_SUBJECT": "Extension Request",
+    "EMAIL_SIGNATURE": "CS 161 Staff",
+}
+
+
+class TestPolicyConfig:
+    def test_from_values(self):
+        config = PolicyConfig.from_values(VALUES)
+        assert config.auto_approve_threshold == 3
+        assert config.max_total_requested_extensions_threshold == -1
+        assert config.slack_tags == ("U1", "U2")
+        assert config.slack_endpoint_debug is None
+        assert not config.extend_gradescope_assignments
+
+    def test_immutable(self):
+        config = PolicyConfig.from_values(VALUES)
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            config.auto_approve_threshold = 10
+
+    def test_reports_every_error(self):
+        values = {**VALUES, "AUTO_APPROVE_THRESHOLD": "three", "EXTEND_GRADESCOPE_ASSIGNMENTS": "Yes"}
+        del values["EMAIL_SUBJECT"]
+        with pytest.raises(ConfigurationError) as err:
+            PolicyConfig.from_values(values)
+        assert "AUTO_APPROVE_THRESHOLD should be an integer" in str(err.value)
+        assert "EMAIL_SUBJECT" in str(err.value)
+        assert "GRADESCOPE_EMAIL" in str(err.value)
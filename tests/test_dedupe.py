@@ -0,0 +1,70 @@
+import main
+import src.dedupe as dedupe
+from src.dedupe import PENDING_RESULT, PENDING_STATUS_CODE, MemoryDedupeStore, SqliteDedupeStore, get_submission_key
+from src.errors import FormInputError
+from tests.MockRequest import MockRequest
+
+URL = "https://docs.google.com/spreadsheets/d/example/edit"
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def check_store(store, clock):
+    assert store.claim("a") is None
+    assert store.claim("a") == PENDING_RESULT
+    store.complete("a", {"success": True})
+    assert store.claim("a") == {"success": True}
+
+    # Failed requests are released, so retries are processed again.
+    assert store.claim("b") is None
+    store.release("b")
+    assert store.claim("b") is None
+
+    clock.now = 1000
+    assert store.claim("a") is None
+
+
+class TestDedupe:
+    def test_submission_key(self):
+        form_data = {"Timestamp": ["2022-01-27T20:46:42.125Z"], "Email Address": ["a@berkeley.edu"]}
+        key = get_submission_key({"spreadsheet_url": URL, "form_data": form_data})
+        assert key == get_submission_key({"form_data": dict(reversed(form_data.items())), "spreadsheet_url": URL})
+        assert key != get_submission_key(
+            {"spreadsheet_url": URL, "form_data": {**form_data, "Email Address": ["b@berkeley.edu"]}}
+        )
+
+    def test_memory_store(self):
+        clock = Clock()
+        check_store(MemoryDedupeStore(ttl=100, pending_ttl=10, clock=clock), clock)
+
+    def test_sqlite_store(self, tmp_path):
+        clock = Clock()
+        check_store(SqliteDedupeStore(str(tmp_path / "dedupe.db"), ttl=100, pending_ttl=10, clock=clock), clock)
+
+    def test_handle_form_submit(self, monkeypatch):
+        calls = []
+
+        def handle(request_json):
+            calls.append(request_json)
+            raise FormInputError("Unknown assignment")
+
+        monkeypatch.setattr(dedupe, "DEDUPE_STORE", MemoryDedupeStore())
+        monkeypatch.setattr(main.handle_form, "handle_form_submit", handle)
+        request = MockRequest({"spreadsheet_url": URL, "form_data": {"Timestamp": ["2022-01-27T20:46:42.125Z"]}})
+
+        # A failed submission's result is remembered, so a retry doesn't run it again.
+        assert main.handle_form_submit(request) == {"success": False, "error": "Unknown assignment"}
+        assert main.handle_form_submit(request) == {"success": False, "error": "Unknown assignment"}
+        assert len(calls) == 1
+
+        # A retry that arrives while the original is still running is told to try again later.
+        pending = MockRequest({"spreadsheet_url": URL, "form_data": {"Timestamp": ["2022-01-28T20:46:42.125Z"]}})
+        dedupe.DEDUPE_STORE.claim(get_submission_key(pending.get_json()))
+        assert main.handle_form_submit(pending) == (PENDING_RESULT, PENDING_STATUS_CODE)
+        assert len(calls) == 1
@@ -0,0 +1,105 @@
+from smtplib import SMTPRecipientsRefused, SMTPServerDisconnected
+
+import pytest
+
+from src.config import PolicyConfig
+from src.email import SMTP_SENDER_EMAIL, Email, EmailQueue, get_sender_email
+from src.transport import SmtpPool, get_transport
+from tests.test_config import VALUES
+
+
+class FakeConnection:
+    def __init__(self, log) -> None:
+        self.log = log
+        self.alive = True
+        self.closed = False
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if not self.alive:
+            raise SMTPServerDisconnected("Connection unexpectedly closed")
+        if to_addrs == ["refused@berkeley.edu"]:
+            raise SMTPRecipientsRefused({"refused@berkeley.edu": (550, b"No such user")})
+        self.log.append((self, msg))
+
+    def noop(self):
+        if not self.alive:
+            raise SMTPServerDisconnected("Connection unexpectedly closed")
+        return (250, b"OK")
+
+    def quit(self):
+        self.closed = True
+
+
+class TestSmtpPool:
+    def get_pool(self, **kwargs):
+        self.sent = []
+        self.connections = []
+
+        def connect():
+            self.connections.append(FakeConnection(self.sent))
+            return self.connections[-1]
+
+        return SmtpPool(connect=connect, **kwargs)
+
+    def test_reuses_connections(self):
+        pool = self.get_pool(max_messages=3)
+        for i in range(5):
+            pool.sendmail("staff@berkeley.edu", ["a@berkeley.edu"], str(i))
+        assert len(self.sent) == 5
+        assert len(self.connections) == 2
+        assert self.connections[0].closed and not self.connections[1].closed
+
+    def test_reconnects(self):
+        pool = self.get_pool()
+        pool.sendmail("staff@berkeley.edu", ["a@berkeley.edu"], "1")
+        self.connections[0].alive = False
+        pool.sendmail("staff@berkeley.edu", ["a@berkeley.edu"], "2")
+        assert [msg for _, msg in self.sent] == ["1", "2"]
+        assert len(self.connections) == 2
+
+    def test_health_check(self):
+        now = [0.0]
+        pool = self.get_pool(clock=lambda: now[0])
+        pool.sendmail("staff@berkeley.edu", ["a@berkeley.edu"], "1")
+        self.connections[0].alive = False
+        now[0] = 1000
+        pool.sendmail("staff@berkeley.edu", ["a@berkeley.edu"], "2")
+        assert len(self.connections) == 2 and self.sent[-1][0] is self.connections[1]
+
+    def test_rejected_message_keeps_connection(self):
+        pool = self.get_pool()
+        with pytest.raises(SMTPRecipientsRefused):
+            pool.sendmail("staff@berkeley.edu", ["refused@berkeley.edu"], "1")
+        pool.sendmail("staff@berkeley.edu", ["a@berkeley.edu"], "2")
+        assert len(self.connections) == 1
+
+
+class TestEmail:
+    def test_sender_email(self):
+        assert get_sender_email(PolicyConfig.from_values(VALUES)) == SMTP_SENDER_EMAIL
+        relay = {**VALUES, "SMTP_HOST": "smtp.example.com", "SMTP_USERNAME": "course@example.com"}
+        assert get_sender_email(PolicyConfig.from_values(relay)) == "course@example.com"
+        config = PolicyConfig.from_values({**relay, "EMAIL_SENDER": "staff@example.com"})
+        assert get_sender_email(config) == "staff@example.com"
+
+        queue = EmailQueue(config=config)
+        email = Email(
+            to_email="a@berkeley.edu",
+            from_email="CS 161 Staff",
+            reply_to_email="cs161@berkeley.edu",
+            cc_emails=[],
+            subject="Extension Request",
+            body="Hi!",
+            sender_email=get_sender_email(config),
+        )
+        email.send(connection=queue)
+        from_addr, to_addrs, msg = queue.messages[0]
+        assert from_addr == "staff@example.com" and to_addrs == ["a@berkeley.edu"]
+        assert "From: CS 161 Staff <staff@example.com>" in msg
+
+    def test_queue_delivers_through_course_transport(self, tmp_path):
+        config = PolicyConfig.from_values({**VALUES, "EMAIL_TRANSPORT": "Spool", "EMAIL_SPOOL_DIR": str(tmp_path)})
+        queue = EmailQueue(config=config)
+        queue.sendmail("staff@berkeley.edu", ["a@berkeley.edu"], "message a")
+        assert queue.deliver() == []
+        assert len(get_transport(config).get_messages()) == 1 and queue.messages == []
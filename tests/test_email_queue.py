@@ -0,0 +1,131 @@
+import src.handle_email_queue
+import src.transport
+from src.handle_email_queue import handle_email_queue
+from src.slack import SlackManager
+from src.sqlite_backend import SQLITE_REGISTRY, SqliteSpreadsheetBackend
+from src.transport import SmtpPool
+from src.utils import Environment
+from tests.test_replay import SNAPSHOT
+
+SPREADSHEET_URL = "sqlite://email-queue"
+HEADERS = SNAPSHOT["Roster"][0] + ["email_comments"]
+
+
+class FakeConnection:
+    def __init__(self, sent) -> None:
+        self.sent = sent
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if "refused@berkeley.edu" in to_addrs:
+            raise ValueError("Recipient refused")
+        self.sent.append(to_addrs[0])
+
+    def noop(self):
+        return (250, b"OK")
+
+    def quit(self):
+        pass
+
+
+class RecordingSlackManager(SlackManager):
+    messages = []
+
+    def send_message(self, message: str) -> None:
+        RecordingSlackManager.messages.append(message + self.get_warnings())
+
+
+class TestEmailQueue:
+    def setup(self, monkeypatch, statuses):
+        self.sent = []
+        monkeypatch.setattr(src.transport, "SMTP_POOL", SmtpPool(connect=lambda: FakeConnection(self.sent)))
+        monkeypatch.setattr(src.handle_email_queue, "SlackManager", RecordingSlackManager)
+        RecordingSlackManager.messages = []
+
+        self.backend = SqliteSpreadsheetBackend()
+        SQLITE_REGISTRY.register(SPREADSHEET_URL, self.backend)
+        self.backend.import_tab("Environment Variables", SNAPSHOT["Environment Variables"])
+        self.backend.import_tab("Assignments", SNAPSHOT["Assignments"])
+        rows = [[email, "", "Approved", status, "", "", "2", ""] for email, status in statuses.items()]
+        self.backend.import_tab("Roster", [HEADERS] + rows)
+
+    def get_statuses(self):
+        return {row[0]: row[HEADERS.index("email_status")] for row in self.backend.export_tab("Roster")[1:]}
+
+    def test_handle_email_queue(self, monkeypatch):
+        self.setup(
+            monkeypatch,
+            {
+                "a@berkeley.edu": "In Queue",
+                "b@berkeley.edu": "",
+                "refused@berkeley.edu": "In Queue",
+                "c@berkeley.edu": "In Queue",
+            },
+        )
+
+        result = Environment.run(handle_email_queue, {"spreadsheet_url": SPREADSHEET_URL})
+
+        assert result == {"sent": 2, "remaining": 0}
+        assert sorted(self.sent) == ["a@berkeley.edu", "c@berkeley.edu"]
+        assert self.get_statuses() == {
+            "a@berkeley.edu": "Auto Sent",
+            "b@berkeley.edu": "",
+            "refused@berkeley.edu": "In Queue",
+            "c@berkeley.edu": "Auto Sent",
+        }
+        assert len(RecordingSlackManager.messages) == 1
+        assert "Sent 2 emails" in RecordingSlackManager.messages[0]
+        assert "refused@berkeley.edu, but failed" in RecordingSlackManager.messages[0]
+
+    def test_continuation(self, monkeypatch):
+        self.setup(monkeypatch, {f"{name}@berkeley.edu": "In Queue" for name in "abcde"})
+        monkeypatch.setattr(src.handle_email_queue, "EMAIL_QUEUE_CHUNK_SIZE", 2)
+
+        # With no time to spare, each call sends one chunk.
+        request = {"spreadsheet_url": SPREADSHEET_URL, "time_budget_seconds": 0}
+        assert Environment.run(handle_email_queue, request) == {"sent": 2, "remaining": 3}
+        assert self.sent == ["a@berkeley.edu", "b@berkeley.edu"]
+
+        # Suppose the next call was killed while sending c's and d's emails, after marking them as sending.
+        column = HEADERS.index("email_status") + 1
+        self.backend.get_sheet_backend("Roster").update_ranges([(4, column, [["Sending"], ["Sending"]])])
+
+        # Any call (on any instance) flags c and d for staff instead of emailing them again, and only emails e.
+        assert Environment.run(handle_email_queue, {"spreadsheet_url": SPREADSHEET_URL}) == {"sent": 1, "remaining": 0}
+        assert self.sent == ["a@berkeley.edu", "b@berkeley.edu", "e@berkeley.edu"]
+        assert self.get_statuses() == {
+            "a@berkeley.edu": "Auto Sent",
+            "b@berkeley.edu": "Auto Sent",
+            "c@berkeley.edu": "Sending",
+            "d@berkeley.edu": "Sending",
+            "e@berkeley.edu": "Auto Sent",
+        }
+        assert "sending an email to c@berkeley.edu" in RecordingSlackManager.messages[-1]
+        assert "sending an email to d@berkeley.edu" in RecordingSlackManager.messages[-1]
+
+    def test_marks_sending_before_sending(self, monkeypatch):
+        self.setup(monkeypatch, {"a@berkeley.edu": "In Queue"})
+        statuses = []
+
+        def send_email(email):
+            statuses.append(self.get_statuses()[email.to_email])
+
+        monkeypatch.setattr(src.handle_email_queue, "send_email", send_email)
+        Environment.run(handle_email_queue, {"spreadsheet_url": SPREADSHEET_URL})
+        assert statuses == ["Sending"]
+        assert self.get_statuses() == {"a@berkeley.edu": "Auto Sent"}
+
+    def test_skips_claimed_students(self, monkeypatch):
+        self.setup(monkeypatch, {"a@berkeley.edu": "In Queue", "b@berkeley.edu": "In Queue"})
+        monkeypatch.setattr(src.handle_email_queue, "EMAIL_QUEUE_CHUNK_SIZE", 1)
+        column = HEADERS.index("email_status") + 1
+        send_email = src.handle_email_queue.send_email
+
+        # While we're emailing a, another call claims b.
+        def send_email_concurrently(email):
+            self.backend.get_sheet_backend("Roster").update_ranges([(3, column, [["Sending"]])])
+            return send_email(email)
+
+        monkeypatch.setattr(src.handle_email_queue, "send_email", send_email_concurrently)
+        assert Environment.run(handle_email_queue, {"spreadsheet_url": SPREADSHEET_URL}) == {"sent": 1, "remaining": 0}
+        assert self.sent == ["a@berkeley.edu"]
+        assert self.get_statuses() == {"a@berkeley.edu": "Auto Sent", "b@berkeley.edu": "Sending"}
@@ -0,0 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from src.config import PolicyConfig
+from src.utils import Environment
+
+from tests.test_config import VALUES
+
+
+def handle(threshold: str) -> int:
+    assert Environment.get_config() is None
+    Environment.configure(PolicyConfig.from_values({**VALUES, "AUTO_APPROVE_THRESHOLD": threshold}))
+    return Environment.get_config().auto_approve_threshold
+
+
+class TestEnvironment:
+    def test_requests_are_isolated(self):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            thresholds = [str(i) for i in range(20)]
+            results = list(pool.map(lambda threshold: Environment.run(handle, threshold), thresholds))
+        assert results == list(range(20))
+
+    def test_run_does_not_leak(self):
+        Environment.run(handle, "5")
+        assert Environment.get_config() is None
@@ -0,0 +1,73 @@
+import json
+
+from src.handle_form_submit import handle_form_submit_batch
+from src.outbox import JOB_EMAIL, JOB_SLACK, OUTBOX_HEADERS
+from src.sqlite_backend import SQLITE_REGISTRY, SqliteSpreadsheetBackend
+from src.utils import Environment
+from tests.test_replay import SNAPSHOT, get_form_data
+
+SPREADSHEET_URL = "sqlite://form-submit"
+HEADERS = SNAPSHOT["Roster"][0] + ["email_comments"]
+
+
+class TestFormSubmitBatch:
+    def setup(self, roster):
+        self.backend = SqliteSpreadsheetBackend()
+        SQLITE_REGISTRY.register(SPREADSHEET_URL, self.backend)
+        for sheet_name in ["Environment Variables", "Assignments", "Form Questions"]:
+            self.backend.import_tab(sheet_name, SNAPSHOT[sheet_name])
+        self.backend.import_tab("Roster", [HEADERS] + roster)
+        self.backend.import_tab("Outbox", [OUTBOX_HEADERS])
+
+    def get_jobs(self):
+        return [(row[0], json.loads(row[1])) for row in self.backend.export_tab("Outbox")[1:]]
+
+    def get_roster(self):
+        return {row[0]: row for row in self.backend.export_tab("Roster")[1:]}
+
+    def test_partial_failure(self):
+        # b's existing request can't be read, so b's submission fails once it's applied.
+        self.setup(
+            [["a@berkeley.edu", "", "", "", "", "", "", ""], ["b@berkeley.edu", "", "", "", "", "", "?", ""]],
+        )
+        form_data_list = [
+            get_form_data("b@berkeley.edu", 2, "2022-01-02T00:00:00Z"),
+            get_form_data("a@berkeley.edu", 2, "2022-01-01T00:00:00Z"),
+        ]
+
+        results = Environment.run(
+            handle_form_submit_batch, {"spreadsheet_url": SPREADSHEET_URL, "form_data_list": form_data_list}
+        )
+
+        assert [(result["timestamp"], result["success"]) for result in results] == [
+            ("2022-01-01T00:00:00Z", True),
+            ("2022-01-02T00:00:00Z", False),
+        ]
+        assert "hw1" in results[1]["error"]
+
+        # a's approval is still committed and emailed, and b's error is reported to Slack.
+        roster = self.get_roster()
+        assert roster["a@berkeley.edu"][2:4] == ["Auto Approved", "Auto Sent"]
+        assert roster["b@berkeley.edu"][2:4] == ["", ""]
+        jobs = self.get_jobs()
+        assert [payload["to_addrs"][0] for kind, payload in jobs if kind == JOB_EMAIL] == ["a@berkeley.edu"]
+        slack = [message for kind, payload in jobs if kind == JOB_SLACK for message in payload["messages"]]
+        assert any("hw1" in message["text"] for message in slack)
+
+    def test_missing_timestamp(self):
+        self.setup([["a@berkeley.edu", "", "", "", "", "", "", ""]])
+        missing = get_form_data("b@berkeley.edu", 2, "2022-01-02T00:00:00Z")
+        del missing["Timestamp"]
+        form_data_list = [missing, get_form_data("a@berkeley.edu", 2, "2022-01-01T00:00:00Z")]
+
+        results = Environment.run(
+            handle_form_submit_batch, {"spreadsheet_url": SPREADSHEET_URL, "form_data_list": form_data_list}
+        )
+
+        # The submission without a timestamp fails on its own; the rest of the batch is still processed.
+        assert [(result["timestamp"], result["success"]) for result in results] == [
+            (None, False),
+            ("2022-01-01T00:00:00Z", True),
+        ]
+        assert "timestamp" in results[0]["error"]
+        assert self.get_roster()["a@berkeley.edu"][2:4] == ["Auto Approved", "Auto Sent"]
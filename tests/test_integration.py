@@ -3,6 +3,7 @@ from typing import Any, Dict
 import gspread
 import pytest
 from src.assignments import AssignmentList
+from src.config import PolicyConfig
 from src.errors import KnownError
 from src.policy import Policy
 from src.sheets import (
@@ -13,7 +14,6 @@ from src.sheets import (
     BaseSpreadsheet,
 )
 from src.slack import SlackManager
-from src.utils import Environment
 
 from tests.MockSheet import MockSheet
 
@@ -65,13 +65,14 @@ class TestIntegration:
         }
 
     def get_policy(self, mock_request: Dict[str, Any], timestamp: str):
-        Environment.configure_env_vars(TestIntegration.sheet_env_vars)
-        slack = SlackManager()
+        config = PolicyConfig.from_sheet(TestIntegration.sheet_env_vars)
+        slack = SlackManager(config=config)
         policy = Policy(
             sheet_assignments=TestIntegration.sheet_assignments,
             sheet_form_questions=TestIntegration.sheet_form_questions,
             form_payload={"Timestamp": [timestamp]},
             slack=slack,
+            config=config,
         )
         for key, value in mock_request.items():
             policy.submission.responses[key] = value
@@ -0,0 +1,163 @@
+import json
+
+from src.config import PolicyConfig
+from src.email import EmailQueue
+from src.gradescope import GradescopeQueue
+from src.outbox import JOB_EMAIL, JOB_GRADESCOPE, JOB_SLACK, OUTBOX_HEADERS, Outbox, OutboxWorker
+from src.sheets import BaseSpreadsheet, Sheet
+from src.slack import SlackManager
+from src.sqlite_backend import SQLITE_REGISTRY, SqliteSpreadsheetBackend
+
+from tests.test_config import VALUES
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeWebhook:
+    def __init__(self) -> None:
+        self.sent = []
+
+    def send(self, **kwargs):
+        self.sent.append(kwargs)
+        return type("Response", (), {"status_code": 200})()
+
+
+def get_outbox(clock: Clock) -> Outbox:
+    backend = SqliteSpreadsheetBackend()
+    backend.import_tab("Outbox", [OUTBOX_HEADERS])
+    return Outbox(sheet=Sheet(backend=backend.get_sheet_backend("Outbox")), clock=clock)
+
+
+class TestOutbox:
+    def test_record(self):
+        config = PolicyConfig.from_values(VALUES)
+        emails = EmailQueue(config=config)
+        emails.sendmail("staff@berkeley.edu", ["a@berkeley.edu"], "message a")
+        emails.sendmail("staff@berkeley.edu", ["b@berkeley.edu"], "message b")
+        gradescope = GradescopeQueue(config=config)
+        gradescope.apply_extension(["https://www.gradescope.com/courses/1/assignments/2"], "a@berkeley.edu", 2)
+
+        backend = SqliteSpreadsheetBackend()
+        backend.import_tab("Outbox", [OUTBOX_HEADERS])
+        SQLITE_REGISTRY.register("sqlite://outbox-record", backend)
+        base = BaseSpreadsheet("sqlite://outbox-record")
+        worker = OutboxWorker(config=config, runners={})
+        worker.record(base=base, emails=emails, gradescope=gradescope, slack_messages=[{"text": "hello"}])
+
+        # Every job is appended with one write, and nothing is sent yet.
+        rows = backend.export_tab("Outbox")[1:]
+        assert [row[0] for row in rows] == [JOB_EMAIL, JOB_EMAIL, JOB_GRADESCOPE, JOB_SLACK]
+        assert all(row[2] == "pending" for row in rows)
+        assert json.loads(rows[1][1])["to_addrs"] == ["b@berkeley.edu"]
+        assert json.loads(rows[3][1]) == {"messages": [{"text": "hello"}]}
+        assert base.writes == 1
+        # Jobs don't carry the config, so its passwords are never written to the spreadsheet.
+        assert all(
+            set(json.loads(row[1])) <= {"from_addr", "to_addrs", "msg", "extensions", "messages"} for row in rows
+        )
+        assert emails.messages == [] and gradescope.extensions == []
+
+    def test_record_without_outbox(self):
+        config = PolicyConfig.from_values(VALUES)
+        emails = EmailQueue(config=config)
+        emails.sendmail("staff@berkeley.edu", ["a@berkeley.edu"], "message a")
+        SQLITE_REGISTRY.register("sqlite://outbox-missing", SqliteSpreadsheetBackend())
+        sent = []
+
+        # Without an Outbox tab, jobs are run right away, with the handler's config.
+        worker = OutboxWorker(
+            config=config, runners={JOB_EMAIL: lambda config, payload: sent.append((config, payload))}
+        )
+        worker.record(
+            base=BaseSpreadsheet("sqlite://outbox-missing"),
+            emails=emails,
+            gradescope=GradescopeQueue(config=config),
+            slack_messages=[],
+        )
+        assert sent == [
+            (config, {"from_addr": "staff@berkeley.edu", "to_addrs": ["a@berkeley.edu"], "msg": "message a"})
+        ]
+
+    def test_retries(self):
+        clock = Clock()
+        outbox = get_outbox(clock)
+        outbox.enqueue([(JOB_SLACK, {"messages": [{"text": "hello"}]})])
+        attempts = []
+
+        def flaky(config, payload):
+            attempts.append(payload)
+            if len(attempts) < 3:
+                raise Exception("Slack is down")
+
+        worker = OutboxWorker(config=PolicyConfig.from_values(VALUES), runners={JOB_SLACK: flaky}, clock=clock)
+        assert worker.drain(outbox) == 1
+        assert worker.drain(outbox) == 0
+        clock.now = 60
+        assert worker.drain(outbox) == 1
+        clock.now = 180
+        assert worker.drain(outbox) == 1
+        assert len(attempts) == 3
+        assert outbox.count("done") == 1 and outbox.count("pending") == 0
+
+    def test_gives_up(self):
+        clock = Clock()
+        outbox = get_outbox(clock)
+        outbox.enqueue([(JOB_EMAIL, {"from_addr": "staff@berkeley.edu", "to_addrs": ["a@berkeley.edu"], "msg": ""})])
+        reports = []
+
+        def broken(config, payload):
+            raise Exception("SMTP is down")
+
+        runners = {JOB_EMAIL: broken, JOB_SLACK: lambda config, payload: reports.extend(payload["messages"])}
+        worker = OutboxWorker(config=PolicyConfig.from_values(VALUES), runners=runners, clock=clock)
+        for i in range(10):
+            clock.now = 1000 * i
+            worker.drain(outbox)
+        assert outbox.count("failed") == 1
+        assert outbox.get_value(0, "error") == "SMTP is down"
+        assert len(reports) == 1 and "a@berkeley.edu" in reports[0]["text"]
+
+    def test_claim_rereads(self):
+        clock = Clock()
+        outbox = get_outbox(clock)
+        outbox.enqueue([(JOB_SLACK, {"messages": [{"text": "hello"}]})])
+        assert len(outbox.claim()) == 1
+
+        # Another drain (with its own copy of the tab) sees the lease, and jobs recorded since it loaded.
+        other = Outbox(sheet=Sheet(backend=outbox.sheet.backend), clock=clock)
+        outbox.enqueue([(JOB_SLACK, {"messages": [{"text": "bye"}]})])
+        other.fresh = False
+        assert [payload for _, _, payload, _ in other.claim()] == [{"messages": [{"text": "bye"}]}]
+
+    def test_drain_all(self):
+        clock = Clock()
+        outbox = get_outbox(clock)
+        outbox.enqueue([(JOB_SLACK, {"messages": ["hello"]}), (JOB_SLACK, {"messages": ["bye"]})])
+        sent = []
+
+        def flaky(config, payload):
+            if payload["messages"] == ["bye"]:
+                raise Exception("Slack is down")
+            sent.append(payload)
+
+        # A failed job waits for its backoff, rather than being retried in a loop.
+        worker = OutboxWorker(config=PolicyConfig.from_values(VALUES), runners={JOB_SLACK: flaky}, clock=clock)
+        assert worker.drain_all(outbox) == 2
+        assert sent == [{"messages": ["hello"]}]
+        assert outbox.count("pending") == 1
+
+    def test_send_outbox(self):
+        webhook = FakeWebhook()
+        slack = SlackManager(config=PolicyConfig.from_values(VALUES))
+        slack.webhooks = [webhook]
+        button = {"blocks": [{"type": "actions", "block_id": "approve_extension", "elements": []}]}
+        slack.send_outbox([{"text": "a"}, {"text": "b"}, button, {"text": "c"}])
+
+        # Text is joined into as few messages as possible, but messages with blocks (e.g. buttons) are kept as is.
+        assert webhook.sent == [{"text": "a\n\nb"}, button, {"text": "c"}]
@@ -0,0 +1,97 @@
+import pytest
+from gspread.exceptions import APIError
+from src.errors import SheetError
+from src.quota import QuotaLimiter, TokenBucket
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code: int) -> None:
+        self.status_code = status_code
+
+    def json(self):
+        return {"error": {"code": self.status_code, "message": "error", "status": "ERROR"}}
+
+
+class TestQuota:
+    def test_token_bucket_waits_when_empty(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock.time, sleep=clock.sleep)
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == pytest.approx(0.5)
+        assert clock.now == pytest.approx(0.5)
+
+    def test_limiter_retries_throttled_calls(self):
+        clock = FakeClock()
+        limiter = QuotaLimiter(bucket=TokenBucket(rate=10, capacity=10, clock=clock.time, sleep=clock.sleep))
+        responses = [429, 503]
+
+        def call():
+            if responses:
+                raise APIError(FakeResponse(responses.pop(0)))
+            return "ok"
+
+        assert limiter.call(call) == "ok"
+        assert limiter.get_headroom()["retries"] == 2
+
+    def test_limiter_gives_up_on_quota(self):
+        clock = FakeClock()
+        limiter = QuotaLimiter(
+            bucket=TokenBucket(rate=10, capacity=10, clock=clock.time, sleep=clock.sleep), max_retries=2
+        )
+
+        def call():
+            raise APIError(FakeResponse(429))
+
+        with pytest.raises(SheetError):
+            limiter.call(call)
+
+    def test_limiter_does_not_retry_client_errors(self):
+        clock = FakeClock()
+        limiter = QuotaLimiter(bucket=TokenBucket(rate=10, capacity=10, clock=clock.time, sleep=clock.sleep))
+
+        def call():
+            raise APIError(FakeResponse(400))
+
+        with pytest.raises(APIError):
+            limiter.call(call)
+        assert limiter.get_headroom()["retries"] == 0
+
+    def test_limiter_does_not_repeat_writes_after_server_errors(self):
+        clock = FakeClock()
+        limiter = QuotaLimiter(bucket=TokenBucket(rate=10, capacity=10, clock=clock.time, sleep=clock.sleep))
+        appended = []
+
+        def append():
+            # The row is added, but the response is lost.
+            appended.append("row")
+            raise APIError(FakeResponse(503))
+
+        with pytest.raises(SheetError):
+            limiter.call_write(append)
+        assert appended == ["row"]
+        assert limiter.get_headroom()["retries"] == 0
+
+    def test_limiter_retries_throttled_writes(self):
+        clock = FakeClock()
+        limiter = QuotaLimiter(bucket=TokenBucket(rate=10, capacity=10, clock=clock.time, sleep=clock.sleep))
+        responses = [429]
+
+        def append():
+            if responses:
+                raise APIError(FakeResponse(responses.pop(0)))
+            return "ok"
+
+        assert limiter.call_write(append) == "ok"
+        assert limiter.get_headroom()["retries"] == 1
@@ -0,0 +1,170 @@
+from src.assignments import AssignmentList
+from src.record import StudentRecord, WriteSession
+from src.sheets import Sheet
+from src.sqlite_backend import SqliteSpreadsheetBackend
+
+ROSTER = [["email", "approval_status", "hw1"], ["a@berkeley.edu", "Approved", "2"], ["b@berkeley.edu", "", ""]]
+
+
+def record_calls(backend, names):
+    """
+    Wraps a backend's methods so each call is logged (by name) to the returned list.
+    """
+    calls = []
+
+    def recorded(name):
+        method = getattr(backend, name)
+
+        def wrapper(*args, **kwargs):
+            calls.append(name)
+            return method(*args, **kwargs)
+
+        return wrapper
+
+    for name in names:
+        setattr(backend, name, recorded(name))
+    return calls
+
+
+class TestWriteSession:
+    def test_add_changes(self):
+        remote = SqliteSpreadsheetBackend()
+        remote.import_tab("Roster", ROSTER)
+        sheet = Sheet(backend=remote.get_sheet_backend("Roster"))
+
+        local = SqliteSpreadsheetBackend()
+        local.import_tab("Roster", sheet.get_all_values())
+        edited = Sheet(backend=local.get_sheet_backend("Roster"))
+        edited.update_cells([[1, 1, "Pending"], [1, 2, 4]])
+        edited.append_row(["c@berkeley.edu", "Auto Approved", 1], value_input_option="USER_ENTERED")
+
+        session = WriteSession()
+        session.add_changes(sheet=sheet, edited=edited)
+        assert [record.write_queue for record in session.records] == [
+            {"approval_status": "Pending", "hw1": 4},
+            {"email": "c@berkeley.edu", "approval_status": "Auto Approved", "hw1": 1},
+        ]
+
+        session.commit()
+        assert remote.export_tab("Roster") == local.export_tab("Roster")
+
+    def test_commit(self):
+        backend = SqliteSpreadsheetBackend()
+        backend.import_tab("Roster", ROSTER)
+        sheet = Sheet(backend=backend.get_sheet_backend("Roster"))
+        calls = record_calls(sheet.backend, ["update_ranges", "append_rows"])
+
+        a, b, c, d = StudentRecord.from_emails(
+            ["a@berkeley.edu", "b@berkeley.edu", "c@berkeley.edu", "d@berkeley.edu"], sheet_records=sheet
+        )
+        a.queue_write_back(col_key="hw1", col_value=3)
+        b.queue_write_back(col_key="approval_status", col_value="Pending")
+        c.queue_write_back(col_key="hw1", col_value=1)
+        session = WriteSession()
+        for record in [a, b, c, d, a]:
+            session.add(record)
+        session.commit()
+
+        # Existing rows go out in one update, and new rows in one append.
+        assert calls == ["update_ranges", "append_rows"]
+        assert backend.export_tab("Roster")[1:] == [
+            ["a@berkeley.edu", "Approved", "3"],
+            ["b@berkeley.edu", "Pending", ""],
+            ["c@berkeley.edu", "", "1"],
+            ["d@berkeley.edu", "", ""],
+        ]
+        assert [record.table_index for record in [a, b, c, d]] == [0, 1, 2, 3]
+        assert all(record.write_queue == {} for record in [a, b, c, d])
+        assert c.table_record["hw1"] == 1 and b.approval_status() == "Pending"
+
+    def test_commit_update_only(self):
+        backend = SqliteSpreadsheetBackend()
+        backend.import_tab("Roster", ROSTER)
+        sheet = Sheet(backend=backend.get_sheet_backend("Roster"))
+        calls = record_calls(sheet.backend, ["get_column", "update_ranges"])
+
+        (a,) = StudentRecord.from_emails(["a@berkeley.edu"], sheet_records=sheet)
+        a.queue_write_back(col_key="hw1", col_value=3)
+        a.flush()
+
+        # Without appends, there's nothing to de-duplicate afterwards.
+        assert calls == ["get_column", "update_ranges"]
+
+    def test_commit_after_concurrent_write(self):
+        backend = SqliteSpreadsheetBackend()
+        backend.import_tab("Roster", ROSTER)
+        sheet = Sheet(backend=backend.get_sheet_backend("Roster"))
+        b, c = StudentRecord.from_emails(["b@berkeley.edu", "c@berkeley.edu"], sheet_records=sheet)
+        b.queue_write_back(col_key="hw1", col_value=4)
+        c.queue_write_back(col_key="hw1", col_value=1)
+
+        # Between our load and commit, another submission removes a's row and adds one for c.
+        other = Sheet(backend=backend.get_sheet_backend("Roster"))
+        other.delete_row(0)
+        other.append_row(["c@berkeley.edu", "Pending", ""], value_input_option="USER_ENTERED")
+
+        session = WriteSession()
+        session.add(b)
+        session.add(c)
+        session.commit()
+
+        # b's write follows its row up, and c's row is updated rather than appended again.
+        assert backend.export_tab("Roster")[1:] == [["b@berkeley.edu", "", "4"], ["c@berkeley.edu", "Pending", "1"]]
+        assert (b.table_index, c.table_index) == (0, 1)
+
+    def test_concurrent_appends_are_folded(self):
+        backend = SqliteSpreadsheetBackend()
+        backend.import_tab("Roster", ROSTER)
+        first = Sheet(backend=backend.get_sheet_backend("Roster"))
+        second = Sheet(backend=backend.get_sheet_backend("Roster"))
+        ours = StudentRecord.from_email("c@berkeley.edu", sheet_records=first)
+        ours.queue_write_back(col_key="hw1", col_value=1)
+        theirs = StudentRecord.from_email("c@berkeley.edu", sheet_records=second)
+        theirs.queue_write_back(col_key="approval_status", col_value="Pending")
+
+        # The other session appends c after we've checked the roster for it, but before our own append.
+        append_rows = second.backend.append_rows
+
+        def racing_append_rows(*args, **kwargs):
+            first_session = WriteSession()
+            first_session.add(ours)
+            first_session.commit()
+            return append_rows(*args, **kwargs)
+
+        second.backend.append_rows = racing_append_rows
+        session = WriteSession()
+        session.add(theirs)
+        session.commit()
+
+        # The earliest row wins; the later copy is merged into it, and left blank (but in place) for staff to delete.
+        assert backend.export_tab("Roster")[1:] == [
+            ["a@berkeley.edu", "Approved", "2"],
+            ["b@berkeley.edu", "", ""],
+            ["c@berkeley.edu", "Pending", "1"],
+            ["DUPLICATE: c@berkeley.edu", "", ""],
+        ]
+        assert theirs.table_index == 2 and theirs.approval_status() == "Pending"
+
+
+class TestStudentRecord:
+    def test_get_requests(self):
+        assignments = AssignmentList(
+            sheet=Sheet(
+                values=[
+                    ["name", "id", "due_date", "partner", "gradescope"],
+                    ["Homework 1", "hw1", "", "No", ""],
+                    ["Project 1", "proj1", "", "Yes", ""],
+                ],
+            )
+        )
+        assert assignments.from_name("Project 1") is assignments.from_id("proj1")
+        assert assignments.get_all_ids() == ["hw1", "proj1"]
+
+        sheet = Sheet(values=[["proj1", "email", "hw1"], ["", "a@berkeley.edu", "2"]])
+        record = StudentRecord.from_email("a@berkeley.edu", sheet_records=sheet)
+        assert [(a.get_id(), days) for a, days in record.get_requests(assignments)] == [("hw1", 2), ("proj1", None)]
+        assert record.count_requests(assignments) == 1
+
+        # Records that aren't on the roster yet are read by name.
+        new_record = StudentRecord.from_email("b@berkeley.edu", sheet_records=sheet)
+        assert new_record.count_requests(assignments) == 0
@@ -0,0 +1,75 @@
+import json
+
+from src.replay import Replay, diff_rosters, load_submissions
+
+QUESTIONS = {
+    "Email Address": "email",
+    "DSP?": "is_dsp",
+    "Which assignments?": "assignments",
+    "How many days?": "days",
+    "Why?": "reason",
+    "Partner?": "has_partner",
+}
+
+SNAPSHOT = {
+    "Environment Variables": [
+        ["key", "value"],
+        ["SPREADSHEET_URL", "sqlite://replay"],
+        ["SLACK_ENDPOINT", "https://hooks.slack.com/services/example"],
+        ["AUTO_APPROVE_THRESHOLD", "3"],
+        ["AUTO_APPROVE_THRESHOLD_DSP", "7"],
+        ["AUTO_APPROVE_ASSIGNMENT_THRESHOLD", "3"],
+        ["EMAIL_FROM", "cs161@berkeley.edu"],
+        ["EMAIL_REPLY_TO", "cs161@berkeley.edu"],
+        ["EMAIL_SUBJECT", "Extension Request"],
+        ["EMAIL_SIGNATURE", "CS 161 Staff"],
+    ],
+    "Assignments": [["name", "id", "due_date", "partner", "gradescope"], ["Homework 1", "hw1", "2030-01-01", "No", ""]],
+    "Form Questions": [["question", "key"]] + [[question, key] for question, key in QUESTIONS.items()],
+    "Roster": [
+        ["email", "is_dsp", "approval_status", "email_status", "last_run_output", "last_run_timestamp", "hw1"],
+        ["a@berkeley.edu", "", "", "", "", "", ""],
+    ],
+}
+
+
+def get_form_data(email: str, days: int, timestamp: str):
+    answers = [email, "No", "Homework 1", days, "Sick.", "No"]
+    form_data = {question: [answer] for question, answer in zip(QUESTIONS, answers)}
+    form_data["Timestamp"] = [timestamp]
+    return form_data
+
+
+def write_inputs(tmp_path):
+    with open(tmp_path / "snapshot.json", "w") as f:
+        json.dump(SNAPSHOT, f)
+    with open(tmp_path / "submissions.jsonl", "w") as f:
+        f.write(json.dumps({"form_data": get_form_data("b@berkeley.edu", 5, "2022-01-02T00:00:00Z")}) + "\n")
+        f.write(json.dumps(get_form_data("a@berkeley.edu", 2, "2022-01-01T00:00:00Z")) + "\n\n")
+
+
+class TestReplay:
+    def test_replay(self, tmp_path):
+        write_inputs(tmp_path)
+        submissions = load_submissions(str(tmp_path / "submissions.jsonl"))
+
+        report = Replay(str(tmp_path / "snapshot.json")).run(submissions)
+        assert report.submissions == 2
+        assert dict(report.outcomes) == {"approved": 1, "manual": 1}
+        assert {"email": "a@berkeley.edu", "column": "hw1", "before": "", "after": "2"} in report.changes
+        assert {"email": "b@berkeley.edu", "column": "approval_status", "before": "", "after": "Pending"} in (
+            report.changes
+        )
+
+        # What would a higher threshold have done?
+        report = Replay(str(tmp_path / "snapshot.json"), overrides={"AUTO_APPROVE_THRESHOLD": "5"}).run(submissions)
+        assert dict(report.outcomes) == {"approved": 2}
+
+    def test_diff_rosters(self):
+        before = [["email", "hw1"], ["a@berkeley.edu", "1"]]
+        after = [["email", "hw1", "proj1"], ["a@berkeley.edu", "2", ""], ["b@berkeley.edu", "", "3"]]
+        assert diff_rosters(before, after) == [
+            {"email": "a@berkeley.edu", "column": "hw1", "before": "1", "after": "2"},
+            {"email": "b@berkeley.edu", "column": "email", "before": "", "after": "b@berkeley.edu"},
+            {"email": "b@berkeley.edu", "column": "proj1", "before": "", "after": "3"},
+        ]
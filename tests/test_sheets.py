@@ -0,0 +1,110 @@
+import gspread
+import pytest
+
+from src.backends import ClientPool
+from src.errors import SheetError
+from src.sheets import BaseSpreadsheet, Sheet, coalesce_cells, coalesce_rows
+from src.sqlite_backend import SQLITE_REGISTRY, SqliteSpreadsheetBackend
+
+URL = "https://docs.google.com/spreadsheets/d/example/edit"
+
+
+class FakeAuth:
+    def __init__(self) -> None:
+        self.valid = False
+        self.refreshes = 0
+
+    def refresh(self, request) -> None:
+        self.valid = True
+        self.refreshes += 1
+
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.auth = FakeAuth()
+        self.opened = []
+
+    def open_by_url(self, url):
+        self.opened.append(url)
+        return object()
+
+
+class TestSheets:
+    def test_get_record_by_id(self):
+        sheet = Sheet(sheet=None, values=[["email", "days"], ["A@berkeley.edu", "1"], ["a@berkeley.edu", "2"]])
+        assert sheet.get_record_by_id(id_column="email", id_value="a@BERKELEY.edu") == (
+            0,
+            {"email": "A@berkeley.edu", "days": 1},
+        )
+        assert sheet.get_record_by_id(id_column="email", id_value="b@berkeley.edu") is None
+
+    def test_get_records_by_ids(self):
+        sheet = Sheet(sheet=None, values=[["email", "days"], ["a@berkeley.edu", "1"], ["b@berkeley.edu", "2"]])
+        results = sheet.get_records_by_ids(id_column="email", id_values=["b@berkeley.edu", "c@berkeley.edu"])
+        assert results["b@berkeley.edu"][0] == 1
+        assert results["c@berkeley.edu"] is None
+
+    def test_coalesce_cells_row_runs(self):
+        cells = [[0, 1, "b"], [0, 0, "a"], [0, 3, "d"]]
+        assert coalesce_cells(cells) == [(0, 0, [["a", "b"]]), (0, 3, [["d"]])]
+
+    def test_coalesce_cells_stacks_rows(self):
+        cells = [[4, 2, "x1"], [4, 3, "y1"], [5, 2, "x2"], [5, 3, "y2"], [7, 2, "x3"], [7, 3, "y3"]]
+        assert coalesce_cells(cells) == [(4, 2, [["x1", "y1"], ["x2", "y2"]]), (7, 2, [["x3", "y3"]])]
+
+    def test_coalesce_cells_last_write_wins(self):
+        assert coalesce_cells([[0, 0, "old"], [0, 0, "new"]]) == [(0, 0, [["new"]])]
+
+    def test_coalesce_rows(self):
+        assert coalesce_rows([7, 3, 4, 5, 4, 9]) == [(3, 5), (7, 7), (9, 9)]
+        assert coalesce_rows([]) == []
+
+
+class TestClientPool:
+    def test_missing_service_account(self, tmp_path):
+        with pytest.raises(SheetError):
+            ClientPool(service_account_path=str(tmp_path / "missing.json")).get_client()
+
+    def test_reuses_client_and_spreadsheets(self, monkeypatch, tmp_path):
+        path = tmp_path / "service-account.json"
+        path.write_text("{}")
+        clients = []
+        monkeypatch.setattr(gspread, "service_account", lambda path: clients.append(FakeClient()) or clients[-1])
+
+        pool = ClientPool(service_account_path=str(path))
+        client = pool.get_client()
+        assert pool.get_client() is client and len(clients) == 1
+        assert client.auth.refreshes == 1
+
+        spreadsheet = pool.open(URL)
+        assert pool.open(URL) is spreadsheet
+        assert client.opened == [URL]
+
+        # Expired tokens are refreshed before use, and forgotten spreadsheets are re-opened.
+        client.auth.valid = False
+        pool.forget(URL)
+        assert pool.open(URL) is not spreadsheet
+        assert client.auth.refreshes == 2 and client.opened == [URL, URL]
+
+    def test_refresh_cache_revision(self):
+        backend = SqliteSpreadsheetBackend()
+        backend.import_tab("Assignments", [["id"], ["hw1"]])
+        backend.import_tab("Roster", [["email", "hw1"], ["a@berkeley.edu", ""]])
+        SQLITE_REGISTRY.register("sqlite://cache-revision", backend)
+
+        base = BaseSpreadsheet("sqlite://cache-revision")
+        sheets = base.get_sheets(["Assignments", "Roster"])
+        sheets["Roster"].update_cell(0, 1, "2")
+        base.refresh_cache_revision()
+        # Our own writes don't invalidate cached configuration.
+        assert (
+            BaseSpreadsheet("sqlite://cache-revision").get_sheets(["Assignments"])["Assignments"]
+            is sheets["Assignments"]
+        )
+
+        # A staff edit that lands alongside our writes does.
+        sheets["Roster"].update_cell(0, 1, "3")
+        backend.get_sheet_backend("Assignments").update_ranges([(2, 1, [["hw2"]])])
+        base.refresh_cache_revision()
+        assignments = BaseSpreadsheet("sqlite://cache-revision").get_sheets(["Assignments"])["Assignments"]
+        assert assignments.get_all_records() == [{"id": "hw2"}]
@@ -0,0 +1,84 @@
+import pytest
+
+import main
+from src.errors import ConfigurationError
+from src.sheets import BaseSpreadsheet, Sheet
+from src.sqlite_backend import SQLITE_REGISTRY, SqliteSpreadsheetBackend
+from tests.MockRequest import MockRequest
+
+ROSTER = [["email", "approval_status", "hw1"], ["a@berkeley.edu", "Approved", "2"], ["b@berkeley.edu", "Pending", ""]]
+
+
+def get_roster() -> Sheet:
+    backend = SqliteSpreadsheetBackend()
+    backend.import_tab("Roster", ROSTER)
+    return Sheet(backend=backend.get_sheet_backend("Roster"))
+
+
+class TestSqliteBackend:
+    def test_import_export_round_trip(self, tmp_path):
+        backend = SqliteSpreadsheetBackend()
+        backend.import_tab("Roster", ROSTER)
+        backend.export_snapshot(str(tmp_path / "snapshot.json"))
+
+        copy = SqliteSpreadsheetBackend()
+        copy.load_snapshot(str(tmp_path / "snapshot.json"))
+        assert copy.get_titles() == ["Roster"]
+        assert copy.export_tab("Roster") == ROSTER
+
+    def test_update_append_delete(self):
+        roster = get_roster()
+        roster.update_cells([[1, 1, "Approved"], [1, 2, 3]])
+        assert roster.append_rows([["c@berkeley.edu", "Pending", ""]], value_input_option="USER_ENTERED") == [2]
+        roster.delete_row(0)
+
+        assert roster.backend.get_all_values() == [
+            ["email", "approval_status", "hw1"],
+            ["b@berkeley.edu", "Approved", "3"],
+            ["c@berkeley.edu", "Pending", ""],
+        ]
+        assert roster.fetch_column("email") == ["b@berkeley.edu", "c@berkeley.edu"]
+
+    def test_find_rows(self):
+        roster = get_roster()
+        assert roster.backend.find_rows("email", "B@Berkeley.edu") == [3]
+        assert roster.backend.find_rows("approval_status", "Pending") == [3]
+        assert roster.backend.find_rows("missing", "x") == []
+
+    def test_base_spreadsheet_url(self):
+        backend = SqliteSpreadsheetBackend()
+        backend.import_tab("Roster", ROSTER)
+        SQLITE_REGISTRY.register("sqlite://test-course", backend)
+
+        base = BaseSpreadsheet("sqlite://test-course")
+        revision = base.get_revision()
+        base.get_sheets(["Roster"])["Roster"].update_cell(0, 2, "5")
+        assert base.get_sheet("Roster").get_all_records()[0]["hw1"] == 5
+        assert base.get_revision() != revision
+
+    def test_only_registered_urls_open(self, tmp_path):
+        path = tmp_path / "course.sqlite3"
+        with pytest.raises(ConfigurationError):
+            BaseSpreadsheet(f"sqlite://{path}")
+        request = MockRequest({"spreadsheet_url": f"sqlite://{path}", "form_data": {}})
+        assert main.handle_form_submit(request)["success"] is False
+        assert not path.exists()
+
+    def test_get_sheet_rows(self):
+        backend = SqliteSpreadsheetBackend()
+        backend.import_tab("Roster", ROSTER + [["c@berkeley.edu", "Pending", "1"]])
+        SQLITE_REGISTRY.register("sqlite://projected-course", backend)
+
+        roster = BaseSpreadsheet("sqlite://projected-course").get_sheet_rows(
+            "Roster", id_column="email", id_values=["C@berkeley.edu", "d@berkeley.edu"]
+        )
+        assert roster.get_record_by_id(id_column="email", id_value="c@berkeley.edu") == (
+            2,
+            {"email": "c@berkeley.edu", "approval_status": "Pending", "hw1": 1},
+        )
+        assert roster.get_record_by_id(id_column="email", id_value="d@berkeley.edu") is None
+        assert roster.get_all_records()[0]["approval_status"] == ""
+        assert not roster.is_stale("email")
+
+        roster.update_cell(2, 2, "4")
+        assert backend.export_tab("Roster")[3] == ["c@berkeley.edu", "Pending", "4"]
@@ -0,0 +1,55 @@
+import pytest
+
+from src.errors import SheetError
+from src.sheets import Sheet
+from src.sqlite_backend import SqliteSpreadsheetBackend
+from src.table import Table
+
+VALUES = [["email", "days", "notes"], ["a@berkeley.edu", "3", ""], ["b@berkeley.edu", "", "hello"]]
+
+
+class TestTable:
+    def test_rows_behave_like_records(self):
+        table = Table(VALUES)
+        row = table.get_row(0)
+        assert row == {"email": "a@berkeley.edu", "days": 3, "notes": ""}
+        assert row["days"] == 3 and row.get("missing") is None
+        assert "notes" in row and "missing" not in row
+        assert list(row.keys()) == ["email", "days", "notes"]
+
+    def test_empty(self):
+        assert Table([]).get_rows() == []
+        assert Table([["email", "days"]]).get_rows() == []
+
+    def test_writes_go_to_table(self):
+        table = Table(VALUES)
+        table.get_row(1)["days"] = 5
+        assert table.get_rows()[1]["days"] == 5
+        assert table.get_values()[2] == ["b@berkeley.edu", 5, "hello"]
+
+    def test_without_row_moves_existing_views(self):
+        table = Table(VALUES + [["c@berkeley.edu", "1", ""]])
+        first, deleted, last = table.get_rows()
+        smaller = table.without_row(1)
+        assert len(smaller) == 2
+        assert smaller.get_row(1)["email"] == "c@berkeley.edu"
+
+        # Views follow their rows into the new table, so writes through them land there.
+        last["days"] = 4
+        first["notes"] = "hi"
+        assert smaller.get_values()[1:] == [["a@berkeley.edu", "3", "hi"], ["c@berkeley.edu", 4, ""]]
+        assert last.locate() == (smaller, 1)
+
+        # A view of the deleted row has nothing to point at.
+        with pytest.raises(SheetError):
+            deleted["email"]
+
+    def test_sheet_delete_row(self):
+        backend = SqliteSpreadsheetBackend()
+        backend.import_tab("Roster", VALUES + [["c@berkeley.edu", "1", ""]])
+        sheet = Sheet(backend=backend.get_sheet_backend("Roster"))
+        row = sheet.get_all_records()[2]
+        sheet.delete_row(0)
+        row["days"] = 5
+        assert sheet.get_dirty_cells([[1, 1, 5]]) == []
+        assert sheet.get_all_records()[1] == {"email": "c@berkeley.edu", "days": 5, "notes": ""}
@@ -0,0 +1,92 @@
+import pytest
+
+from src.assignments import AssignmentList
+from src.config import PolicyConfig
+from src.email import Email
+from src.errors import ConfigurationError, EmailError
+from src.record import StudentRecord
+from src.sheets import SHEET_EMAIL_TEMPLATES, BaseSpreadsheet, Sheet
+from src.sqlite_backend import SQLITE_REGISTRY, SqliteSpreadsheetBackend
+from src.templates import DEFAULT_EMAIL_TEMPLATES, EmailTemplates
+from tests.test_config import VALUES
+
+ASSIGNMENTS = [
+    ["name", "id", "due_date", "partner", "gradescope"],
+    ["Homework 1", "hw1", "2030-01-03", "No", ""],
+    ["Project 1", "proj1", "", "Yes", ""],
+]
+ROSTER = [["email", "hw1", "proj1", "email_comments"], ["a@berkeley.edu", "2", "1", "Feel <better>!"]]
+
+
+def get_inputs():
+    assignments = AssignmentList(sheet=Sheet(values=ASSIGNMENTS))
+    student = StudentRecord.from_email("a@berkeley.edu", sheet_records=Sheet(values=ROSTER))
+    return student, assignments, PolicyConfig.from_values(VALUES)
+
+
+class TestEmailTemplates:
+    def test_default(self):
+        student, assignments, config = get_inputs()
+        rendered = DEFAULT_EMAIL_TEMPLATES.render(student, assignments, config)
+        assert rendered.subject == config.email_subject
+        assert rendered.html is None
+        assert rendered.body.startswith("Hi,\n\nYou recently requested an extension for an assignment.")
+        assert (
+            "Homework 1 (2 Day Extension)\n"
+            + "Original Deadline: Thursday, January 3\n"
+            + "Extended Deadline: Saturday, January 5\n\n"
+            + "Project 1 (1 Day Extension)\n"
+            + "Original Deadline: TBD\n"
+            + "Extended Deadline: TBD\n\n"
+            + "Additional comments: Feel <better>!\n\n"
+            + "If something doesn't look right"
+        ) in rendered.body
+        assert rendered.body.endswith(
+            config.email_signature
+            + "\n\nDisclaimer: This is an auto-generated email. "
+            + "We may follow up with you in this thread, and feel free to reply to this thread if you'd like to "
+            + "follow up with us!"
+        )
+
+    def test_custom(self):
+        student, assignments, config = get_inputs()
+        templates = EmailTemplates.from_records(
+            [
+                {"key": "subject", "value": "{{ subject }}: {{ requests | length }} extensions"},
+                {
+                    "key": "html",
+                    "value": "<ul>{% for r in requests %}<li>{{ r.name }}</li>{% endfor %}</ul>{{ comments }}",
+                },
+                {"key": "", "value": ""},
+            ]
+        )
+        email = Email.from_student_record(student, assignments, config, templates=templates)
+        assert email.subject == f"{config.email_subject}: 2 extensions"
+        assert email.body == DEFAULT_EMAIL_TEMPLATES.render(student, assignments, config).body
+        assert email.html_body == "<ul><li>Homework 1</li><li>Project 1</li></ul>Feel &lt;better&gt;!"
+
+    def test_errors(self):
+        with pytest.raises(ConfigurationError):
+            EmailTemplates.from_records([{"key": "body", "value": "{% for request in requests %}"}])
+        with pytest.raises(ConfigurationError):
+            EmailTemplates.from_records([{"key": "footer", "value": "Hi"}])
+
+        student, assignments, config = get_inputs()
+        templates = EmailTemplates.from_records([{"key": "body", "value": "{{ student_name }}"}])
+        emails, errors = Email.from_student_records([student], assignments, config, templates=templates)
+        assert emails == []
+        assert [(record, type(err)) for record, err in errors] == [(student, EmailError)]
+
+    def test_optional_sheet(self):
+        backend = SqliteSpreadsheetBackend()
+        backend.import_tab("Assignments", ASSIGNMENTS)
+        SQLITE_REGISTRY.register("sqlite://templates", backend)
+        base = BaseSpreadsheet("sqlite://templates")
+
+        sheets = base.get_sheets(["Assignments"], optional=[SHEET_EMAIL_TEMPLATES])
+        assert EmailTemplates.from_sheet(sheets[SHEET_EMAIL_TEMPLATES]).html is None
+
+        backend.import_tab(SHEET_EMAIL_TEMPLATES, [["key", "value"], ["html", "<p>Hi</p>"]])
+        sheet = base.get_sheets(["Assignments"], optional=[SHEET_EMAIL_TEMPLATES])[SHEET_EMAIL_TEMPLATES]
+        assert EmailTemplates.from_sheet(sheet) is EmailTemplates.from_sheet(sheet)
+        assert EmailTemplates.from_sheet(sheet).html.render() == "<p>Hi</p>"
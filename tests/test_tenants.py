@@ -0,0 +1,69 @@
+from threading import Thread
+
+from src.errors import TenantBusyError
+from src.tenants import TenantRegistry
+
+URL = "sqlite://:memory:"
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTenantRegistry:
+    def test_tenants_have_separate_caches(self):
+        registry = TenantRegistry()
+        registry.get("sqlite://a").cache.put("sqlite://a", "Assignments", "1", "a")
+        assert registry.get("sqlite://a").cache.get("sqlite://a", "Assignments", "1") == "a"
+        assert registry.get("sqlite://b").cache.get("sqlite://a", "Assignments", "1") is None
+
+    def test_idle_tenants_are_evicted(self):
+        clock = Clock()
+        registry = TenantRegistry(idle_seconds=60, clock=clock)
+        tenant = registry.get(URL)
+        clock.now = 30
+        assert registry.get(URL) is tenant
+        clock.now = 100
+        assert registry.get(URL) is not tenant
+
+    def test_least_recently_used_tenant_is_evicted(self):
+        clock = Clock()
+        registry = TenantRegistry(max_entries=2, clock=clock)
+        for i, url in enumerate(["sqlite://a", "sqlite://b", "sqlite://a", "sqlite://c"]):
+            clock.now = i
+            registry.get(url)
+        assert sorted(registry.tenants) == ["sqlite://a", "sqlite://c"]
+
+    def test_active_tenants_are_not_evicted(self):
+        clock = Clock()
+        registry = TenantRegistry(idle_seconds=60, clock=clock)
+        with registry.enter(URL) as tenant:
+            clock.now = 100
+            assert registry.get(URL) is tenant
+
+    def test_concurrency_limit(self):
+        registry = TenantRegistry(max_concurrent_requests=1, queue_timeout=0.01)
+        with registry.enter(URL):
+            errors = []
+
+            def enter():
+                try:
+                    with registry.enter(URL):
+                        pass
+                except TenantBusyError as err:
+                    errors.append(err)
+
+            thread = Thread(target=enter)
+            thread.start()
+            thread.join()
+            assert len(errors) == 1
+
+            # Other courses aren't affected.
+            with registry.enter("sqlite://other"):
+                pass
+        with registry.enter(URL):
+            pass
@@ -0,0 +1,102 @@
+from email import message_from_string
+from smtplib import SMTPRecipientsRefused
+
+import pytest
+
+from src.benchmark_email import run
+from src.config import ENV_APP_MASTER_SECRET, PolicyConfig
+from src.email import Email
+from src.errors import ConfigurationError
+from src.smtp_server import LocalSmtpServer
+from src.transport import SMTP_POOL, RpcTransport, SmtpPool, SpoolTransport, TransportRegistry, get_transport
+from tests.test_config import VALUES
+
+
+def get_email(**kwargs):
+    return Email(
+        to_email="a@berkeley.edu",
+        from_email="CS 161 Staff",
+        reply_to_email="cs161@berkeley.edu",
+        cc_emails=["ta@berkeley.edu"],
+        subject="Extension Request",
+        body="Hi!",
+        **kwargs,
+    )
+
+
+class TestTransports:
+    def test_smtp(self):
+        with LocalSmtpServer(refused=["refused@berkeley.edu"]) as server:
+            pool = SmtpPool(host=server.host, port=server.port, username=None, password=None, use_ssl=False)
+            get_email(html_body="<p>Hi!</p>").send(connection=pool)
+            with pytest.raises(SMTPRecipientsRefused):
+                pool.sendmail("staff@berkeley.edu", ["refused@berkeley.edu"], "Hi")
+            pool.sendmail("staff@berkeley.edu", ["b@berkeley.edu"], "..Hi")
+            pool.close()
+
+            assert [recipients for _, recipients, _ in server.messages] == [
+                ["a@berkeley.edu", "ta@berkeley.edu"],
+                ["b@berkeley.edu"],
+            ]
+            message = message_from_string(server.messages[0][2])
+            assert message["To"] == "a@berkeley.edu"
+            assert [part.get_content_type() for part in message.walk()][1:] == ["text/plain", "text/html"]
+            assert server.messages[1][2].rstrip() == "..Hi"
+
+    def test_spool(self, tmp_path):
+        spool = SpoolTransport(directory=str(tmp_path))
+        get_email().send(connection=spool)
+        paths = spool.get_messages()
+        assert len(paths) == 1
+        with open(paths[0]) as f:
+            message = message_from_string(f.read())
+        assert message["X-Envelope-To"] == "a@berkeley.edu, ta@berkeley.edu"
+        assert message["Subject"] == "Extension Request"
+
+    def test_rpc(self, monkeypatch):
+        calls = []
+        rpc = RpcTransport(send=lambda **kwargs: calls.append(kwargs))
+        monkeypatch.setenv(ENV_APP_MASTER_SECRET, "secret")
+        get_email(html_body="<p>Hi!</p>").send(connection=rpc)
+        assert calls == [
+            {
+                "sender": "CS 161 Staff",
+                "target": "a@berkeley.edu",
+                "targets": ["ta@berkeley.edu"],
+                "subject": "Extension Request",
+                "body": "Hi!",
+                "_impersonate": "mail",
+                "extra_headers": [("Reply-To", "cs161@berkeley.edu"), ("Cc", "ta@berkeley.edu")],
+            }
+        ]
+
+    def test_get_transport(self, tmp_path):
+        assert get_transport(PolicyConfig.from_values(VALUES)) is SMTP_POOL
+
+        config = PolicyConfig.from_values({**VALUES, "EMAIL_TRANSPORT": "Spool", "EMAIL_SPOOL_DIR": str(tmp_path)})
+        transport = get_transport(config)
+        assert isinstance(transport, SpoolTransport) and transport.directory == str(tmp_path)
+        assert get_transport(config) is transport
+
+        config = PolicyConfig.from_values({**VALUES, "SMTP_HOST": "127.0.0.1", "SMTP_PORT": "2525", "SMTP_SSL": "No"})
+        transport = get_transport(config)
+        assert isinstance(transport, SmtpPool) and (transport.port, transport.use_ssl) == (2525, False)
+
+        with pytest.raises(ConfigurationError):
+            PolicyConfig.from_values({**VALUES, "EMAIL_TRANSPORT": "carrier pigeon"})
+
+    def test_password_change(self):
+        registry = TransportRegistry()
+        values = {**VALUES, "SMTP_HOST": "127.0.0.1", "SMTP_USERNAME": "staff", "SMTP_PASSWORD": "old"}
+        old = registry.get(PolicyConfig.from_values(values))
+        assert registry.get(PolicyConfig.from_values(values)) is old
+
+        # A new password gets a new pool, and the old one is dropped.
+        new = registry.get(PolicyConfig.from_values({**values, "SMTP_PASSWORD": "new"}))
+        assert new is not old and new.password == "new"
+        assert list(registry.transports.values()) == [new]
+        assert all("new" not in key and "old" not in key for key in registry.transports)
+
+    def test_benchmark(self):
+        for transport in ["smtp", "spool"]:
+            assert run(transport, students=5)["sent"] == 5
@@ -0,0 +1,19 @@
+from dateutil import parser
+
+from src.utils import PST, cast_date, parse_timestamp
+
+
+class TestDates:
+    def test_cast_date_matches_dateutil(self):
+        for cell in ["2022-01-27", "1/27/2022", "01/05/2022", "27/01/2022", "January 27, 2022", "2022-01-27 10:00 AM"]:
+            for deadline in [True, False]:
+                suffix = " 11:59 PM" if deadline else ""
+                assert cast_date(cell, deadline=deadline) == PST.localize(parser.parse(cell + suffix))
+
+    def test_cast_date_optional(self):
+        assert cast_date("", optional=True) is None
+        assert cast_date(" 2022-01-27 ", deadline=False).hour == 0
+
+    def test_parse_timestamp_matches_dateutil(self):
+        for value in ["2021-05-28T23:19:02.074Z", "2022-01-27T20:46:42+00:00", "1/27/2022 12:10:00", "2022-01-27"]:
+            assert parse_timestamp(value) == parser.parse(value)